@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { Bell, ChevronDown, User, LogOut, Settings, UserCircle, Menu } from 'lucide-react';
 import { useNavigate } from 'react-router-dom';
 import logo2 from '../assets/iSTOKVEL2.png';
+import { connectNotifications } from '../utils/socket';
 
 interface Notification {
   id: number;
@@ -44,7 +45,13 @@ const AdminNavbar: React.FC<AdminNavbarProps> = ({ onToggleSidebar }) => {
         if (res.ok) {
           const data = await res.json();
           setNotifications(data);
-          setUnreadCount(data.filter((n: any) => !n.is_read).length);
+        }
+        // The feed is paged, so take the badge from the stored counter
+        const countRes = await fetch('/api/user/notifications/unread-count', {
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (countRes.ok) {
+          setUnreadCount((await countRes.json()).unread_count);
         }
       } catch (err) {
         console.error('Failed to fetch notifications:', err);
@@ -52,10 +59,23 @@ const AdminNavbar: React.FC<AdminNavbarProps> = ({ onToggleSidebar }) => {
     };
 
     fetchNotifications();
-    
-    // Refresh notifications every 30 seconds
-    const interval = setInterval(fetchNotifications, 30000);
-    return () => clearInterval(interval);
+
+    // Live updates instead of polling; refetch after a reconnect to catch up
+    const token = localStorage.getItem('token');
+    if (!token) return;
+    const socket = connectNotifications(token);
+    let connectedBefore = false;
+    socket.on('connect', () => {
+      if (connectedBefore) fetchNotifications();
+      connectedBefore = true;
+    });
+    socket.on('notification', (notification: Notification) => {
+      setNotifications(prev => prev.some(n => n.id === notification.id) ? prev : [notification, ...prev]);
+      if (!notification.is_read) setUnreadCount(prev => prev + 1);
+    });
+    return () => {
+      socket.disconnect();
+    };
   }, []);
 
   // Handle click outside to close dropdowns
@@ -14,6 +14,7 @@ import {
 import ProfileDropdown from './ProfileDropdown';
 import { useAuth } from '../hooks/useAuth';
 import notificationSound from '../assets/notification.mp3';
+import { connectNotifications } from '../utils/socket';
 import logo2 from '../assets/iSTOKVEL2.png';
 
 interface Notification {
@@ -50,6 +51,7 @@ const DashboardLayout = () => {
   
   // Notification state
   const [notifications, setNotifications] = useState<Notification[]>([]);
+  const [unreadCount, setUnreadCount] = useState(0);
   const prevNotificationIds = useRef<Set<number>>(new Set());
   const soundPlayedThisSession = useRef(false); // <-- NEW
   const [isNotificationsOpen, setIsNotificationsOpen] = useState(false);
@@ -94,22 +96,63 @@ const DashboardLayout = () => {
         prevNotificationIds.current = newIds;
         setNotifications(newNotifications);
       }
+      // The feed is paged, so take the badge from the stored counter
+      const countRes = await fetch('/api/user/notifications/unread-count', {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      if (countRes.ok) {
+        setUnreadCount((await countRes.json()).unread_count);
+      }
     } catch (err) {
       console.error('Failed to fetch notifications:', err);
     }
   };
 
-  // Use it in useEffect
+  const playSound = () => {
+    const audio = new Audio(notificationSound);
+    audio.volume = 0.5;
+    audio.play();
+  };
+
+  // Merge notifications pushed over the socket (or fetched after a reconnect)
+  const addNotifications = (incoming: Notification[]) => {
+    const fresh = incoming.filter(n => !prevNotificationIds.current.has(n.id));
+    if (!fresh.length) return;
+    fresh.forEach(n => prevNotificationIds.current.add(n.id));
+    setNotifications(prev => [...fresh.sort((a, b) => b.id - a.id), ...prev]);
+    setUnreadCount(prev => prev + fresh.filter(n => !n.is_read).length);
+    playSound();
+  };
+
+  // Initial load, then live updates instead of polling
   useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token) return;
     fetchNotifications();
-    const interval = setInterval(fetchNotifications, 30000);
-    return () => clearInterval(interval);
+
+    const socket = connectNotifications(token);
+    let connectedBefore = false;
+    socket.on('connect', async () => {
+      // After a reconnect, fetch whatever was created while we were away
+      if (connectedBefore && prevNotificationIds.current.size) {
+        const sinceId = Math.max(...prevNotificationIds.current);
+        const res = await fetch(`/api/user/notifications?since_id=${sinceId}`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (res.ok) addNotifications(await res.json());
+      }
+      connectedBefore = true;
+    });
+    socket.on('notification', (notification: Notification) => addNotifications([notification]));
+    return () => {
+      socket.disconnect();
+    };
   }, []);
 
   // Mark as read/unread
   const markAsRead = async (id: number) => {
     const token = localStorage.getItem('token');
-    await fetch('/api/user/notifications/mark-as-read', {
+    const res = await fetch('/api/user/notifications/mark-as-read', {
       method: 'POST',
       headers: {
         'Authorization': `Bearer ${token}`,
@@ -117,6 +160,7 @@ const DashboardLayout = () => {
       },
       body: JSON.stringify({ notification_ids: [id] })
     });
+    if (res.ok) setUnreadCount((await res.json()).unread_count);
     setNotifications(prev =>
       prev.map(n => n.id === id ? { ...n, is_read: true } : n)
     );
@@ -188,9 +232,9 @@ const DashboardLayout = () => {
               onClick={() => setIsNotificationsOpen(!isNotificationsOpen)}
             >
               <Bell className="h-6 w-6" />
-              {unreadNotifications.length > 0 && (
+              {unreadCount > 0 && (
                 <span className="absolute -top-2 -right-2 bg-red-600 text-white rounded-full text-xs px-2 py-0.5 font-bold">
-                  {unreadNotifications.length}
+                  {unreadCount}
                 </span>
               )}
             </button>
@@ -201,7 +245,7 @@ const DashboardLayout = () => {
                     className={`flex-1 py-2 font-semibold ${tab === 'unread' ? 'text-indigo-600 border-b-2 border-indigo-600' : 'text-gray-500'}`}
                     onClick={() => setTab('unread')}
                   >
-                    Unread ({unreadNotifications.length})
+                    Unread ({unreadCount})
                   </button>
                   <button
                     className={`flex-1 py-2 font-semibold ${tab === 'read' ? 'text-indigo-600 border-b-2 border-indigo-600' : 'text-gray-500'}`}
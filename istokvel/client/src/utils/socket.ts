@@ -1,3 +1,10 @@
-import { io } from 'socket.io-client';
-const socket = io('http://localhost:5001'); // Use your backend URL if different
-export default socket;
+import { io, Socket } from 'socket.io-client';
+
+// Authenticated connection to the backend's notification push channel.
+// The server puts the socket in the user's room and emits 'notification'
+// events as they are created.
+export const connectNotifications = (token: string): Socket =>
+  io(import.meta.env.VITE_API_URL, {
+    auth: { token },
+    transports: ['websocket', 'polling'],
+  });
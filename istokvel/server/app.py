@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, Response, make_response, send_file, Blueprint, send_from_directory
+from flask import Flask, request, jsonify, Response, send_file, Blueprint, send_from_directory, g, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS, cross_origin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -24,11 +24,14 @@ from flask_mail import Mail, Message
 import random
 import requests
 import logging
-import string
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import atexit
 import time
 from iStokvel.utils.email_utils import send_verification_email
+from iStokvel.utils.document_checks import ANALYSIS_VERSION, AnalysisFailure, analyze_documents, check_document, file_digest
+from iStokvel.utils.identifiers import FeistelPermutation, ReferenceGenerator, luhn_check_digit, luhn_valid, to_base36
 from flask_migrate import Migrate
-from twilio.rest import Client
 import phonenumbers
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import HTTPException
@@ -36,19 +39,18 @@ from sqlalchemy import event
 from sqlalchemy.engine import Engine
 from jwt import ExpiredSignatureError, InvalidTokenError
 import uuid
-from sklearn.ensemble import RandomForestClassifier
-import joblib
-import pandas as pd
-from PyPDF2 import PdfReader
 import re
 import secrets
 import pyotp
-import cv2
-import numpy as np
-import openai
+import importlib
+import hashlib
+import threading
+from collections import OrderedDict
+import subprocess
+import sys
 import jwt as pyjwt
-from sqlalchemy import select
-from flask_socketio import SocketIO, emit
+from sqlalchemy import select, update, or_, tuple_, literal_column, values, column, DDL
+from sqlalchemy.orm import selectinload, contains_eager, object_session
 from google.oauth2 import id_token
 from google.auth.transport import requests as grequests
 from sqlalchemy import not_
@@ -100,12 +102,112 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # -------------------- EXTENSIONS --------------------
 db = SQLAlchemy(app)
 mail = Mail(app)
-migrate = Migrate(app, db)
+
+# Postgres-only search columns and indexes (see SEARCH_VECTORS); not mapped on the models
+SEARCH_SCHEMA_OBJECTS = {'search_vector', 'ix_faq_search_vector', 'ix_customer_concern_search_vector'}
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Keep autogenerate from dropping the search columns"""
+    return not (reflected and compare_to is None and name in SEARCH_SCHEMA_OBJECTS)
+
+migrate = Migrate(app, db, include_object=include_object)
 jwt = JWTManager(app)
 
 # -------------------- LOGGING --------------------
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+# Records go through a QueueHandler and are written to stderr by a background
+# QueueListener, so request threads never block on log I/O.
+#   LOG_LEVEL              root level (default INFO)
+#   LOG_LEVELS             per-logger overrides, e.g. "istokvel.auth=DEBUG,werkzeug=WARNING"
+#   LOG_DEBUG_SAMPLE_RATE  fraction of DEBUG records kept on hot-path loggers (default 0.01)
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+DEFAULT_LOG_LEVELS = {'sqlalchemy.engine': 'WARNING', 'werkzeug': 'INFO', 'urllib3': 'WARNING'}
+HOT_PATH_LOGGERS = ('istokvel.auth', 'istokvel.wallet')
+
+class SampledDebugFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records so hot paths can log per request"""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+def parse_log_levels(spec):
+    """Parse "name=LEVEL,name=LEVEL" into a {logger_name: level} dict"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging():
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(log_queue)]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    levels = {**DEFAULT_LOG_LEVELS, **parse_log_levels(os.getenv('LOG_LEVELS'))}
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    sampler = SampledDebugFilter(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 0.01)))
+    for name in HOT_PATH_LOGGERS:
+        logging.getLogger(name).addFilter(sampler)
+    return listener
+
+log_listener = configure_logging()
+logger = logging.getLogger('istokvel')
+auth_logger = logging.getLogger('istokvel.auth')
+wallet_logger = logging.getLogger('istokvel.wallet')
+
+# -------------------- LAZY IMPORTS --------------------
+# The ML, vision, PDF and LLM libraries are only needed by the claims and chat
+# endpoints, so they are imported on first use instead of on every worker boot
+# and every `flask` CLI invocation.
+LAZY_MODULES = ('cv2', 'numpy', 'pandas', 'sklearn', 'joblib', 'PyPDF2', 'openai', 'flask_socketio')
+_lazy_lock = threading.RLock()
+
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with _lazy_lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+pd = LazyModule('pandas')
+joblib = LazyModule('joblib')
+openai = LazyModule('openai')
+
+def lazy_singleton(factory):
+    """Build the object on the first call and hand out the same instance afterwards"""
+    instance = []
+
+    @wraps(factory)
+    def get_instance():
+        if not instance:
+            with _lazy_lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    get_instance.is_loaded = lambda: bool(instance)
+    return get_instance
 
 # -------------------- CORS --------------------
 CORS(app, origins="https://railway-9odz.onrender.com", supports_credentials=True)
@@ -113,35 +215,25 @@ CORS(app, resources={r"/api/*": {"origins": "https://railway-9odz.onrender.com"}
 CORS(app, resources={r"/admin/*": {"origins": "https://railway-9odz.onrender.com"}}, supports_credentials=True)
 
 # -------------------- UTILITY FUNCTIONS --------------------
+class QueryCounter:
+    """Count SQL statements sent by the engine while the block runs"""
+    def __enter__(self):
+        self.count = 0
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, *args):
+        self.count += 1
+        self.statements.append(statement)
+
 def generate_otp():
     """Generate a 6-digit OTP"""
     return ''.join([str(random.randint(0, 9)) for _ in range(6)])
 
-def send_verification_sms(phone_number, otp_code):
-    """Send verification SMS with OTP"""
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-    from_number = os.getenv('TWILIO_PHONE_NUMBER')
-    if not all([account_sid, auth_token, from_number]):
-        print("Twilio credentials are not set in environment variables.")
-        return False, "Twilio credentials missing"
-    try:
-        client = Client(account_sid, auth_token)
-        message = client.messages.create(
-            body=f"Your iStokvel verification code is: {otp_code}",
-            from_=from_number,
-            to=phone_number
-        )
-        print(f"Sent SMS to {phone_number}: {message.sid}")
-        return True, "SMS sent"
-    except Exception as e:
-        print(f"Failed to send SMS: {e}")
-        return False, str(e)
-
-def generate_group_code(length=6):
-    """Generate a random alphanumeric group code."""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
-
 def normalize_phone(phone):
     # Remove spaces, dashes, etc.
     phone = phone.replace(' ', '').replace('-', '')
@@ -150,27 +242,85 @@ def normalize_phone(phone):
         phone = '0' + phone[3:]
     return phone
 
-def generate_account_number():
-    """Generate a unique 10-digit account number"""
-    while True:
-        # Generate exactly 10 digits (1000000000 to 9999999999)
-        account_num = str(random.randint(1000000000, 9999999999))
-        # Check if it's unique
-        if not User.query.filter_by(account_number=account_num).first():
-            return account_num
-
-def get_or_create_wallet(user_id):
-    """Get existing wallet or create new one for user"""
+def get_or_create_wallet(user_id, commit=True):
+    """Get existing wallet or create new one for user (flushed, not committed, when commit is False)"""
     wallet = Wallet.query.filter_by(user_id=user_id).first()
     if not wallet:
         wallet = Wallet(user_id=user_id, balance=0.00)
         db.session.add(wallet)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
     return wallet
 
-def generate_transaction_reference():
-    """Generate unique transaction reference"""
-    return f"TXN{datetime.utcnow().strftime('%Y%m%d%H%M%S')}{random.randint(1000, 9999)}"
+def encode_cursor(row):
+    """Keyset cursor ("<created_at>,<id>") pointing just past row"""
+    return f"{row.created_at.isoformat()},{row.id}"
+
+def keyset_page(query, model, limit, cursor, include_total=False):
+    """Page query newest first by (created_at, id) without OFFSET.
+
+    cursor is '' for the first page or a value from encode_cursor(). Needs an
+    index ending in (created_at, id) after any equality filters to stay flat
+    at any depth. The total is only counted when include_total is set.
+    Raises ValueError for a malformed cursor or a limit below 1.
+    """
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    total = query.order_by(None).count() if include_total else None
+    if cursor:
+        try:
+            created_at, row_id = cursor.rsplit(',', 1)
+            key = (datetime.fromisoformat(created_at), int(row_id))
+        except ValueError:
+            raise ValueError('Invalid cursor')
+        query = query.filter(tuple_(model.created_at, model.id) < key)
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    page = {
+        'items': rows,
+        'next_cursor': encode_cursor(rows[-1]) if has_more else None,
+        'has_more': has_more
+    }
+    if include_total:
+        page['total'] = total
+    return page
+
+def keyset_response(page, key, serialize, limit):
+    """JSON body for a keyset page, listing items under key"""
+    body = {
+        key: [serialize(item) for item in page['items']],
+        'limit': limit,
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more']
+    }
+    if 'total' in page:
+        body['total'] = page['total']
+    return body
+
+def search_tsquery(term, config):
+    """to_tsquery matching every word of term as a prefix, or None if it has no words"""
+    words = re.findall(r'\w+', term.lower())[:10]
+    if not words:
+        return None
+    return func.to_tsquery(config, ' & '.join(f'{word}:*' for word in words))
+
+def text_search(query, model, term, config, columns):
+    """Filter query to rows of model matching term; returns (query, rank or None).
+
+    On Postgres this uses the table's generated search_vector column and its
+    GIN index, and rank is a ts_rank expression to order by. Elsewhere, or
+    for a term with no words, it falls back to ILIKE over columns.
+    """
+    tsquery = search_tsquery(term, config) if db.engine.dialect.name == 'postgresql' else None
+    if tsquery is None:
+        like = f"%{term}%"
+        return query.filter(or_(*(column.ilike(like) for column in columns))), None
+    vector = literal_column(f'{model.__table__.name}.search_vector')
+    return query.filter(vector.op('@@')(tsquery)), func.ts_rank(vector, tsquery)
 
 def validate_test_card(card_number, expiry, cvv):
     """Validate test card details - for development only"""
@@ -199,9 +349,6 @@ def validate_test_card(card_number, expiry, cvv):
 def process_deposit(user_id, amount, card_id, description=""):
     """Process a deposit transaction"""
     try:
-        # Get or create wallet
-        wallet = get_or_create_wallet(user_id)
-        
         # Get card details
         card = Card.query.get(card_id)
         if not card:
@@ -214,30 +361,18 @@ def process_deposit(user_id, amount, card_id, description=""):
         if not payment_successful:
             raise ValueError("Payment processing failed")
         
-        # Create transaction record
-        transaction = Transaction(
-            user_id=user_id,
-            transaction_type='deposit',
-            amount=amount,
-            fee=0.00,  # No fee for deposits
-            net_amount=amount,  # Full amount for deposits
-            status='completed',
-            reference=generate_transaction_reference(),
-            description=description or f"Deposit via {card.card_type.title()} ****{card.card_number_last4}",
-            card_id=card_id,
-            completed_at=datetime.utcnow()
+        # No fee for deposits, so the full amount is credited
+        leg = ledger_leg(
+            user_id, amount, 'deposit', amount,
+            description or f"Deposit via {card.card_type.title()} ****{card.card_number_last4}",
+            card_id=card_id
         )
-        
-        # Update wallet balance
-        wallet.balance += amount
-        
-        db.session.add(transaction)
-        db.session.commit()
+        balances = post_ledger([leg], enforce_limits=True)
         
         return {
             'success': True,
-            'transaction': transaction.to_dict(),
-            'new_balance': float(wallet.balance)
+            'transaction': leg['transaction'].to_dict(),
+            'new_balance': balances[user_id]
         }
     except Exception as e:
         db.session.rollback()
@@ -257,34 +392,84 @@ def process_transfer(sender_id, recipient_account_number, amount, description=""
         raise ValueError("Cannot transfer to yourself")
     # ... rest of logic ...
 
+def limit_counter_amount(transaction):
+    """Amount a completed transaction adds to its user's daily limit counter.
+
+    Deposits count their amount and outgoing transfers their absolute value;
+    incoming transfers don't count towards the receiver's limits.
+    """
+    if transaction.status != 'completed':
+        return None
+    if transaction.transaction_type == 'transfer' and transaction.amount > 0:
+        return None
+    return abs(transaction.amount)
+
+DAILY_LIMITS = {'deposit': 'DAILY_DEPOSIT_LIMIT', 'transfer': 'DAILY_TRANSFER_LIMIT'}
+
+class DailyLimitExceededError(ValueError):
+    pass
+
+def bump_daily_totals(transactions, enforce_limits=False):
+    """Add transactions to the daily limit counters in the current database transaction.
+
+    With enforce_limits the upsert only applies while the new total stays
+    within its DAILY_LIMITS entry, so concurrent postings can't overshoot
+    the limit between check and commit; DailyLimitExceededError otherwise.
+    """
+    totals = {}
+    for transaction in transactions:
+        amount = limit_counter_amount(transaction)
+        if amount is None:
+            continue
+        day = (transaction.completed_at or transaction.created_at or datetime.utcnow()).date()
+        key = (transaction.user_id, day, transaction.transaction_type)
+        total, count = totals.get(key, (0.0, 0))
+        totals[key] = (total + amount, count + 1)
+    if not totals:
+        return
+
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = DailyTransactionTotal.__table__
+    for (user_id, day, transaction_type), (total, count) in totals.items():
+        limit = app.config[DAILY_LIMITS[transaction_type]] \
+            if enforce_limits and transaction_type in DAILY_LIMITS else None
+        stmt = insert(table).values(
+            user_id=user_id, day=day, transaction_type=transaction_type,
+            total=total, count=count, updated_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.day, table.c.transaction_type],
+            set_={
+                'total': table.c.total + stmt.excluded.total,
+                'count': table.c.count + stmt.excluded.count,
+                'updated_at': stmt.excluded.updated_at
+            },
+            # The conflicting row is locked before this is evaluated
+            where=table.c.total + stmt.excluded.total <= limit if limit is not None else None
+        )
+        new_total = db.session.execute(stmt.returning(table.c.total)).scalar_one_or_none()
+        if limit is not None and (new_total is None or new_total > limit):
+            raise DailyLimitExceededError(f"Daily {transaction_type} limit exceeded.")
+
+def get_daily_total(user_id, transaction_type, day=None):
+    """Today's (or day's) running total for a user and transaction type"""
+    row = db.session.get(DailyTransactionTotal, (user_id, day or datetime.utcnow().date(), transaction_type))
+    return row.total if row else 0.0
+
 def check_transaction_limits(user_id, amount, transaction_type):
-    """Check if transaction is within limits"""
-    today = datetime.utcnow().date()
-    
+    """Check if transaction is within limits (post_ledger re-checks the daily limits when posting)"""
     if transaction_type == 'deposit':
-        daily_total = db.session.query(func.sum(Transaction.amount))\
-            .filter(
-                Transaction.user_id == user_id,
-                Transaction.transaction_type == 'deposit',
-                func.date(Transaction.created_at) == today,
-                Transaction.status == 'completed'
-            ).scalar() or 0.0
-        
+        daily_total = get_daily_total(user_id, 'deposit')
         if daily_total + amount > app.config['DAILY_DEPOSIT_LIMIT']:
             raise ValueError(f"Daily deposit limit exceeded. You can deposit R{app.config['DAILY_DEPOSIT_LIMIT'] - daily_total:.2f} more today.")
     
     elif transaction_type == 'transfer':
-        daily_total = db.session.query(func.sum(Transaction.amount))\
-            .filter(
-                Transaction.user_id == user_id,
-                Transaction.transaction_type == 'transfer',
-                func.date(Transaction.created_at) == today,
-                Transaction.status == 'completed',
-                Transaction.amount < 0  # Outgoing transfers
-            ).scalar() or 0.0
-        
-        if abs(daily_total) + amount > app.config['DAILY_TRANSFER_LIMIT']:
-            raise ValueError(f"Daily transfer limit exceeded. You can transfer R{app.config['DAILY_TRANSFER_LIMIT'] - abs(daily_total):.2f} more today.")
+        daily_total = get_daily_total(user_id, 'transfer')
+        if daily_total + amount > app.config['DAILY_TRANSFER_LIMIT']:
+            raise ValueError(f"Daily transfer limit exceeded. You can transfer R{app.config['DAILY_TRANSFER_LIMIT'] - daily_total:.2f} more today.")
     
     # Check amount limits
     if amount < app.config['MIN_TRANSACTION_AMOUNT']:
@@ -350,11 +535,10 @@ def check_email_config():
             missing_vars.append(var)
     
     if missing_vars:
-        print(f"WARNING: Missing email configuration variables: {missing_vars}")
-        print("Email functionality will not work properly!")
+        logger.warning("Missing email configuration variables: %s. Email functionality will not work properly!", missing_vars)
         return False
     
-    print("Email configuration check passed!")
+    logger.info("Email configuration check passed!")
     return True
 
 def audit_log(action, resource_type=None, resource_id=None):
@@ -362,12 +546,10 @@ def audit_log(action, resource_type=None, resource_id=None):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             try:
-                # Get admin info from token
-                token = request.headers.get('Authorization')
-                if token:
-                    token = token.split(' ')[1]
-                    payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-                    admin_id = payload.get('user_id')
+                # Get admin info from the already decoded token
+                auth, _ = authenticate_request()
+                if auth and auth['user_id']:
+                    admin_id = auth['user_id']
                     
                     # Create audit log
                     audit_entry = AdminAuditLog(
@@ -418,10 +600,11 @@ class User(db.Model):
     points = db.Column(db.Integer, default=0)
     valid_referrals = db.Column(db.Integer, default=0)
     account_number = db.Column(db.String(20), unique=True, nullable=True)
+    # Maintained by the Notification listeners and mark_notifications_read(); see reconcile-unread-counts
+    unread_notification_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     sessions = db.relationship('UserSession', backref='user', lazy=True, cascade="all, delete-orphan")
-    _table_args_ = (
-        db.Index('idx_user_email', 'email'),
-        db.Index('idx_user_phone', 'phone'),
+    __table_args__ = (
+        db.Index('ix_user_role_created_at_id', 'role', 'created_at', 'id'),
     )
     
 
@@ -463,7 +646,13 @@ class StokvelGroup(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     group_code = db.Column(db.String(10), unique=True)
     admin_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    # Maintained by the StokvelMember listeners below; see reconcile-member-counts
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    active_member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     members = db.relationship('StokvelMember', backref='group', lazy=True)
+    __table_args__ = (
+        db.Index('ix_stokvel_group_category_tier', 'category', 'tier'),
+    )
 
     def to_dict(self):
         return {
@@ -473,7 +662,8 @@ class StokvelGroup(db.Model):
             'contribution_amount': float(self.contribution_amount or 0),
             'frequency': self.frequency,
             'max_members': self.max_members,
-            'member_count': len(self.members),
+            'member_count': self.member_count or 0,
+            'active_member_count': self.active_member_count or 0,
             'group_code': self.group_code,
             'admin_id': self.admin_id,
             'created_at': self.created_at.isoformat()
@@ -487,6 +677,43 @@ class StokvelMember(db.Model):
     status = db.Column(db.String(50), default='active')  # active, inactive, suspended
     role = db.Column(db.String(20), default='member')  # member, admin
     user = db.relationship('User', backref='memberships')
+    __table_args__ = (
+        db.Index('ix_stokvel_member_user_group', 'user_id', 'group_id'),
+        db.Index('ix_stokvel_member_group_status', 'group_id', 'status'),
+    )
+
+def adjust_member_counts(connection, group_id, members, active):
+    if group_id is None or not (members or active):
+        return
+    connection.execute(
+        update(StokvelGroup.__table__)
+        .where(StokvelGroup.__table__.c.id == group_id)
+        .values(
+            member_count=StokvelGroup.__table__.c.member_count + members,
+            active_member_count=StokvelGroup.__table__.c.active_member_count + active
+        )
+    )
+
+@event.listens_for(StokvelMember, 'after_insert')
+def count_added_member(mapper, connection, target):
+    adjust_member_counts(connection, target.group_id, 1, int(target.status == 'active'))
+
+@event.listens_for(StokvelMember, 'after_delete')
+def count_removed_member(mapper, connection, target):
+    adjust_member_counts(connection, target.group_id, -1, -int(target.status == 'active'))
+
+@event.listens_for(StokvelMember, 'before_update')
+def count_changed_member(mapper, connection, target):
+    state = db.inspect(target)
+    if not (state.attrs.group_id.history.has_changes() or state.attrs.status.history.has_changes()):
+        return
+    # Read the stored row: the old values aren't in history if the attributes were expired
+    table = StokvelMember.__table__
+    old_group, old_status = connection.execute(
+        select(table.c.group_id, table.c.status).where(table.c.id == target.id)
+    ).one()
+    adjust_member_counts(connection, old_group, -1, -int(old_status == 'active'))
+    adjust_member_counts(connection, target.group_id, 1, int(target.status == 'active'))
     
 class MarketTransaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -506,6 +733,9 @@ class Contribution(db.Model):
     date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(50), default='pending')  # pending, confirmed, rejected
     member = db.relationship('StokvelMember', backref='contributions')
+    __table_args__ = (
+        db.Index('ix_contribution_member_date', 'member_id', 'date'),
+    )
 
 class Poll(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -552,6 +782,9 @@ class Wallet(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user = db.relationship('User', backref='wallet')
+    __table_args__ = (
+        db.Index('ix_wallet_user_id', 'user_id'),
+    )
 
 class NotificationSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -610,6 +843,9 @@ class AdminAuditLog(db.Model):
     user_agent = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     admin = db.relationship('User', backref='audit_logs')
+    __table_args__ = (
+        db.Index('ix_admin_audit_log_created_at_id', 'created_at', 'id'),
+    )
 
 
 class FAQ(db.Model):
@@ -663,6 +899,9 @@ class Beneficiary(db.Model):
     # ------------------------
     user = db.relationship('User', backref='beneficiaries')
     status = db.Column(db.String(20), default="No Documents")
+    __table_args__ = (
+        db.Index('ix_beneficiary_user_id', 'user_id'),
+    )
 
 class CustomerConcern(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -673,6 +912,9 @@ class CustomerConcern(db.Model):
     message = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='open')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_customer_concern_created_at_id', 'created_at', 'id'),
+    )
 
     def to_dict(self):
         return {
@@ -686,6 +928,28 @@ class CustomerConcern(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
 
+# Generated tsvector columns behind text_search(). create_all adds them on
+# Postgres; migration a4d8f2c61e95 adds the same columns to existing databases.
+SEARCH_VECTORS = {
+    FAQ.__table__: """
+        setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(answer, '')), 'B')
+    """,
+    # Split emails on @ and . so their parts can be searched as words
+    CustomerConcern.__table__: """
+        setweight(to_tsvector('simple', coalesce(subject, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(name, '')), 'B') ||
+        setweight(to_tsvector('simple', translate(coalesce(email, ''), '@.', '  ')), 'B')
+    """,
+}
+for table, expression in SEARCH_VECTORS.items():
+    event.listen(table, 'after_create', DDL(
+        f"ALTER TABLE {table.name} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({expression}) STORED"
+    ).execute_if(dialect='postgresql'))
+    event.listen(table, 'after_create', DDL(
+        f"CREATE INDEX ix_{table.name}_search_vector ON {table.name} USING gin (search_vector)"
+    ).execute_if(dialect='postgresql'))
+
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -696,9 +960,62 @@ class Notification(db.Model):
     data = db.Column(db.JSON)  # Additional data like group_id, join_request_id
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_notification_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_notification_user_is_read', 'user_id', 'is_read'),
+    )
     
     user = db.relationship('User', backref='notifications')
 
+def adjust_unread_notifications(connection, user_id, delta):
+    if user_id is None or not delta:
+        return
+    users = User.__table__
+    connection.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        # Keep updated_at: a new notification is not a profile change
+        .values(unread_notification_count=users.c.unread_notification_count + delta,
+                updated_at=users.c.updated_at)
+    )
+
+@event.listens_for(Notification, 'after_insert')
+def count_added_notification(mapper, connection, target):
+    adjust_unread_notifications(connection, target.user_id, int(not target.is_read))
+
+@event.listens_for(Notification, 'after_delete')
+def count_removed_notification(mapper, connection, target):
+    adjust_unread_notifications(connection, target.user_id, -int(not target.is_read))
+
+@event.listens_for(Notification, 'before_update')
+def count_changed_notification(mapper, connection, target):
+    state = db.inspect(target)
+    if not (state.attrs.user_id.history.has_changes() or state.attrs.is_read.history.has_changes()):
+        return
+    table = Notification.__table__
+    old_user, old_read = connection.execute(
+        select(table.c.user_id, table.c.is_read).where(table.c.id == target.id)
+    ).one()
+    adjust_unread_notifications(connection, old_user, -int(not old_read))
+    adjust_unread_notifications(connection, target.user_id, int(not target.is_read))
+
+def mark_notifications_read(user_id, ids=None, up_to_id=None):
+    """Mark a user's unread notifications read in one UPDATE and return how many changed.
+
+    Limited to ids and/or to notifications up to up_to_id when given, otherwise
+    every unread notification is marked. The caller commits.
+    """
+    table = Notification.__table__
+    stmt = update(table).where(table.c.user_id == user_id, table.c.is_read.isnot(True))
+    if ids is not None:
+        stmt = stmt.where(table.c.id.in_(ids))
+    if up_to_id is not None:
+        stmt = stmt.where(table.c.id <= up_to_id)
+    # A Core UPDATE skips the mapper listeners, so settle the counter here
+    changed = db.session.execute(stmt.values(is_read=True)).rowcount
+    adjust_unread_notifications(db.session.connection(), user_id, -changed)
+    return changed
+
 class OTP(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -706,10 +1023,30 @@ class OTP(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime)
     is_used = db.Column(db.Boolean, default=False)
+    __table_args__ = (
+        db.Index('ix_otp_user_created_at', 'user_id', 'created_at'),
+    )
 
     def is_valid(self):
         return datetime.utcnow() < self.expires_at and not self.is_used
 
+class OutboundMessage(db.Model):
+    """An email or SMS waiting in the outbox for the delivery workers"""
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(10), nullable=False)  # email, sms
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200))
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_outbound_message_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
 class UserSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -718,9 +1055,15 @@ class UserSession(db.Model):
     login_time = db.Column(db.DateTime, default=datetime.utcnow)
     last_activity = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    __table_args__ = (
+        db.Index('ix_user_session_user_login_time', 'user_id', 'login_time'),
+    )
 
 class Conversation(db.Model):
     __tablename__ = 'conversations'
+    __table_args__ = (
+        db.Index('ix_conversations_user_id', 'user_id'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -728,11 +1071,17 @@ class Conversation(db.Model):
     is_stokvel_related = db.Column(db.Boolean, default=False)
     stokvel_id = db.Column(db.Integer, db.ForeignKey('stokvel_group.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Running summary of the turns that have dropped out of the context window
+    summary = db.Column(db.Text, nullable=True)
+    summary_through = db.Column(db.DateTime, nullable=True)
 
     messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan')
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        db.Index('ix_messages_conversation_created_at', 'conversation_id', 'created_at'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.id'), nullable=False)
@@ -783,6 +1132,9 @@ class Card(db.Model):
     is_primary = db.Column(db.Boolean, default=False)
     card_type = db.Column(db.String(20), default='visa')  # visa, mastercard, etc.
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_card_user_id', 'user_id'),
+    )
     
     # Relationship
     user = db.relationship('User', backref=db.backref('cards', lazy=True))
@@ -831,6 +1183,9 @@ class Transaction(db.Model):
     # Relationships
     user = db.relationship('User', backref='transactions')
     card = db.relationship('Card', backref='transactions')
+    __table_args__ = (
+        db.Index('ix_transaction_user_created_at_id', 'user_id', 'created_at', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -848,6 +1203,35 @@ class Transaction(db.Model):
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
+class DailyTransactionTotal(db.Model):
+    """Running per-user, per-day, per-type totals used by check_transaction_limits"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    transaction_type = db.Column(db.String(20), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.00)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AnalyticsDailyRollup(db.Model):
+    """Pre-aggregated daily counts and sums behind the admin analytics overview.
+
+    user_id and group_id are 0 when a metric has no such dimension; dimension
+    holds the metric's breakdown key (transaction type/status, message role...).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    metric = db.Column(db.String(30), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, default=0)
+    group_id = db.Column(db.Integer, nullable=False, default=0)
+    dimension = db.Column(db.String(50), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.00)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.UniqueConstraint('day', 'metric', 'user_id', 'group_id', 'dimension', name='uq_analytics_daily_rollup'),
+        db.Index('ix_analytics_daily_rollup_metric_day', 'metric', 'day'),
+    )
+
 class GroupJoinRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -860,6 +1244,10 @@ class GroupJoinRequest(db.Model):
     created_at = db.Column(db.DateTime)
     user = db.relationship('User', backref='join_requests')
     group = db.relationship('StokvelGroup', backref='join_requests')  # <-- Add this
+    __table_args__ = (
+        db.Index('ix_group_join_request_user_status', 'user_id', 'status'),
+        db.Index('ix_group_join_request_group_status', 'group_id', 'status'),
+    )
 
     
 class SavingsGoal(db.Model):
@@ -877,7 +1265,7 @@ class Claim(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     beneficiary_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     amount = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending/review/approved/rejected
+    status = db.Column(db.String(20), default='pending')  # analyzing/pending/review/approved/rejected
     reason = db.Column(db.Text)
     id_document_path = db.Column(db.String(200))
     death_certificate_path = db.Column(db.String(200))
@@ -892,6 +1280,24 @@ class Claim(db.Model):
     user = db.relationship('User', foreign_keys=[user_id], backref='claims')
     beneficiary = db.relationship('User', foreign_keys=[beneficiary_id])
 
+class DocumentAnalysis(db.Model):
+    """Cached check_document outcome for a file's contents, so re-uploads skip the analysis"""
+    content_hash = db.Column(db.String(64), primary_key=True)  # SHA-256 hex
+    analysis_version = db.Column(db.Integer, primary_key=True)
+    issue = db.Column(db.String(200))  # None when nothing was found
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IdBlock(db.Model):
+    """Next free block per identifier, for databases without sequences"""
+    name = db.Column(db.String(50), primary_key=True)
+    next_block = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Block sequences used instead of IdBlock where the database has sequences
+ID_BLOCK_SEQUENCES = {
+    name: db.Sequence(f'{name}_block_seq', start=0, minvalue=0, metadata=db.metadata)
+    for name in ('account_number', 'group_code')
+}
+
 class Referral(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -900,6 +1306,7 @@ class Referral(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     __table_args__ = (
         db.UniqueConstraint('referrer_id', 'referee_id', name='uq_referral_pair'),
+        db.Index('ix_referral_referee_id', 'referee_id'),
     )
     referrer = db.relationship('User', foreign_keys=[referrer_id], backref='referrals_sent')
     referee = db.relationship('User', foreign_keys=[referee_id], backref='referrals_received')
@@ -944,160 +1351,634 @@ def check_and_process_referral_completion(referee_user):
             )
             db.session.add(milestone_notification)
 
+# -------------------- IDENTIFIERS --------------------
+# Account numbers and group codes are handed out without lookups. Each process
+# reserves a block of ID_BLOCK_SIZE sequence values at a time (a Postgres
+# sequence, or an IdBlock row elsewhere), and each value goes through a keyed
+# Feistel permutation, so numbers are unique by construction but do not
+# reveal how many users or groups there are. Account numbers are a 9-digit
+# body plus a Luhn check digit; group codes are 6 base-36 characters. Numbers
+# handed out by the old random generators can still collide with a block, so
+# each new block is checked against existing values once and clashes skipped.
+# Transaction references need no database at all (see ReferenceGenerator).
+# Without sequences the IdBlock row is reserved in its own short transaction;
+# SQLite allows one writer at a time, so there generate ids before the
+# caller's transaction writes anything.
+#   ID_PERMUTATION_KEY   secret permutation key; set it in production and never change it
+#   ID_BLOCK_SIZE        sequence values reserved per round trip (default 1000)
+ID_PERMUTATION_KEY = os.getenv('ID_PERMUTATION_KEY', 'istokvel-ids-v1')
+ID_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', 1000))
+if not os.getenv('ID_PERMUTATION_KEY') and not app.debug:
+    logger.warning("ID_PERMUTATION_KEY is not set: account numbers and group codes use the key in the source, "
+                   "so anyone can recover how many users and groups there are. Set it before issuing ids, "
+                   "and never change it afterwards.")
+
+class IdsExhaustedError(RuntimeError):
+    pass
+
+def next_id_block(name):
+    """Reserve the next block number for name"""
+    if db.engine.dialect.name == 'postgresql':
+        # nextval is never rolled back
+        return db.session.scalar(select(ID_BLOCK_SEQUENCES[name].next_value()))
+    # Committed on its own, so rolling back the caller never hands a block out twice
+    table = IdBlock.__table__
+    with db.engine.begin() as connection:
+        block = connection.execute(
+            update(table).where(table.c.name == name).values(next_block=table.c.next_block + 1)
+            .returning(table.c.next_block)
+        ).scalar()
+        if block is None:
+            connection.execute(table.insert().values(name=name, next_block=1))
+            block = 1
+    return block - 1
+
+class BlockIdGenerator:
+    """Unique identifiers from sequence blocks run through a permutation.
+
+    format_id turns a permuted value into the identifier; taken_ids(candidates)
+    returns those already in use by rows from before the generator existed.
+    """
+    def __init__(self, name, permutation, format_id, taken_ids=None, block_size=ID_BLOCK_SIZE):
+        self.name = name
+        self.permutation = permutation
+        self.format_id = format_id
+        self.taken_ids = taken_ids
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._ids = []
+
+    def _refill(self):
+        block = next_id_block(self.name)
+        start = block * self.block_size
+        if start >= self.permutation.size:
+            raise IdsExhaustedError(f"No {self.name} identifiers left")
+        candidates = [self.format_id(self.permutation(value))
+                      for value in range(start, min(start + self.block_size, self.permutation.size))]
+        if self.taken_ids:
+            taken = self.taken_ids(candidates)
+            candidates = [candidate for candidate in candidates if candidate not in taken]
+        self._ids = candidates[::-1]
+
+    def __call__(self):
+        with self._lock:
+            # A forked worker must not hand out its parent's reserved block
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._ids = []
+            while not self._ids:
+                self._refill()
+            return self._ids.pop()
+
+def taken_account_numbers(candidates):
+    with db.session.no_autoflush:
+        return set(db.session.scalars(select(User.account_number).where(User.account_number.in_(candidates))))
+
+def taken_group_codes(candidates):
+    with db.session.no_autoflush:
+        return set(db.session.scalars(select(StokvelGroup.group_code).where(StokvelGroup.group_code.in_(candidates))))
+
+def format_account_number(value):
+    # Bodies run 100000000-999999999 so the number never starts with 0
+    body = str(100_000_000 + value)
+    return body + luhn_check_digit(body)
+
+@lazy_singleton
+def get_id_generators():
+    return {
+        'account_number': BlockIdGenerator('account_number', FeistelPermutation(30_000, ID_PERMUTATION_KEY),
+                                           format_account_number, taken_account_numbers),
+        'group_code': BlockIdGenerator('group_code', FeistelPermutation(36 ** 3, ID_PERMUTATION_KEY),
+                                       lambda value: to_base36(value, 6), taken_group_codes),
+        'transaction_reference': ReferenceGenerator('TXN'),
+    }
+
+def generate_account_number():
+    """Next 10-digit account number with a Luhn check digit"""
+    return get_id_generators()['account_number']()
+
+def generate_group_code():
+    """Next 6-character group code"""
+    return get_id_generators()['group_code']()
+
+def generate_transaction_reference():
+    """Time-ordered transaction reference, unique across processes"""
+    return get_id_generators()['transaction_reference']()
+
+# -------------------- LEDGER --------------------
+# Every wallet balance change goes through post_ledger(). Each leg is applied
+# with one conditional UPDATE (balance = balance + delta, guarded against
+# overdraft) and recorded as a Transaction row in the same database
+# transaction. Internal transfers are two legs that sum to zero. Deposits,
+# withdrawals, contributions and purchases post a single wallet leg whose
+# counterparty is the card, bank, group or merchant named on the transaction.
+# The daily limit counters (DailyTransactionTotal) are bumped in the same
+# commit so check_transaction_limits never has to scan transaction history;
+# deposits and transfers also re-check their limit in that upsert, which is
+# what holds under concurrency.
+class InsufficientFundsError(ValueError):
+    pass
+
+def ledger_leg(user_id, delta, transaction_type, amount, description, fee=0.00, net_amount=None, **fields):
+    """Build one ledger leg: a signed wallet delta plus the Transaction recording it"""
+    transaction = Transaction(
+        user_id=user_id,
+        transaction_type=transaction_type,
+        amount=amount,
+        fee=fee,
+        net_amount=amount if net_amount is None else net_amount,
+        status='completed',
+        reference=generate_transaction_reference(),
+        description=description,
+        completed_at=datetime.utcnow(),
+        **fields
+    )
+    return {'user_id': user_id, 'delta': delta, 'transaction': transaction}
+
+def post_ledger(legs, extra=(), enforce_limits=False):
+    """Post wallet legs, their Transaction rows and any extra rows atomically.
+
+    Wallet rows are updated in ascending wallet id order so concurrent
+    transfers between the same pair of wallets always lock them in the same
+    order. Raises InsufficientFundsError (after rolling back) if a debit
+    would overdraw a wallet, and with enforce_limits DailyLimitExceededError
+    if it would take a daily limit counter over its limit. Returns
+    {user_id: new_balance}.
+    """
+    balances = {}
+    try:
+        # A missing wallet is only flushed so it commits together with the legs
+        wallet_ids = {leg['user_id']: get_or_create_wallet(leg['user_id'], commit=False).id
+                      for leg in legs if leg['delta']}
+        for leg in sorted(legs, key=lambda leg: wallet_ids.get(leg['user_id'], 0)):
+            if not leg['delta']:
+                continue
+            stmt = update(Wallet) \
+                .where(Wallet.id == wallet_ids[leg['user_id']]) \
+                .values(balance=Wallet.balance + leg['delta'], updated_at=datetime.utcnow())
+            if leg['delta'] < 0:
+                stmt = stmt.where(Wallet.balance >= -leg['delta'])
+            new_balance = db.session.execute(stmt.returning(Wallet.balance)).scalar_one_or_none()
+            if new_balance is None:
+                raise InsufficientFundsError('Insufficient balance')
+            balances[leg['user_id']] = float(new_balance)
+
+        db.session.add_all([leg['transaction'] for leg in legs])
+        db.session.add_all(extra)
+        bump_daily_totals([leg['transaction'] for leg in legs], enforce_limits)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return balances
+
+def transfer_funds(sender, recipient, amount, enforce_limits=False):
+    """Move amount from sender's wallet to recipient's and notify the recipient"""
+    sender_leg = ledger_leg(
+        sender.id, -amount, 'transfer', -amount,
+        f"Transfer to {recipient.full_name} ({recipient.account_number[-4:]})",
+        recipient_email=recipient.email,
+        sender_email=sender.email
+    )
+    recipient_leg = ledger_leg(
+        recipient.id, amount, 'transfer', amount,
+        f"Transfer from {sender.full_name} ({sender.account_number[-4:]})",
+        recipient_email=recipient.email,
+        sender_email=sender.email
+    )
+    reference = sender_leg['transaction'].reference
+    notification = Notification(
+        user_id=recipient.id,
+        title="Money Received",
+        message=f"You received R{amount:.2f} from {sender.full_name}",
+        type="transfer_received",
+        data={
+            "amount": amount,
+            "sender_name": sender.full_name,
+            "sender_account": sender.account_number[-4:],
+            "reference": reference  # Use sender's reference for notification
+        }
+    )
+    balances = post_ledger([sender_leg, recipient_leg], extra=[notification], enforce_limits=enforce_limits)
+    return reference, balances[sender.id]
+
 # -------------------- DECORATORS --------------------
+# Auth facts (id, role, verification and admin permissions) are cached per
+# worker so protected endpoints don't hit the user table on every request.
+# Entries expire after AUTH_CACHE_TTL seconds. When a user or admin role
+# changes, the affected entries are dropped once the transaction commits, in
+# this worker directly and in the others through a Postgres NOTIFY on
+# AUTH_CACHE_CHANNEL.
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 60))
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 10000))
+AUTH_CACHE_CHANNEL = 'auth_cache'
+
+class TTLCache:
+    """Bounded, TTL-based in-process LRU cache"""
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a value loaded before one can be refused
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation=None):
+        """Store value, unless generation is given and an invalidation has happened since"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+auth_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+def pending_auth_invalidations(target):
+    session = object_session(target)
+    return session.info.setdefault('auth_invalidations', set()) if session is not None else None
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_user_auth(mapper, connection, target):
+    pending = pending_auth_invalidations(target)
+    if pending is not None:
+        pending.add(target.id)
+
+@event.listens_for(AdminRole, 'after_update')
+@event.listens_for(AdminRole, 'after_delete')
+def invalidate_role_auth(mapper, connection, target):
+    # Roles are shared by many admins, so drop everything
+    pending = pending_auth_invalidations(target)
+    if pending is not None:
+        pending.add('*')
+
+def apply_auth_invalidations(keys):
+    if '*' in keys:
+        auth_cache.clear()
+    else:
+        for user_id in keys:
+            auth_cache.invalidate(user_id)
+
+@event.listens_for(db.session, 'after_commit')
+def publish_auth_invalidations(session):
+    keys = session.info.pop('auth_invalidations', None)
+    if not keys:
+        return
+    apply_auth_invalidations(keys)
+    if db.engine.dialect.name != 'postgresql':
+        return
+    payload = json.dumps(sorted(keys, key=str))
+    if len(payload) > 7000:  # NOTIFY payloads are capped at 8000 bytes
+        payload = '["*"]'
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(db.text('SELECT pg_notify(:channel, :payload)'),
+                               {'channel': AUTH_CACHE_CHANNEL, 'payload': payload})
+    except SQLAlchemyError:
+        # Other workers fall back to AUTH_CACHE_TTL
+        auth_logger.exception("Could not broadcast auth cache invalidation")
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_auth_invalidations(session):
+    session.info.pop('auth_invalidations', None)
+
+@lazy_singleton
+def start_auth_cache_listener():
+    """Drop entries invalidated by other workers; a no-op off Postgres"""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    import select as io_select
+    import psycopg2
+    from sqlalchemy.engine import make_url
+
+    dsn = make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql') \
+        .render_as_string(hide_password=False)
+
+    def listen():
+        while True:
+            try:
+                connection = psycopg2.connect(dsn)
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{AUTH_CACHE_CHANNEL}"')
+                # Anything published while we were not listening is lost
+                auth_cache.clear()
+                while True:
+                    if io_select.select([connection], [], [], 5) != ([], [], []):
+                        connection.poll()
+                        while connection.notifies:
+                            apply_auth_invalidations(set(json.loads(connection.notifies.pop(0).payload)))
+            except Exception:
+                auth_logger.exception("Auth cache listener lost its connection; reconnecting")
+                time.sleep(5)
+
+    thread = threading.Thread(target=listen, name='auth-cache-listener', daemon=True)
+    thread.start()
+    return thread
+
+def get_auth_facts(user_id):
+    """Return the cached auth facts for a user, loading them on a miss"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    facts = auth_cache.get(user_id)
+    if facts is None:
+        auth_logger.debug("Auth cache miss for user %s", user_id)
+        start_auth_cache_listener()
+        generation = auth_cache.generation
+        user = db.session.get(User, user_id)
+        if not user:
+            return None
+        admin_role = getattr(user, 'admin_role', None)
+        facts = {
+            'id': user.id,
+            'role': user.role,
+            'is_verified': bool(user.is_verified),
+            'admin_role': admin_role.name if admin_role else None,
+            'permissions': dict(admin_role.permissions or {}) if admin_role else {}
+        }
+        auth_cache.set(user_id, facts, generation)
+    return facts
+
+def authenticate_request():
+    """Decode the bearer token once per request and resolve the caller.
+
+    Returns (auth, None) on success, where auth holds the token payload and
+    the caller's auth facts (None if the user no longer exists), or
+    (None, error_response) if the token is missing or invalid.
+    """
+    if 'auth' in g:
+        return g.auth, None
+
+    header = request.headers.get('Authorization')
+    if not header:
+        return None, (jsonify({'error': 'No token provided'}), 401)
+
+    parts = header.split(' ')
+    if len(parts) != 2:
+        return None, (jsonify({'error': 'Malformed token'}), 401)
+
+    try:
+        payload = pyjwt.decode(parts[1], app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
+    except ExpiredSignatureError:
+        auth_logger.debug("Rejected expired token for %s", request.path)
+        return None, (jsonify({'error': 'Token has expired'}), 401)
+    except InvalidTokenError:
+        auth_logger.debug("Rejected invalid token for %s", request.path)
+        return None, (jsonify({'error': 'Invalid token'}), 401)
+
+    user_id = payload.get('user_id') or payload.get('sub')
+    facts = get_auth_facts(user_id)
+    g.auth = {
+        'payload': payload,
+        'user_id': facts['id'] if facts else None,
+        'facts': facts
+    }
+    return g.auth, None
+
+class CurrentUser:
+    """Request-scoped stand-in for the authenticated User.
+
+    id, role and is_verified are answered from the auth cache; any other
+    attribute loads the User row once and delegates to it.
+    """
+    _cached_fields = ('id', 'role', 'is_verified')
+
+    def __init__(self, facts):
+        object.__setattr__(self, '_facts', facts)
+        object.__setattr__(self, '_user', None)
+
+    def _get_current_object(self):
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self._facts['id']))
+        return self._user
+
+    def __getattr__(self, name):
+        if self._user is None and name in self._cached_fields:
+            return self._facts[name]
+        return getattr(self._get_current_object(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_current_object(), name, value)
+
+    def __repr__(self):
+        return f"<CurrentUser {self._facts['id']}>"
+
 def token_required(f):
     @wraps(f)
-    @jwt_required()
     def decorated(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        if not current_user:
+        auth, error = authenticate_request()
+        if error:
+            return error
+
+        facts = auth['facts']
+        if not facts:
             return jsonify({'error': 'User not found'}), 404
-        
+
         # SECURITY FIX: Check if user is verified
-        if not current_user.is_verified:
+        if not facts['is_verified']:
             return jsonify({'error': 'Please verify your email address to access this feature'}), 403
-            
-        return f(current_user, *args, **kwargs)
+
+        return f(CurrentUser(facts), *args, **kwargs)
     return decorated
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            token = request.headers.get('Authorization')
-            print("DEBUG: Authorization header:", token)
-            if not token:
-                print("DEBUG: No token provided")
-                return jsonify({'error': 'No token provided'}), 401
-
-            try:
-                token = token.split(' ')[1]  # Remove 'Bearer ' prefix
-                print("DEBUG: Token after split:", token)
-            except Exception as e:
-                print("DEBUG: Error splitting token:", repr(e))
-                return jsonify({'error': 'Malformed token'}), 401
-
-            try:
-                payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-                print("DEBUG: Decoded JWT payload:", payload)
-            except ExpiredSignatureError:
-                print("DEBUG: Token has expired")
-                return jsonify({'error': 'Token has expired'}), 401
-            except InvalidTokenError:
-                print("DEBUG: Invalid token")
-                return jsonify({'error': 'Invalid token'}), 401
-            except Exception as e:
-                print("DEBUG: Error decoding token:", repr(e))
-                return jsonify({'error': 'Token decode error'}), 401
-
-            user_id = payload.get('user_id') or payload.get('sub')
-            print("DEBUG: User ID from payload:", user_id)
-            user = User.query.get(user_id)
-            print("DEBUG: User from DB:", user)
+        auth, error = authenticate_request()
+        if error:
+            return error
 
-            if not user:
-                print("DEBUG: User not found in DB")
-                return jsonify({'error': 'User not found'}), 401
+        facts = auth['facts']
+        if not facts:
+            return jsonify({'error': 'User not found'}), 401
 
-            print(f"DEBUG: User role: {user.role}, is_verified: {user.is_verified}")
-
-            if not user.is_verified:
-                print("DEBUG: User not verified")
-                return jsonify({'error': 'Please verify your email address to access this feature'}), 403
+        if not facts['is_verified']:
+            return jsonify({'error': 'Please verify your email address to access this feature'}), 403
 
-            if user.role != 'admin':
-                print("DEBUG: User is not admin")
-                return jsonify({'error': 'Admin access required'}), 403
+        if facts['role'] != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
 
-            print("DEBUG: Admin access granted")
-            return f(*args, **kwargs)
-        except Exception as e:
-            print("DEBUG: Unhandled exception in admin_required:", repr(e))
-            return jsonify({'error': 'Unknown error'}), 401
+        return f(*args, **kwargs)
     return decorated_function
 
 def role_required(allowed_roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                token = request.headers.get('Authorization')
-                print("DEBUG: Authorization header:", token)
-                if not token:
-                    print("DEBUG: No token provided")
-                    return jsonify({'error': 'No token provided'}), 401
+            auth, error = authenticate_request()
+            if error:
+                return error
 
-                try:
-                    token = token.split(' ')[1]
-                    print("DEBUG: Token after split:", token)
-                except Exception as e:
-                    print("DEBUG: Error splitting token:", repr(e))
-                    return jsonify({'error': 'Malformed token'}), 401
-
-                try:
-                    payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-                    print("DEBUG: Decoded JWT payload:", payload)
-                except ExpiredSignatureError:
-                    print("DEBUG: Token has expired")
-                    return jsonify({'error': 'Token has expired'}), 401
-                except InvalidTokenError:
-                    print("DEBUG: Invalid token")
-                    return jsonify({'error': 'Invalid token'}), 401
-                except Exception as e:
-                    print("DEBUG: Error decoding token:", repr(e))
-                    return jsonify({'error': 'Token decode error'}), 401
-
-                user_id = payload.get('user_id') or payload.get('sub')
-                print("DEBUG: User ID from payload:", user_id)
-                user = User.query.get(user_id)
-                print("DEBUG: User from DB:", user)
-
-                if not user:
-                    print("DEBUG: User not found in DB")
-                    return jsonify({'error': 'User not found'}), 401
-
-                print(f"DEBUG: User role: {user.role}, is_verified: {user.is_verified}")
+            facts = auth['facts']
+            if not facts:
+                return jsonify({'error': 'User not found'}), 401
 
-                if not user.is_verified:
-                    print("DEBUG: User not verified")
-                    return jsonify({'error': 'Please verify your email address to access this feature'}), 403
+            if not facts['is_verified']:
+                return jsonify({'error': 'Please verify your email address to access this feature'}), 403
 
-                if user.role not in allowed_roles:
-                    print("DEBUG: User does not have required role")
-                    return jsonify({'error': 'Insufficient permissions'}), 403
+            if facts['role'] not in allowed_roles:
+                return jsonify({'error': 'Insufficient permissions'}), 403
 
-                print("DEBUG: Role access granted")
-                return f(*args, **kwargs)
-            except Exception as e:
-                print("DEBUG: Unhandled exception in role_required:", repr(e))
-                return jsonify({'error': 'Unknown error'}), 401
+            return f(*args, **kwargs)
         return decorated_function
     return decorator
 
-class FraudDetector:
-    def __init__(self):
+# Fraud models are trained offline (`flask train-fraud-model`) into a
+# versioned store: <dir>/fraud-<version>.joblib plus a CURRENT file naming the
+# active version, which is replaced atomically. Models are loaded with
+# mmap_mode='r', so plain NumPy arrays in a model stay as read-only pages that
+# every worker on the host shares. scikit-learn trees still copy their node
+# arrays when unpickled. Each FraudDetector re-reads CURRENT at most every
+# FRAUD_MODEL_RELOAD_INTERVAL seconds and swaps in a newly activated version
+# without a restart. Until a version is activated, the bundled
+# fraud_model.pkl is used.
+FRAUD_MODEL_DIR = os.getenv('FRAUD_MODEL_DIR', os.path.join(app.root_path, 'models', 'fraud'))
+FRAUD_MODEL_RELOAD_INTERVAL = int(os.getenv('FRAUD_MODEL_RELOAD_INTERVAL', 30))
+LEGACY_FRAUD_MODEL = os.path.join(app.root_path, 'fraud_model.pkl')
+
+class ModelRegistry:
+    """Versioned joblib models in a directory, with an atomically swapped CURRENT pointer"""
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+
+    def path(self, version):
+        return os.path.join(self.directory, f'{self.name}-{version}.joblib')
+
+    def _replace(self, path, write):
+        # Write next to the target and rename over it, so readers never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _replace_text(self, path, text):
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                f.write(text)
+        self._replace(path, write)
+
+    def current_version(self):
         try:
-            self.model = joblib.load('fraud_model.pkl')
-        except:
-            self.train_default_model()
-
-    def train_default_model(self):
-        """Create a simple model if none exists"""
-        data = pd.DataFrame([
-            {"amount": 5000, "past_claims": 1, "fraud": 0},
-            {"amount": 100000, "past_claims": 5, "fraud": 1},
-            {"amount": 20000, "past_claims": 0, "fraud": 0},
-            {"amount": 150000, "past_claims": 3, "fraud": 1}
-        ])
-        X = data[["amount", "past_claims"]]
-        y = data["fraud"]
-        self.model = RandomForestClassifier()
-        self.model.fit(X, y)
-        joblib.dump(self.model, 'fraud_model.pkl')
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self):
+        """[(version, metadata)] oldest first"""
+        found = []
+        prefix, suffix = f'{self.name}-', '.joblib'
+        for filename in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []:
+            if filename.startswith(prefix) and filename.endswith(suffix):
+                version = filename[len(prefix):-len(suffix)]
+                try:
+                    with open(os.path.join(self.directory, f'{self.name}-{version}.json')) as f:
+                        metadata = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    metadata = {}
+                found.append((version, metadata))
+        return found
+
+    def save(self, model, metadata):
+        """Store a new version (uncompressed, so it can be memory-mapped) and return its name"""
+        os.makedirs(self.directory, exist_ok=True)
+        version = datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')
+        self._replace(self.path(version), lambda tmp: joblib.dump(model, tmp))
+        metadata_path = os.path.join(self.directory, f'{self.name}-{version}.json')
+        self._replace_text(metadata_path, json.dumps(metadata, indent=2))
+        return version
+
+    def activate(self, version):
+        if not os.path.exists(self.path(version)):
+            raise ValueError(f'Unknown {self.name} model version {version}')
+        self._replace_text(os.path.join(self.directory, 'CURRENT'), version)
+
+    def load(self, version):
+        return joblib.load(self.path(version), mmap_mode='r')
+
+@lazy_singleton
+def get_fraud_model_registry():
+    return ModelRegistry(FRAUD_MODEL_DIR, 'fraud')
+
+class FraudDetector:
+    FEATURES = ['amount', 'past_claims']
+    REVIEW_THRESHOLD = 0.7
+
+    def __init__(self, registry=None):
+        self.registry = registry or get_fraud_model_registry()
+        self.model = None
+        self.version = None
+        self._checked_at = time.monotonic()
+        self.reload()
+
+    def reload(self):
+        """Swap in the registry's active model if it has changed"""
+        version = self.registry.current_version()
+        if version is None:
+            if self.model is None:
+                if not os.path.exists(LEGACY_FRAUD_MODEL):
+                    raise RuntimeError('No fraud model available; train one with `flask train-fraud-model`')
+                self.model, self.version = joblib.load(LEGACY_FRAUD_MODEL, mmap_mode='r'), 'legacy'
+            return
+        if version != self.version:
+            model = self.registry.load(version)
+            # One assignment, so a prediction in flight keeps using the model it started with
+            self.model, self.version = model, version
+            logger.info("Loaded fraud model %s", version)
+
+    def current_model(self):
+        if time.monotonic() - self._checked_at >= FRAUD_MODEL_RELOAD_INTERVAL:
+            self._checked_at = time.monotonic()
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Could not reload the fraud model; keeping %s", self.version)
+        return self.model
 
     def predict_fraud(self, amount, past_claims):
-        return self.model.predict_proba([[amount, past_claims]])[0][1]
+        return self.current_model().predict_proba([[amount, past_claims]])[0][1]
+
+    def predict_fraud_batch(self, claims):
+        """Fraud probabilities for many claims in one model call.
+
+        claims is a DataFrame with the FEATURES columns or an (n, 2) array-like
+        of (amount, past_claims) rows; returns a NumPy array of n scores.
+        """
+        if not isinstance(claims, pd.DataFrame):
+            claims = pd.DataFrame(claims, columns=self.FEATURES)
+        if len(claims) == 0:
+            return pd.Series(dtype=float).to_numpy()
+        model = self.current_model()
+        fraud_column = list(model.classes_).index(1)
+        return model.predict_proba(claims[self.FEATURES])[:, fraud_column]
 
     @staticmethod
     def rule_based_checks(claim, db):
@@ -1128,49 +2009,283 @@ class FraudDetector:
     @staticmethod
     def check_document(file_path):
         """Detect document tampering"""
-        if not file_path:
-            return None
-            
-        if file_path.lower().endswith('.pdf'):
-            try:
-                with open(file_path, 'rb') as f:
-                    reader = PdfReader(f)
-                    text = "".join(page.extract_text() or '' for page in reader.pages)
-                
-                if re.search(r"(\d{2}/\d{2}/\d{4}).*?\1", text):  # Duplicate dates
-                    return "Possible date tampering in document"
-            except:
-                return "Could not analyze PDF document"
-        
-        elif file_path.lower().endswith(('.jpg', '.jpeg', '.png')):
-            try:
-                img = cv2.imread(file_path)
-                if img is None:
-                    return None
-                
-                edges = cv2.Canny(img, 100, 200)
-                edge_ratio = np.sum(edges > 0) / (img.shape[0] * img.shape[1])
-                if edge_ratio > 0.5:
-                    return "Possible image manipulation"
-            except:
-                return "Could not analyze image document"
-        
-        return None
+        return check_document(file_path)
+
+@lazy_singleton
+def get_fraud_detector():
+    """Shared FraudDetector, loaded the first time a claim needs scoring"""
+    return FraudDetector()
+
+# Claims are saved as 'analyzing' and their documents are checked in worker
+# processes, so PDF text extraction and OpenCV never run on a request thread.
+# When a check finishes, score_claim() adds the rule-based indicators and the
+# model score, moves the claim to 'pending' or 'review' and tells an admin.
+# The queue only lives in this process, so each web worker also sweeps for
+# claims still 'analyzing' after CLAIM_ANALYSIS_STALE (left by a restart or a
+# failed enqueue) on its first request and every CLAIM_ANALYSIS_SWEEP_INTERVAL
+# after that. score_claim() ignores claims already scored, so a claim picked
+# up twice is only recorded once.
+#   CLAIM_ANALYSIS_WORKERS          worker processes; 0 scores claims inline instead
+#   CLAIM_ANALYSIS_STALE            minutes before an 'analyzing' claim is queued again (default 10)
+#   CLAIM_ANALYSIS_SWEEP_INTERVAL   seconds between sweeps (default 300)
+CLAIM_ANALYSIS_WORKERS = int(os.getenv('CLAIM_ANALYSIS_WORKERS', 2))
+CLAIM_ANALYSIS_STALE = timedelta(minutes=int(os.getenv('CLAIM_ANALYSIS_STALE', 10)))
+CLAIM_ANALYSIS_SWEEP_INTERVAL = int(os.getenv('CLAIM_ANALYSIS_SWEEP_INTERVAL', 300))
+CLAIM_DOCUMENT_FIELDS = ('id_document_path', 'death_certificate_path')
+
+def claim_documents(claim):
+    return [(field, getattr(claim, field)) for field in CLAIM_DOCUMENT_FIELDS if getattr(claim, field)]
+
+def cached_document_analyses(documents):
+    """Look (field, path) documents up in the analysis cache by content hash.
+
+    Returns ({field: issue} for cache hits, [(field, path)] still to analyse,
+    {path: content hash}). Unreadable files are left for the analysis to report.
+    """
+    digests = {}
+    for _, path in documents:
+        try:
+            digests[path] = file_digest(path)
+        except OSError:
+            pass
+    known = {}
+    if digests:
+        known = dict(db.session.execute(
+            select(DocumentAnalysis.content_hash, DocumentAnalysis.issue).where(
+                DocumentAnalysis.content_hash.in_(set(digests.values())),
+                DocumentAnalysis.analysis_version == ANALYSIS_VERSION)
+        ).all())
+    cached, missing = {}, []
+    for field, path in documents:
+        if digests.get(path) in known:
+            cached[field] = known[digests[path]]
+        else:
+            missing.append((field, path))
+    return cached, missing, digests
 
+def save_document_analyses(documents, results, digests):
+    """Cache fresh (field, issue) results for the analysed documents; the caller commits.
 
-# -------------------- ROUTES --------------------
+    Failures to run the checks are not cached, so the file is analysed again on re-upload.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    rows = {digests[path]: issue for (_, path), (_, issue) in zip(documents, results)
+            if path in digests and not isinstance(issue, AnalysisFailure)}
+    if rows:
+        db.session.execute(
+            insert(DocumentAnalysis.__table__).on_conflict_do_nothing(),
+            [{'content_hash': digest, 'analysis_version': ANALYSIS_VERSION, 'issue': issue,
+              'created_at': datetime.utcnow()} for digest, issue in rows.items()]
+        )
 
-# Test routes
-@app.route('/api/test', methods=['GET'])
-def test():
-    logger.debug('Test route accessed')
-    return jsonify({"message": "Server is working!"}), 200
+def document_issue_indicators(documents, issues):
+    return [f"{field}: {issues[field]}" for field, _ in documents if issues.get(field)]
 
-@app.route('/api/test-connection')
-def test_connection():
-    try:
-        # Test database
-        db.engine.connect()
+def score_claim(claim_id, document_indicators):
+    """Record the fraud analysis of an 'analyzing' claim; the caller commits"""
+    claim = db.session.get(Claim, claim_id, with_for_update=True)
+    if claim is None or claim.status != 'analyzing':
+        # Withdrawn or already decided by an admin while it was being analysed
+        return None
+
+    fraud_detector = get_fraud_detector()
+    past_claims = db.session.query(Claim).filter_by(user_id=claim.user_id).count()
+    fraud_indicators = fraud_detector.rule_based_checks(claim, db) + document_indicators
+    fraud_score = float(fraud_detector.predict_fraud(claim.amount, past_claims))
+    claim.fraud_score = fraud_score
+    claim.fraud_indicators = json.dumps(fraud_indicators)
+    claim.status = 'review' if fraud_score > FraudDetector.REVIEW_THRESHOLD or fraud_indicators else 'pending'
+
+    # Notify admin
+    if claim.user.role != 'admin':
+        admin = db.session.query(User).filter_by(role='admin').first()
+        if admin:
+            db.session.add(Notification(
+                user_id=admin.id,
+                title="New Claim Submitted",
+                message=f"Claim #{claim.id} from {claim.user.full_name} (Score: {fraud_score:.2f})",
+                type="new_claim",
+                data=json.dumps({"claim_id": claim.id, "fraud_score": fraud_score})
+            ))
+    return claim
+
+def claim_feature_frame(claim_ids):
+    """DataFrame of model features indexed by claim id, built with one query.
+
+    past_claims counts the claimant's claims up to and including each claim,
+    which is what the model saw when the claim was submitted.
+    """
+    earlier = db.aliased(Claim)
+    rows = db.session.execute(
+        select(Claim.id, Claim.amount, func.count(earlier.id))
+        .join(earlier, (earlier.user_id == Claim.user_id) & (earlier.id <= Claim.id))
+        .where(Claim.id.in_(claim_ids))
+        .group_by(Claim.id, Claim.amount)
+    ).all()
+    return pd.DataFrame(rows, columns=['id'] + FraudDetector.FEATURES).set_index('id')
+
+def rescore_claims(claim_ids):
+    """Re-score claims with the current model in bulk; returns (rescored, moved to review). The caller commits.
+
+    Only fraud_score changes, except that undecided 'pending' claims now above
+    the review threshold move to 'review'. Nothing is moved out of review.
+    """
+    features = claim_feature_frame(claim_ids)
+    if features.empty:
+        return 0, 0
+    scores = get_fraud_detector().predict_fraud_batch(features)
+    table = Claim.__table__
+    db.session.execute(
+        update(table).where(table.c.id == db.bindparam('claim_id')).values(fraud_score=db.bindparam('score')),
+        [{'claim_id': int(claim_id), 'score': float(score)} for claim_id, score in zip(features.index, scores)]
+    )
+    flagged = [int(claim_id) for claim_id, score in zip(features.index, scores) if score > FraudDetector.REVIEW_THRESHOLD]
+    promoted = 0
+    if flagged:
+        promoted = db.session.execute(
+            update(table).where(table.c.id.in_(flagged), table.c.status == 'pending').values(status='review')
+        ).rowcount
+    return len(features), promoted
+
+class ClaimAnalysisRunner:
+    """Check claim documents in a process pool and write the results back"""
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+        self.in_flight = set()
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def _new_pool(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: forking a threaded web worker can copy held locks into the child.
+        # Spawned workers re-import the main module, so when the server is
+        # started with `python app.py` every worker loads the web app too;
+        # under `flask run` or gunicorn they only import document_checks.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, claim_id, documents, cached, missing, digests):
+        from concurrent.futures.process import BrokenProcessPool
+        with self._lock:
+            if self.pool is None:
+                self.pool = self._new_pool()
+            try:
+                future = self.pool.submit(analyze_documents, missing)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed on a huge scan); start a fresh pool
+                self.pool = self._new_pool()
+                future = self.pool.submit(analyze_documents, missing)
+            self.in_flight.add(claim_id)
+        future.add_done_callback(lambda done: self.finish(claim_id, documents, cached, missing, digests, done))
+        return future
+
+    def finish(self, claim_id, documents, cached, missing, digests, future):
+        results = None
+        try:
+            results = future.result()
+            indicators = document_issue_indicators(documents, {**cached, **dict(results)})
+        except Exception as e:
+            logger.exception("Document analysis for claim %s failed", claim_id)
+            indicators = [f"Document analysis failed: {e.__class__.__name__}"]
+        with app.app_context():
+            try:
+                if results is not None:
+                    save_document_analyses(missing, results, digests)
+                score_claim(claim_id, indicators)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Could not record the analysis of claim %s", claim_id)
+        with self._lock:
+            self.in_flight.discard(claim_id)
+
+    def start_sweeper(self):
+        threading.Thread(target=self.sweep, name='claim-analysis-sweeper', daemon=True).start()
+        return self
+
+    def sweep(self):
+        """Queue stale 'analyzing' claims now and every CLAIM_ANALYSIS_SWEEP_INTERVAL until shut down"""
+        with app.app_context():
+            while not self.stopping.is_set():
+                try:
+                    with self._lock:
+                        in_flight = list(self.in_flight)
+                    claims = Claim.query.filter(
+                        Claim.status == 'analyzing',
+                        Claim.created_at <= datetime.utcnow() - CLAIM_ANALYSIS_STALE,
+                        Claim.id.notin_(in_flight)
+                    ).all()
+                    for claim in claims:
+                        logger.warning("Claim %s is still analyzing; queueing it again", claim.id)
+                        queue_claim_analysis(claim)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Claim analysis sweep failed")
+                self.stopping.wait(CLAIM_ANALYSIS_SWEEP_INTERVAL)
+
+    def shutdown(self):
+        self.stopping.set()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+@lazy_singleton
+def get_claim_analysis_runner():
+    runner = ClaimAnalysisRunner(CLAIM_ANALYSIS_WORKERS)
+    atexit.register(runner.shutdown)
+    return runner
+
+@lazy_singleton
+def start_claim_analysis_sweeper():
+    return get_claim_analysis_runner().start_sweeper()
+
+@app.before_request
+def sweep_stale_claim_analyses():
+    if not start_claim_analysis_sweeper.is_loaded():
+        start_claim_analysis_sweeper()
+
+def queue_claim_analysis(claim):
+    """Analyse a committed 'analyzing' claim in the background.
+
+    Documents already analysed (by content hash) are not checked again; when
+    all of them are cached, or workers are off, the claim is scored inline.
+    """
+    documents = claim_documents(claim)
+    cached, missing, digests = cached_document_analyses(documents)
+    if missing and CLAIM_ANALYSIS_WORKERS > 0:
+        return get_claim_analysis_runner().submit(claim.id, documents, cached, missing, digests)
+    results = analyze_documents(missing)
+    save_document_analyses(missing, results, digests)
+    score_claim(claim.id, document_issue_indicators(documents, {**cached, **dict(results)}))
+    db.session.commit()
+    return None
+
+@lazy_singleton
+def get_llm_client():
+    """OpenRouter-backed OpenAI client used by the chat assistant"""
+    return openai.OpenAI(
+        base_url=os.getenv('LLM_BASE_URL', "https://openrouter.ai/api/v1"),
+        api_key=os.getenv('OPENROUTER_API_KEY')
+    )
+
+
+# -------------------- ROUTES --------------------
+
+# Test routes
+@app.route('/api/test', methods=['GET'])
+def test():
+    logger.debug('Test route accessed')
+    return jsonify({"message": "Server is working!"}), 200
+
+@app.route('/api/test-connection')
+def test_connection():
+    try:
+        # Test database
+        db.engine.connect()
         db_status = "Database: Connected"
         
         # Test email
@@ -1234,37 +2349,22 @@ def register():
 
         db.session.commit()
 
-        # Generate and send verification code with better error handling
+        # Generate the verification code and queue the email for the outbox workers
         try:
             verification_code = user.generate_verification()
-            print(f"Generated verification code: {verification_code} for user: {email}")
-            
-            success, message = send_verification_email(user.email, verification_code)
-            print(f"Email sending result - Success: {success}, Message: {message}")
-            
-            if not success:
-                print(f"Warning: Failed to send verification email: {message}")
-                # Still return success but with a warning
-                return jsonify({
-                    'message': 'Account created successfully, but verification email failed to send. Please try resending.',
-                    'email': user.email,
-                    'user_id': user.id,
-                    'account_number': user.account_number,  # <-- ADD THIS
-                    'email_sent': False
-                }), 201
-            else:
-                return jsonify({
-                    'message': 'Registration successful. Please check your email for verification code.',
-                    'email': user.email,
-                    'user_id': user.id,
-                    'account_number': user.account_number,  # <-- ADD THIS
-                    'email_sent': True
-                }), 201
+            queue_verification_email(user.email, verification_code)
+            db.session.commit()
+            return jsonify({
+                'message': 'Registration successful. Please check your email for verification code.',
+                'email': user.email,
+                'user_id': user.id,
+                'account_number': user.account_number,  # <-- ADD THIS
+                'email_sent': True
+            }), 201
                 
         except Exception as email_e:
-            print(f"Warning: Exception during verification email sending: {str(email_e)}")
-            import traceback
-            traceback.print_exc()
+            db.session.rollback()
+            logger.exception("Exception while queueing the verification email for user %s", user.id)
             # Still return success but with a warning
             return jsonify({
                 'message': 'Account created successfully, but verification email failed to send. Please try resending.',
@@ -1276,9 +2376,7 @@ def register():
 
     except Exception as e:
         db.session.rollback()
-        print(f"Error during registration: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error during registration")
         return jsonify({'error': 'An unexpected error occurred during registration'}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -1299,11 +2397,11 @@ def login():
         expiry = datetime.utcnow() + timedelta(minutes=10)
         otp = OTP(user_id=user.id, code=otp_code, expires_at=expiry)
         db.session.add(otp)
-        db.session.commit()
         if user.two_factor_method == 'sms':
-            send_verification_sms(user.phone, otp_code)
+            queue_verification_sms(user.phone, otp_code)
         else:
-            send_verification_email(user.email, otp_code)
+            queue_verification_email(user.email, otp_code)
+        db.session.commit()
         return jsonify({'message': '2FA code sent', 'user_id': user.id, 'two_factor_required': True}), 200
 
     access_token = create_access_token(identity=str(user.id))
@@ -1418,7 +2516,7 @@ def verify_email():
             # Clean the stored verification code for comparison
             stored_code = user.verification_code.replace(' ', '')
             if stored_code != code:
-                print(f"Code mismatch - Received: '{code}', Stored: '{stored_code}'")  # Debug log
+                auth_logger.info("Verification code mismatch for user %s", user.id)
                 return jsonify({'error': 'Invalid verification code'}), 400
             
             # Mark user as verified
@@ -1438,7 +2536,7 @@ def verify_email():
             
         except Exception as e:
             db.session.rollback()
-            print(f"Verification error: {str(e)}")  # Debug log
+            logger.exception("Verification error")
             return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/resend-verification', methods=['POST'])
@@ -1457,26 +2555,16 @@ def resend_verification():
         if user.is_verified:
             return jsonify({'error': 'Email already verified'}), 400
         
-        # Generate and send new verification code
+        # Generate a new verification code and queue the email
         verification_code = user.generate_verification()
-        print(f"Resending verification code: {verification_code} for user: {email}")
-        
-        success, message = send_verification_email(user.email, verification_code)
-        print(f"Resend email result - Success: {success}, Message: {message}")
-        
-        if not success:
-            db.session.rollback()
-            return jsonify({'error': f'Failed to send verification email: {message}'}), 500
-        
+        queue_verification_email(user.email, verification_code)
         db.session.commit()
 
         return jsonify({'message': 'New verification code sent successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error during resend: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error during resend")
         return jsonify({'error': f'Failed to resend verification code: {str(e)}'}), 500
 
 @app.route('/api/auth/send-otp', methods=['POST'])
@@ -1500,12 +2588,9 @@ def resend_sms():
     expiry = datetime.utcnow() + timedelta(minutes=10)
     otp = OTP(user_id=user.id, code=otp_code, expires_at=expiry)
     db.session.add(otp)
+    queue_verification_sms(normalized_phone, otp_code)
     db.session.commit()
 
-    success, message = send_verification_sms(normalized_phone, otp_code)
-    if not success:
-        return jsonify({'success': False, 'message': f'Failed to send SMS: {message}'}), 500
-
     return jsonify({'success': True, 'message': 'OTP sent successfully'})
 
 @app.route('/api/auth/verify-2fa-login', methods=['POST'])
@@ -1628,7 +2713,7 @@ def get_user_profile(current_user):
         if not current_user.account_number:
             current_user.account_number = generate_account_number()
             db.session.commit()
-            print(f"✅ Generated account number {current_user.account_number} for user {current_user.id} ({current_user.email})")
+            logger.info("Generated account number for user %s", current_user.id)
         
         # Ensure user has a wallet
         wallet = get_or_create_wallet(current_user.id)
@@ -1651,9 +2736,7 @@ def get_user_profile(current_user):
             "date_of_birth": current_user.date_of_birth.strftime('%Y-%m-%d') if current_user.date_of_birth else None,
         }), 200
     except Exception as e:
-        print(f"❌ Error in get_user_profile: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_user_profile")
         return jsonify({
             "error": "Failed to load profile",
             "details": str(e)
@@ -1737,13 +2820,12 @@ def start_2fa_setup(current_user):
     expiry = datetime.utcnow() + timedelta(minutes=10)
     otp = OTP(user_id=current_user.id, code=otp_code, expires_at=expiry)
     db.session.add(otp)
-    db.session.commit()
 
-    # Send OTP
+    # Queue the OTP for delivery
     if method == 'sms':
-        send_verification_sms(current_user.phone, otp_code)
+        queue_verification_sms(current_user.phone, otp_code)
     else:
-        send_verification_email(current_user.email, otp_code)
+        queue_verification_email(current_user.email, otp_code)
 
     current_user.two_factor_method = method
     db.session.commit()
@@ -1868,7 +2950,7 @@ def delete_account(current_user):
     if not current_user or not current_user.check_password(password):
         return jsonify({'error': 'Incorrect password'}), 401
 
-    db.session.delete(current_user)
+    db.session.delete(current_user._get_current_object())
     db.session.commit()
     return jsonify({'message': 'Account deleted successfully'})
 
@@ -1895,8 +2977,8 @@ def get_users():
 @role_required(['admin', 'member'])
 def get_contributions():
     # Both admin and members can access this endpoint
-    user_id = get_jwt_identity()
-    if request.args.get('all') and User.query.get(user_id).role == 'admin':
+    user_id = g.auth['user_id']
+    if request.args.get('all') and g.auth['facts']['role'] == 'admin':
         # Admin can see all contributions
         contributions = Contribution.query.all()
     else:
@@ -1918,7 +3000,7 @@ def get_wallet_balance(current_user):
             'currency': 'ZAR'
         }), 200
     except Exception as e:
-        print(f"Error getting wallet balance: {str(e)}")
+        wallet_logger.exception("Error getting wallet balance")
         return jsonify({
             'balance': 0.0,
             'currency': 'ZAR'
@@ -1930,10 +3012,20 @@ def get_wallet_transactions(current_user):
     """Get user's transaction history"""
     try:
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        transactions = Transaction.query.filter_by(user_id=current_user.id)\
-            .order_by(Transaction.created_at.desc())\
+        per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
+        cursor = request.args.get('cursor')
+        query = Transaction.query.filter_by(user_id=current_user.id)
+
+        if cursor is not None:
+            try:
+                result = keyset_page(query, Transaction, per_page, cursor,
+                                     include_total=request.args.get('include_total') == 'true')
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify(keyset_response(result, 'transactions', Transaction.to_dict, per_page)), 200
+        
+        transactions = query\
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())\
             .paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
@@ -1965,8 +3057,16 @@ def make_deposit(current_user):
         card = Card.query.filter_by(id=card_id, user_id=current_user.id).first()
         if not card:
             return jsonify({'error': 'Invalid card'}), 400
+
+        try:
+            check_transaction_limits(current_user.id, amount, 'deposit')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        result = process_deposit(current_user.id, amount, card_id, description)
+        try:
+            result = process_deposit(current_user.id, amount, card_id, description)
+        except DailyLimitExceededError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'message': f'Deposit successful! R{amount:.2f} added to your wallet',
@@ -1984,14 +3084,11 @@ def make_deposit(current_user):
 def make_transfer(current_user):
     try:
         data = request.get_json()
-        print(f"🔍 Transfer request data: {data}")
         
         amount = float(data.get('amount'))
         recipient_account_number = data.get('recipient_account_number')
         description = data.get('description', '')
 
-        print(f"🔍 Amount: {amount}, Recipient: {recipient_account_number}")
-
         if not amount or amount <= 0:
             return jsonify({'error': 'Invalid amount'}), 400
         if not recipient_account_number:
@@ -1999,90 +3096,36 @@ def make_transfer(current_user):
 
         # Find recipient
         recipient = User.query.filter_by(account_number=recipient_account_number).first()
-        print(f" Recipient found: {recipient.full_name if recipient else 'NOT FOUND'}")
         
         if not recipient:
             return jsonify({'error': 'Recipient not found'}), 404
         if recipient.id == current_user.id:
             return jsonify({'error': 'Cannot transfer to yourself'}), 400
 
-        # Get wallets
-        sender_wallet = get_or_create_wallet(current_user.id)
-        recipient_wallet = get_or_create_wallet(recipient.id)
-        
-        if sender_wallet.balance < amount:
-            return jsonify({'error': 'Insufficient balance'}), 400
-
-        # Update balances
-        sender_wallet.balance -= amount
-        recipient_wallet.balance += amount
-
-        # Generate UNIQUE references for each transaction
-        sender_reference = generate_transaction_reference()
-        recipient_reference = generate_transaction_reference()
-        
-        # Create transactions with DIFFERENT references
-        sender_transaction = Transaction(
-            user_id=current_user.id,
-            transaction_type='transfer',
-            amount=-amount,
-            fee=0.00,
-            net_amount=-amount,
-            status='completed',
-            reference=sender_reference,  # Unique reference
-            description=f"Transfer to {recipient.full_name} ({recipient_account_number[-4:]})",
-            recipient_email=recipient.email,
-            sender_email=current_user.email,
-            completed_at=datetime.utcnow()
-        )
-
-        recipient_transaction = Transaction(
-            user_id=recipient.id,
-            transaction_type='transfer',
-            amount=amount,
-            fee=0.00,
-            net_amount=amount,
-            status='completed',
-            reference=recipient_reference,  # Different unique reference
-            description=f"Transfer from {current_user.full_name} ({current_user.account_number[-4:]})",
-            recipient_email=recipient.email,
-            sender_email=current_user.email,
-            completed_at=datetime.utcnow()
-        )
+        try:
+            check_transaction_limits(current_user.id, amount, 'transfer')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Create notification for recipient
-        recipient_notification = Notification(
-            user_id=recipient.id,
-            title="Money Received",
-            message=f"You received R{amount:.2f} from {current_user.full_name}",
-            type="transfer_received",
-            data={
-                "amount": amount,
-                "sender_name": current_user.full_name,
-                "sender_account": current_user.account_number[-4:],
-                "reference": sender_reference  # Use sender's reference for notification
-            }
-        )
+        try:
+            reference, new_balance = transfer_funds(current_user, recipient, amount, enforce_limits=True)
+        except InsufficientFundsError:
+            return jsonify({'error': 'Insufficient balance'}), 400
+        except DailyLimitExceededError as e:
+            return jsonify({'error': str(e)}), 400
 
-        db.session.add(sender_transaction)
-        db.session.add(recipient_transaction)
-        db.session.add(recipient_notification)
-        db.session.commit()
-        
-        print(f"✅ Transfer successful! New balance: {sender_wallet.balance}")
+        wallet_logger.debug("Transfer %s from user %s to user %s completed", reference, current_user.id, recipient.id)
 
         return jsonify({
             'message': f'Transfer successful to {recipient.full_name}',
-            'new_balance': float(sender_wallet.balance),
+            'new_balance': new_balance,
             'recipient_name': recipient.full_name,
-            'reference': sender_reference  # Return sender's reference
+            'reference': reference  # Return sender's reference
         }), 200
 
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Transfer error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        wallet_logger.exception("Transfer failed")
         return jsonify({'error': f'Transfer failed: {str(e)}'}), 500
 
 
@@ -2105,39 +3148,25 @@ def withdraw(current_user):
         if len(bank_account_number) != 10:
             return jsonify({'error': 'Bank account number must be exactly 10 digits'}), 400
         
-        # Get or create wallet
-        wallet = get_or_create_wallet(current_user.id)
-        if wallet.balance < amount:
-            return jsonify({'error': 'Insufficient balance'}), 400
-
         # Calculate fees
         fee = amount * WITHDRAWAL_FEE_PERCENTAGE
         total_deduction = amount + fee
-        
-        if wallet.balance < total_deduction:
-            return jsonify({'error': f'Insufficient balance. Need R{total_deduction:.2f} (R{amount:.2f} + R{fee:.2f} fee)'}), 400
 
-        # Create withdrawal transaction record
-        transaction = Transaction(
-            user_id=current_user.id,
-            transaction_type='withdrawal',
-            amount=amount,
+        leg = ledger_leg(
+            current_user.id, -total_deduction, 'withdrawal', amount,
+            f"Withdrawal to bank account ending in {bank_account_number[-4:]} (Fee: R{fee:.2f})",
             fee=fee,
-            net_amount=-total_deduction,  # Negative for withdrawals
-            status='completed',
-            reference=generate_transaction_reference(),
-            description=f"Withdrawal to bank account ending in {bank_account_number[-4:]} (Fee: R{fee:.2f})",
-            completed_at=datetime.utcnow()
+            net_amount=-total_deduction  # Negative for withdrawals
         )
-        db.session.add(transaction)
-        
-        # Deduct from wallet
-        wallet.balance -= total_deduction
-        db.session.commit()
+        try:
+            balances = post_ledger([leg])
+        except InsufficientFundsError:
+            return jsonify({'error': f'Insufficient balance. Need R{total_deduction:.2f} (R{amount:.2f} + R{fee:.2f} fee)'}), 400
+        transaction = leg['transaction']
 
         return jsonify({
             'message': 'Withdrawal successful',
-            'new_balance': float(wallet.balance),
+            'new_balance': balances[current_user.id],
             'amount_withdrawn': float(amount),
             'fee_charged': float(fee),
             'total_deduction': float(total_deduction),
@@ -2146,9 +3175,7 @@ def withdraw(current_user):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Withdrawal error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        wallet_logger.exception("Withdrawal failed")
         return jsonify({'error': f'Withdrawal failed: {str(e)}'}), 500
     
 @app.route('/api/wallet/analytics', methods=['GET'])
@@ -2161,29 +3188,11 @@ def get_wallet_analytics(current_user):
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Get transactions in date range
-        transactions = Transaction.query.filter(
-            Transaction.user_id == current_user.id,
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
-        ).all()
-        
-        # Calculate analytics
-        total_deposits = sum(tx.amount for tx in transactions if tx.transaction_type == 'deposit' and tx.status == 'completed')
-        total_transfers_out = abs(sum(tx.amount for tx in transactions if tx.transaction_type == 'transfer' and tx.amount < 0 and tx.status == 'completed'))
-        total_transfers_in = sum(tx.amount for tx in transactions if tx.transaction_type == 'transfer' and tx.amount > 0 and tx.status == 'completed')
-        total_fees = sum(tx.fee for tx in transactions if tx.fee)
-        
-        # Monthly breakdown
-        monthly_data = db.session.query(
-            func.to_char(Transaction.created_at, 'YYYY-MM').label('month'),
-            func.sum(Transaction.amount).label('total'),
-            func.count(Transaction.id).label('count')
-        ).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.created_at >= start_date,
-            Transaction.status == 'completed'
-        ).group_by('month').order_by('month').all()
+        months = wallet_monthly_totals(current_user.id, start_date, end_date)
+        total_deposits = sum(month['deposits'] for month in months)
+        total_transfers_out = sum(month['transfers_out'] for month in months)
+        total_transfers_in = sum(month['transfers_in'] for month in months)
+        total_fees = sum(month['fees'] for month in months)
         
         return jsonify({
             'period': f'Last {days} days',
@@ -2196,64 +3205,182 @@ def get_wallet_analytics(current_user):
             },
             'monthly_breakdown': [
                 {
-                    'month': row.month,
-                    'total': float(row.total),
-                    'count': row.count
-                } for row in monthly_data
+                    'month': month['month'],
+                    'total': float(month['total']),
+                    'count': month['count']
+                } for month in months if month['count']
             ],
-            'transaction_count': len(transactions)
+            'transaction_count': sum(month['transaction_count'] for month in months)
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Monthly wallet aggregates for months that are entirely inside an analytics
+# window and already over never change, so they are cached per user and
+# month; only the partial first month and the current month are recomputed.
+# Set WALLET_ANALYTICS_CACHE_TTL=0 to always compute from scratch.
+WALLET_ANALYTICS_CACHE_TTL = int(os.getenv('WALLET_ANALYTICS_CACHE_TTL', 6 * 3600))
+wallet_month_cache = TTLCache(int(os.getenv('WALLET_ANALYTICS_CACHE_SIZE', 50000)), WALLET_ANALYTICS_CACHE_TTL)
+
+def month_bucket(column):
+    """SQL expression formatting a timestamp column as YYYY-MM"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+def next_month(moment):
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+def query_wallet_months(user_id, spans):
+    """Per-month wallet aggregates over the given [start, end) spans in one grouped query"""
+    completed = Transaction.status == 'completed'
+    is_transfer = (Transaction.transaction_type == 'transfer') & completed
+    month = month_bucket(Transaction.created_at).label('month')
+    rows = db.session.execute(
+        select(
+            month,
+            func.coalesce(func.sum(Transaction.amount).filter((Transaction.transaction_type == 'deposit') & completed), 0).label('deposits'),
+            func.coalesce(-func.sum(Transaction.amount).filter(is_transfer & (Transaction.amount < 0)), 0).label('transfers_out'),
+            func.coalesce(func.sum(Transaction.amount).filter(is_transfer & (Transaction.amount > 0)), 0).label('transfers_in'),
+            func.coalesce(func.sum(Transaction.fee), 0).label('fees'),
+            func.coalesce(func.sum(Transaction.amount).filter(completed), 0).label('total'),
+            func.count(Transaction.id).filter(completed).label('count'),
+            func.count(Transaction.id).label('transaction_count')
+        ).where(
+            Transaction.user_id == user_id,
+            or_(*[(Transaction.created_at >= start) & (Transaction.created_at < end) for start, end in spans])
+        ).group_by(month)
+    ).mappings().all()
+    return {row['month']: dict(row) for row in rows}
+
+def wallet_monthly_totals(user_id, start_date, end_date):
+    """Monthly wallet aggregates between start_date and end_date, oldest first.
+
+    Whole months that ended before the current one are served from
+    wallet_month_cache when possible; everything else comes from a single
+    grouped query over the uncached spans.
+    """
+    months = []
+    moment = month_start(start_date)
+    while moment <= end_date:
+        months.append(moment)
+        moment = next_month(moment)
+
+    def cacheable(moment):
+        return WALLET_ANALYTICS_CACHE_TTL > 0 and moment >= start_date and next_month(moment) <= month_start(end_date)
+
+    results = {}
+    for moment in months:
+        if cacheable(moment):
+            cached = wallet_month_cache.get((user_id, moment.strftime('%Y-%m')))
+            if cached is not None:
+                results[moment] = cached
+
+    missing = [moment for moment in months if moment not in results]
+    if missing:
+        spans = []
+        for moment in missing:
+            start, end = max(moment, start_date), min(next_month(moment), end_date + timedelta(microseconds=1))
+            if spans and spans[-1][1] == start:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        rows = query_wallet_months(user_id, spans)
+        for moment in missing:
+            label = moment.strftime('%Y-%m')
+            month = rows.get(label) or {
+                'month': label, 'deposits': 0, 'transfers_out': 0, 'transfers_in': 0,
+                'fees': 0, 'total': 0, 'count': 0, 'transaction_count': 0
+            }
+            results[moment] = month
+            if cacheable(moment):
+                wallet_month_cache.set((user_id, label), month)
+
+    return [results[moment] for moment in months]
+
 
 @app.route('/api/wallet/export', methods=['GET'])
 @token_required
 def export_transactions(current_user):
     """Export transactions as CSV"""
     try:
-        from io import StringIO
-        import csv
-        
         # Get date range
         days = request.args.get('days', 30, type=int)
+        compress = request.args.get('gzip') == 'true'
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Get transactions
-        transactions = Transaction.query.filter(
-            Transaction.user_id == current_user.id,
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
-        ).order_by(Transaction.created_at.desc()).all()
-        
-        # Create CSV
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Date', 'Type', 'Amount', 'Fee', 'Net Amount', 'Status', 'Reference', 'Description'])
-        
-        for tx in transactions:
-            writer.writerow([
-                tx.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                tx.transaction_type,
-                f"R{tx.amount:.2f}",
-                f"R{tx.fee:.2f}",
-                f"R{tx.net_amount:.2f}",
-                tx.status,
-                tx.reference,
-                tx.description
-            ])
-        
-        output.seek(0)
-        
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename=transactions_{datetime.utcnow().strftime("%Y%m%d")}.csv'
+        filename = f'transactions_{datetime.utcnow().strftime("%Y%m%d")}.csv'
+        chunks = iter_transactions_csv(current_user.id, start_date, end_date)
+        if compress:
+            chunks = gzip_chunks(chunks)
+            filename += '.gz'
+
+        response = Response(stream_with_context(chunks), mimetype='application/gzip' if compress else 'text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
         
         return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Rows fetched per round trip when streaming exports (server-side cursor on Postgres)
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+def iter_transactions_csv(user_id, start_date, end_date):
+    """Yield a user's transactions in the date range as CSV text, one chunk per batch"""
+    import csv
+    from io import StringIO
+
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Date', 'Type', 'Amount', 'Fee', 'Net Amount', 'Status', 'Reference', 'Description'])
+
+    rows = db.session.execute(
+        select(
+            Transaction.created_at, Transaction.transaction_type, Transaction.amount, Transaction.fee,
+            Transaction.net_amount, Transaction.status, Transaction.reference, Transaction.description
+        ).where(
+            Transaction.user_id == user_id,
+            Transaction.created_at >= start_date,
+            Transaction.created_at <= end_date
+        ).order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    try:
+        for batch in rows.partitions():
+            for tx in batch:
+                writer.writerow([
+                    tx.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                    tx.transaction_type,
+                    f"R{tx.amount:.2f}",
+                    f"R{tx.fee or 0:.2f}",
+                    f"R{tx.net_amount:.2f}",
+                    tx.status,
+                    tx.reference,
+                    tx.description
+                ])
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+        # Header only when there were no rows
+        if output.tell():
+            yield output.getvalue()
+    finally:
+        rows.close()
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of text chunks on the fly"""
+    import zlib
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
 @app.route('/api/wallet/cards', methods=['GET'])
 @token_required
 def get_cards(current_user):
@@ -2264,7 +3391,6 @@ def get_cards(current_user):
 @token_required
 def add_card(current_user):
     data = request.get_json(force=True)  # force=True ensures JSON is parsed
-    print("📦 Raw JSON Payload:", data)
 
     if not data:
         return jsonify({'error': 'No data received'}), 400
@@ -2338,11 +3464,7 @@ def register_stokvel_group(current_user):
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Missing required fields'}), 400
 
-        # Generate unique group code
-        while True:
-            group_code = generate_group_code()
-            if not StokvelGroup.query.filter_by(group_code=group_code).first():
-                break
+        group_code = generate_group_code()
 
         # Create new stokvel group
         new_group = StokvelGroup(
@@ -2359,6 +3481,7 @@ def register_stokvel_group(current_user):
         )
         
         db.session.add(new_group)
+        db.session.flush()
         
         # Create membership for the admin
         admin_membership = StokvelMember(
@@ -2410,10 +3533,42 @@ def join_group():
     db.session.commit()
     return jsonify({"message": "Join request submitted."}), 201
 
-@app.route('/api/groups/available', methods=['GET'])
-def get_available_groups():
-    groups = StokvelGroup.query.all()
-    return jsonify([{
+# The public group catalogue changes rarely but is fetched on every signup
+# and browse page, so serialized responses are cached per filter/page and
+# dropped once a transaction that inserts, updates or deletes a group commits
+# in this process. Other workers pick changes up after
+# GROUP_CATALOGUE_CACHE_TTL seconds. Revalidation is by content ETag only: a
+# process-local Last-Modified could be older than a change made elsewhere.
+GROUP_CATALOGUE_CACHE_TTL = int(os.getenv('GROUP_CATALOGUE_CACHE_TTL', 300))
+group_catalogue_cache = TTLCache(256, GROUP_CATALOGUE_CACHE_TTL)
+
+@event.listens_for(StokvelGroup, 'after_insert')
+@event.listens_for(StokvelGroup, 'after_update')
+@event.listens_for(StokvelGroup, 'after_delete')
+def note_group_catalogue_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['group_catalogue_changed'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_group_catalogue(session):
+    if session.info.pop('group_catalogue_changed', None):
+        group_catalogue_cache.clear()
+
+@event.listens_for(db.session, 'after_rollback')
+def keep_group_catalogue(session):
+    session.info.pop('group_catalogue_changed', None)
+
+def build_group_catalogue(filters, page, per_page):
+    """Serialized catalogue body plus its ETag, for the given filters and page"""
+    query = StokvelGroup.query.filter_by(**filters).order_by(StokvelGroup.id)
+    if page is None:
+        groups, paging = query.all(), None
+    else:
+        paging = {'page': page, 'per_page': per_page, 'total': query.order_by(None).count()}
+        groups = query.offset((page - 1) * per_page).limit(per_page).all()
+
+    items = [{
         'id': g.id,
         'name': g.name,
         'category': g.category,  # <-- ADD THIS LINE
@@ -2425,7 +3580,36 @@ def get_available_groups():
         'frequency': g.frequency,
         'max_members': g.max_members,
         # ... any other fields you want to expose ...
-    } for g in groups])
+    } for g in groups]
+    body = json.dumps(items if paging is None else {'groups': items, **paging})
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+    return {'body': body, 'etag': etag}
+
+@app.route('/api/groups/available', methods=['GET'])
+def get_available_groups():
+    """Public group catalogue, filterable by category, tier and frequency.
+
+    Returns a plain list unless page or per_page is given, in which case the
+    list is wrapped with paging info. Supports If-None-Match.
+    """
+    filters = {key: request.args[key] for key in ('category', 'tier', 'frequency') if request.args.get(key)}
+    page = per_page = None
+    if 'page' in request.args or 'per_page' in request.args:
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    key = (tuple(sorted(filters.items())), page, per_page)
+    entry = group_catalogue_cache.get(key)
+    if entry is None:
+        generation = group_catalogue_cache.generation
+        entry = build_group_catalogue(filters, page, per_page)
+        group_catalogue_cache.set(key, entry, generation)
+
+    response = Response(entry['body'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/api/polls', methods=['GET'])
 @token_required
@@ -2530,40 +3714,54 @@ def create_withdrawal(current_user):
 @token_required
 def get_dashboard_stats(current_user):
     try:
-        # Get user's role in each group
-        memberships = StokvelMember.query.filter_by(user_id=current_user.id).all()
+        # Get user's role in each group, with the groups loaded in one extra query
+        memberships = StokvelMember.query \
+            .options(selectinload(StokvelMember.group)) \
+            .filter_by(user_id=current_user.id) \
+            .all()
         is_group_admin = any(m.role == 'admin' for m in memberships)
+        admin_group_ids = [m.group_id for m in memberships if m.role == 'admin']
         
         # Get user's active groups
         active_groups = [m.group for m in memberships if m.status == 'active']
         
-        # Get total contributions
-        total_contributions = db.session.query(func.sum(Contribution.amount)) \
+        # Contribution totals: the user's own across all groups plus each admin group's,
+        # from one grouped query
+        contribution_totals = db.session.query(
+            StokvelMember.group_id,
+            func.sum(Contribution.amount).filter(StokvelMember.user_id == current_user.id).label('mine'),
+            func.sum(Contribution.amount).label('group_total')
+        ) \
             .join(StokvelMember) \
-            .filter(StokvelMember.user_id == current_user.id) \
-            .scalar() or 0.0
+            .filter(or_(StokvelMember.user_id == current_user.id, StokvelMember.group_id.in_(admin_group_ids))) \
+            .group_by(StokvelMember.group_id) \
+            .all()
+        total_contributions = sum(row.mine or 0.0 for row in contribution_totals)
+        group_contributions = {row.group_id: row.group_total or 0.0 for row in contribution_totals}
 
         # Get recent transactions
         recent_transactions = Contribution.query \
             .join(StokvelMember) \
+            .options(contains_eager(Contribution.member).joinedload(StokvelMember.group)) \
             .filter(StokvelMember.user_id == current_user.id) \
             .order_by(Contribution.date.desc()) \
             .limit(5) \
             .all()
 
         # Get monthly contribution summary
+        month = month_bucket(Contribution.date).label('month')
         monthly_contributions = db.session.query(
-            func.to_char(Contribution.date, 'YYYY-MM').label('month'),
+            month,
             func.sum(Contribution.amount).label('total')
         ) \
             .join(StokvelMember) \
             .filter(StokvelMember.user_id == current_user.id) \
-            .group_by('month') \
-            .order_by('month') \
+            .group_by(month) \
+            .order_by(month) \
             .all()
 
         # Get wallet balance
-        wallet_balance = current_user.wallet[0].balance if current_user.wallet else 0.0
+        wallet_balance = db.session.scalar(select(Wallet.balance).where(Wallet.user_id == current_user.id).limit(1)) or 0.0
 
         # Get group-specific stats if user is a group admin
         group_stats = []
@@ -2571,17 +3769,12 @@ def get_dashboard_stats(current_user):
             for membership in memberships:
                 if membership.role == 'admin':
                     group = membership.group
-                    group_contributions = db.session.query(func.sum(Contribution.amount)) \
-                        .join(StokvelMember) \
-                        .filter(StokvelMember.group_id == group.id) \
-                        .scalar() or 0.0
-                    
                     group_stats.append({
                         'group_id': group.id,
                         'group_name': group.name,
-                        'total_contributions': float(group_contributions),
-                        'member_count': len(group.members),
-                        'active_members': len([m for m in group.members if m.status == 'active']),
+                        'total_contributions': float(group_contributions.get(group.id, 0.0)),
+                        'member_count': group.member_count or 0,
+                        'active_members': group.active_member_count or 0,
                         'group_code': group.group_code
                     })
 
@@ -2615,7 +3808,7 @@ def get_dashboard_stats(current_user):
         })
 
     except Exception as e:
-        print(f"Error fetching dashboard stats: {str(e)}")
+        logger.exception("Error fetching dashboard stats")
         return jsonify({'error': 'Failed to fetch dashboard stats'}), 500
     
 @app.route('/api/groups/<int:group_id>/contribute', methods=['POST'])
@@ -2638,19 +3831,13 @@ def contribute_to_group(group_id):
 
     # 2. Handle payment
     if method == "wallet":
-        wallet = Wallet.query.filter_by(user_id=user_id).first()
-        if not wallet or wallet.balance < amount:
-            return jsonify({'error': 'Insufficient wallet balance.'}), 400
-        wallet.balance -= amount
+        delta = -amount
     elif method == "bank":
         # Simulate deposit to wallet first
         if not card_id:
             return jsonify({'error': 'Card ID required for bank payment.'}), 400
-        # You can call your process_deposit logic here
-        # For now, just add to wallet
-        wallet = Wallet.query.filter_by(user_id=user_id).first()
-        wallet.balance += amount  # Simulate deposit
-        wallet.balance -= amount  # Then deduct for contribution
+        # Funds come straight from the card, so the wallet balance is unchanged
+        delta = 0
     else:
         return jsonify({'error': 'Invalid payment method.'}), 400
 
@@ -2660,23 +3847,13 @@ def contribute_to_group(group_id):
         amount=amount,
         status='confirmed'
     )
-    db.session.add(contribution)
 
-    # 4. Create transaction record for dashboard/wallet
-    from datetime import datetime
-    transaction = Transaction(
-        user_id=user_id,
-        transaction_type='stokvel_contribution',
-        amount=amount,
-        fee=0.00,
-        net_amount=amount,
-        status='completed',
-        reference=generate_transaction_reference(),
-        description=f"Contribution to {group.name}",
-        completed_at=datetime.utcnow()
-    )
-    db.session.add(transaction)
-    db.session.commit()
+    # 4. Record the transaction for dashboard/wallet together with the contribution
+    leg = ledger_leg(int(user_id), delta, 'stokvel_contribution', amount, f"Contribution to {group.name}")
+    try:
+        post_ledger([leg], extra=[contribution])
+    except InsufficientFundsError:
+        return jsonify({'error': 'Insufficient wallet balance.'}), 400
 
     return jsonify({'message': 'Contribution successful!'}), 200
 
@@ -2684,10 +3861,12 @@ def contribute_to_group(group_id):
 @jwt_required()
 def get_my_groups():
     user_id = get_jwt_identity()
-    memberships = StokvelMember.query.filter_by(user_id=user_id).all()
+    memberships = StokvelMember.query \
+        .options(selectinload(StokvelMember.group)) \
+        .filter_by(user_id=user_id).all()
     groups = []
     for m in memberships:
-        group = StokvelGroup.query.get(m.group_id)
+        group = m.group
         if group:
             groups.append({
                 "id": group.id,
@@ -2695,7 +3874,7 @@ def get_my_groups():
                 "category": group.category,
                 "tier": group.tier,
                 "description": group.description,
-                "member_count": len(group.members)
+                "member_count": group.member_count or 0
             })
     return jsonify(groups)
 
@@ -3071,12 +4250,10 @@ def create_group():
         )
         db.session.add(group)
         db.session.commit()
-        print("Created group:", group.id, group.name, group.status)
+        logger.info("Created group %s (%s)", group.id, group.name)
         return jsonify({'message': 'Group created', 'id': group.id}), 201
     except Exception as e:
-        import traceback
-        print("Group creation error:", e)
-        traceback.print_exc()
+        logger.exception("Group creation error")
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/admin/groups/<int:group_id>', methods=['PUT'])
@@ -3292,17 +4469,7 @@ def get_admin_notifications():
         return jsonify({'error': 'Unauthorized'}), 401
     
     # Get notifications for admin users
-    notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.created_at.desc()).all()
-    
-    return jsonify([{
-        'id': n.id,
-        'title': n.title,
-        'message': n.message,
-        'type': n.type,
-        'data': n.data,
-        'is_read': n.is_read,
-        'created_at': n.created_at.isoformat()
-    } for n in notifications])
+    return notification_feed(user_id)
 
 @app.route('/api/admin/notifications/<int:notification_id>/read', methods=['POST'])
 @jwt_required()
@@ -3313,14 +4480,24 @@ def mark_admin_notification_read(notification_id):
     if not user or user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 401
     
-    notification = Notification.query.filter_by(id=notification_id, user_id=user_id).first()
-    
-    if notification:
-        notification.is_read = True
-        db.session.commit()
+    mark_notifications_read(user_id, ids=[notification_id])
+    db.session.commit()
     
     return jsonify({'message': 'Notification marked as read'})
 
+@app.route('/api/admin/notifications/mark-all-read', methods=['POST'])
+@jwt_required()
+def mark_all_admin_notifications_read():
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    updated = mark_notifications_read(user_id)
+    db.session.commit()
+    return jsonify({'message': 'Notifications marked as read', 'updated': updated, 'unread_count': 0})
+
 @app.route('/api/admin/claims', methods=['GET'])
 @token_required
 @admin_required
@@ -3335,6 +4512,7 @@ def get_all_claims(current_user):
         'status': claim.status,
         'fraud_score': claim.fraud_score,
         'fraud_indicators': json.loads(claim.fraud_indicators) if claim.fraud_indicators else [],
+        'analysis_pending': claim.status == 'analyzing',
         'created_at': claim.created_at.isoformat()
     } for claim in claims])
     
@@ -3345,7 +4523,7 @@ def get_all_concerns():
     status = request.args.get('status')
     search = request.args.get('search')
     page = request.args.get('page', default=1, type=int)
-    limit = request.args.get('limit', default=20, type=int)
+    limit = min(max(request.args.get('limit', default=20, type=int), 1), 100)
 
     query = CustomerConcern.query
 
@@ -3353,20 +4531,26 @@ def get_all_concerns():
     if status:
         query = query.filter(CustomerConcern.status == status)
 
-    # Search by keyword
+    # Search by keyword; best matches first except when paging by cursor
+    rank = None
     if search:
-        like = f"%{search}%"
-        query = query.filter(
-            or_(
-                CustomerConcern.name.ilike(like),
-                CustomerConcern.email.ilike(like),
-                CustomerConcern.subject.ilike(like)
-            )
-        )
+        query, rank = text_search(query, CustomerConcern, search, 'simple',
+                                  (CustomerConcern.name, CustomerConcern.email, CustomerConcern.subject))
+
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            result = keyset_page(query, CustomerConcern, limit, cursor,
+                                 include_total=request.args.get('include_total') == 'true')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(keyset_response(result, 'concerns', CustomerConcern.to_dict, limit)), 200
 
     total = query.count()
-    concerns = query.order_by(CustomerConcern.created_at.desc()) \
-        .offset((page - 1) * limit).limit(limit).all()
+    order = (CustomerConcern.created_at.desc(), CustomerConcern.id.desc())
+    if rank is not None:
+        order = (rank.desc(),) + order
+    concerns = query.order_by(*order).offset((page - 1) * limit).limit(limit).all()
 
     return jsonify({
         'total': total,
@@ -3435,7 +4619,7 @@ def reject_beneficiary(beneficiary_id):
 # @mfa_required
 def list_admins():
     page = request.args.get('page', 1, type=int)
-    limit = request.args.get('limit', 20, type=int)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
     search = request.args.get('search', '')
     role_filter = request.args.get('role', '')
 
@@ -3448,13 +4632,8 @@ def list_admins():
         ))
     if role_filter:
         query = query.join(AdminRole).filter(AdminRole.name == role_filter)
-    total = query.count()
-    admins = query.order_by(User.created_at.desc()).offset((page-1)*limit).limit(limit).all()
-    return jsonify({
-        'total': total,
-        'page': page,
-        'limit': limit,
-        'admins': [{
+    def serialize(a):
+        return {
             'id': a.id,
             'name': a.full_name,
             'email': a.email,
@@ -3463,7 +4642,24 @@ def list_admins():
             'is_locked': a.locked_until and a.locked_until > datetime.utcnow(),
             'created_at': a.created_at.isoformat(),
             'last_activity': a.admin_sessions[-1].last_activity.isoformat() if a.admin_sessions else None
-        } for a in admins]
+        }
+
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            result = keyset_page(query, User, limit, cursor,
+                                 include_total=request.args.get('include_total') == 'true')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(keyset_response(result, 'admins', serialize, limit))
+
+    total = query.count()
+    admins = query.order_by(User.created_at.desc(), User.id.desc()).offset((page-1)*limit).limit(limit).all()
+    return jsonify({
+        'total': total,
+        'page': page,
+        'limit': limit,
+        'admins': [serialize(a) for a in admins]
     })
 
 @app.route('/api/admin/team', methods=['POST'])
@@ -3591,10 +4787,7 @@ def create_role():
 @role_required(['admin', 'super_admin', 'manager'])
 def setup_mfa():
     try:
-        token = request.headers.get('Authorization').split(' ')[1]
-        payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload.get('user_id')
-        user = User.query.get(user_id)
+        user = db.session.get(User, g.auth['user_id'])
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
@@ -3633,10 +4826,7 @@ def setup_mfa():
 def verify_mfa():
     try:
         data = request.get_json()
-        token = request.headers.get('Authorization').split(' ')[1]
-        payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-        user_id = payload.get('user_id')
-        user = User.query.get(user_id)
+        user = db.session.get(User, g.auth['user_id'])
         
         if not user or not user.mfa_enabled:
             return jsonify({'error': 'MFA not enabled'}), 400
@@ -3684,7 +4874,7 @@ def verify_mfa():
 # @mfa_required
 def get_audit_logs():
     page = request.args.get('page', 1, type=int)
-    limit = request.args.get('limit', 50, type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 100)
     admin_id = request.args.get('admin_id')
     action = request.args.get('action')
     start_date = request.args.get('start_date')
@@ -3701,14 +4891,8 @@ def get_audit_logs():
     if end_date:
         query = query.filter(AdminAuditLog.created_at <= end_date)
     
-    total = query.count()
-    logs = query.order_by(AdminAuditLog.created_at.desc()).offset((page-1)*limit).limit(limit).all()
-    
-    return jsonify({
-        'total': total,
-        'page': page,
-        'limit': limit,
-        'logs': [{
+    def serialize(log):
+        return {
             'id': log.id,
             'admin_name': log.admin.full_name if log.admin else 'Unknown',
             'action': log.action,
@@ -3717,101 +4901,69 @@ def get_audit_logs():
             'details': log.details,
             'ip_address': log.ip_address,
             'created_at': log.created_at.isoformat()
-        } for log in logs]
+        }
+
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            result = keyset_page(query, AdminAuditLog, limit, cursor,
+                                 include_total=request.args.get('include_total') == 'true')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(keyset_response(result, 'logs', serialize, limit))
+    
+    total = query.count()
+    logs = query.order_by(AdminAuditLog.created_at.desc(), AdminAuditLog.id.desc()).offset((page-1)*limit).limit(limit).all()
+    
+    return jsonify({
+        'total': total,
+        'page': page,
+        'limit': limit,
+        'logs': [serialize(log) for log in logs]
     })
 
 def super_admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            token = request.headers.get('Authorization')
-            if not token:
-                return jsonify({'error': 'No token provided'}), 401
-
-            token = token.split(' ')[1]
-            payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            user = User.query.get(user_id)
+        auth, error = authenticate_request()
+        if error:
+            return jsonify({'error': 'Authentication failed'}), 401
 
-            if not user or not user.is_verified:
-                return jsonify({'error': 'Unauthorized'}), 401
+        facts = auth['facts']
+        if not facts or not facts['is_verified']:
+            return jsonify({'error': 'Unauthorized'}), 401
 
-            # Check if user has super_admin role
-            if not user.admin_role or user.admin_role.name != 'super_admin':
-                return jsonify({'error': 'Super admin access required'}), 403
+        # Check if user has super_admin role
+        if facts['admin_role'] != 'super_admin':
+            return jsonify({'error': 'Super admin access required'}), 403
 
-            return f(*args, **kwargs)
-        except Exception as e:
-            return jsonify({'error': 'Authentication failed'}), 401
+        return f(*args, **kwargs)
     return decorated_function
 
 def mfa_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            token = request.headers.get('Authorization')
-            if not token:
-                return jsonify({'error': 'No token provided'}), 401
-
-            token = token.split(' ')[1]
-            payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            user = User.query.get(user_id)
-
-            if not user or not user.is_verified:
-                return jsonify({'error': 'Unauthorized'}), 401
-
-            # Check if MFA is enabled and verified for this session
-            session_token = payload.get('session_token')
-            if session_token:
-                session = AdminSession.query.filter_by(
-                    session_token=session_token,
-                    user_id=user_id
-                ).first()
-                
-                if not session or not session.mfa_verified:
-                    return jsonify({'error': 'MFA verification required'}), 403
-
-            return f(*args, **kwargs)
-        except Exception as e:
+        auth, error = authenticate_request()
+        if error:
             return jsonify({'error': 'Authentication failed'}), 401
-    return decorated_function
 
-def audit_log(action, resource_type=None, resource_id=None):
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            try:
-                # Get admin info from token
-                token = request.headers.get('Authorization')
-                if token:
-                    token = token.split(' ')[1]
-                    payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-                    admin_id = payload.get('user_id')
-                    
-                    # Create audit log
-                    audit_entry = AdminAuditLog(
-                        admin_id=admin_id,
-                        action=action,
-                        resource_type=resource_type,
-                        resource_id=str(resource_id) if resource_id else None,
-                        details={
-                            'method': request.method,
-                            'endpoint': request.endpoint,
-                            'ip_address': request.remote_addr,
-                            'user_agent': request.headers.get('User-Agent')
-                        },
-                        ip_address=request.remote_addr,
-                        user_agent=request.headers.get('User-Agent')
-                    )
-                    db.session.add(audit_entry)
-                    db.session.commit()
-                
-                return f(*args, **kwargs)
-            except Exception as e:
-                return f(*args, **kwargs)  # Continue even if audit fails
-        return decorated_function
-    return decorator
+        facts = auth['facts']
+        if not facts or not facts['is_verified']:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        # Check if MFA is enabled and verified for this session
+        session_token = auth['payload'].get('session_token')
+        if session_token:
+            session = AdminSession.query.filter_by(
+                session_token=session_token,
+                user_id=facts['id']
+            ).first()
+            
+            if not session or not session.mfa_verified:
+                return jsonify({'error': 'MFA verification required'}), 403
+
+        return f(*args, **kwargs)
+    return decorated_function
 
 # Add these endpoints after the existing ones
 
@@ -4053,6 +5205,97 @@ def initialize_default_roles():
 
 
 
+# -------------------- ANALYTICS ROLLUPS --------------------
+# The admin overview reads AnalyticsDailyRollup rows instead of scanning the
+# source tables. `flask refresh-analytics-rollups` rebuilds a trailing window
+# of days (late rows and status changes land in recent days) and should run
+# on a schedule, e.g. every few minutes for --days 2 and nightly for --days 35.
+def rollup_sources():
+    """(metric, select) pairs producing rollup rows, one per source table.
+
+    Each select returns day, user_id, group_id, dimension, count, total and
+    takes the (start, end) datetime bounds to aggregate as bind parameters.
+    """
+    from sqlalchemy import literal, bindparam
+    start, end = bindparam('start'), bindparam('end')
+
+    def daily(column, user_id, total=None, dimension=None, group_id=None, where=()):
+        day = func.date(column)
+        keys = [day, user_id] + [key for key in (group_id, dimension) if key is not None]
+        return select(
+            day, func.coalesce(user_id, 0),
+            literal(0) if group_id is None else group_id,
+            literal('') if dimension is None else func.coalesce(dimension, ''),
+            func.count(),
+            literal(0.0) if total is None else func.coalesce(func.sum(total), 0)
+        ).where(column >= start, column < end, *where).group_by(*keys)
+
+    return [
+        ('transactions', daily(Transaction.created_at, Transaction.user_id, Transaction.amount,
+                               dimension=Transaction.status)),
+        ('completed_transactions', daily(Transaction.created_at, Transaction.user_id, Transaction.amount,
+                                         dimension=Transaction.transaction_type,
+                                         where=[Transaction.status == 'completed'])),
+        ('sessions', daily(UserSession.login_time, UserSession.user_id)),
+        ('contributions', daily(Contribution.date, StokvelMember.user_id, Contribution.amount,
+                                group_id=StokvelMember.group_id).join_from(Contribution, StokvelMember)),
+        ('referrals', daily(Referral.created_at, Referral.referrer_id, dimension=Referral.status)),
+        ('referrals_received', daily(Referral.created_at, Referral.referee_id, dimension=Referral.status)),
+        ('messages', daily(Message.created_at, Conversation.user_id, dimension=Message.role)
+            .join_from(Message, Conversation)),
+    ]
+
+def refresh_analytics_rollups(since, until=None):
+    """Rebuild rollup rows for days in [since, until) from the source tables in one commit"""
+    from sqlalchemy import insert, literal
+    until = until or datetime.utcnow().date() + timedelta(days=1)
+    start, end = datetime.combine(since, datetime.min.time()), datetime.combine(until, datetime.min.time())
+    columns = ['day', 'user_id', 'group_id', 'dimension', 'count', 'total', 'metric', 'updated_at']
+    rows = 0
+    try:
+        AnalyticsDailyRollup.query.filter(
+            AnalyticsDailyRollup.day >= since, AnalyticsDailyRollup.day < until
+        ).delete(synchronize_session=False)
+        for metric, source in rollup_sources():
+            source = source.add_columns(literal(metric), literal(datetime.utcnow()))
+            result = db.session.execute(insert(AnalyticsDailyRollup.__table__).from_select(columns, source),
+                                        {'start': start, 'end': end})
+            rows += result.rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
+
+def read_analytics_rollups(start_day, end_day, user_id=None, group_id=None):
+    """Sum rollup rows per (metric, dimension) and per (metric, day) for an inclusive day range"""
+    filters = [AnalyticsDailyRollup.day >= start_day, AnalyticsDailyRollup.day <= end_day]
+    if user_id:
+        filters.append(AnalyticsDailyRollup.user_id == int(user_id))
+    else:
+        filters.append(AnalyticsDailyRollup.metric != 'referrals_received')
+    if group_id:
+        # Only contributions are broken down by group
+        filters.append(or_(AnalyticsDailyRollup.metric != 'contributions', AnalyticsDailyRollup.group_id == int(group_id)))
+
+    rows = db.session.execute(
+        select(
+            AnalyticsDailyRollup.metric, AnalyticsDailyRollup.dimension, AnalyticsDailyRollup.day,
+            func.sum(AnalyticsDailyRollup.count), func.sum(AnalyticsDailyRollup.total)
+        ).where(*filters).group_by(AnalyticsDailyRollup.metric, AnalyticsDailyRollup.dimension, AnalyticsDailyRollup.day)
+    ).all()
+
+    by_dimension, by_day = {}, {}
+    for metric, dimension, day, count, total in rows:
+        count, total = count or 0, total or 0.0
+        key = (metric, dimension)
+        prev_count, prev_total = by_dimension.get(key, (0, 0.0))
+        by_dimension[key] = (prev_count + count, prev_total + total)
+        key = (metric, str(day))
+        prev_count, prev_total = by_day.get(key, (0, 0.0))
+        by_day[key] = (prev_count + count, prev_total + total)
+    return by_dimension, by_day
+
 @app.route('/admin/analytics/overview', methods=['GET'])
 @admin_required
 def admin_analytics_overview():
@@ -4069,80 +5312,57 @@ def admin_analytics_overview():
     try:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else thirty_days_ago
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else now
+        user_id = int(user_id) if user_id else None
+        group_id = int(group_id) if group_id else None
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD.'}), 400
 
-    # User Stats (global only)
-    total_users = db.session.query(func.count(User.id)).scalar()
-    verified_users = db.session.query(func.count(User.id)).filter(User.is_verified == True).scalar()
-    recent_users = db.session.query(func.count(User.id)).filter(User.created_at >= (now - timedelta(days=7))).scalar()
+    # User Stats (global only, point-in-time)
+    total_users, verified_users, recent_users = db.session.execute(select(
+        func.count(User.id),
+        func.count(User.id).filter(User.is_verified == True),
+        func.count(User.id).filter(User.created_at >= (now - timedelta(days=7)))
+    )).one()
 
-    # Sessions (only count active sessions in the last 24 hours)
+    # Active sessions are point-in-time too: active in the last 24 hours
     recent_window = datetime.utcnow() - timedelta(hours=24)
-    session_query = db.session.query(UserSession).filter(UserSession.login_time.between(start_date, end_date))
-    if user_id:
-        session_query = session_query.filter(UserSession.user_id == user_id)
-    total_sessions = session_query.count()
-    active_sessions = session_query.filter(
+    active_query = db.session.query(func.count(UserSession.id)).filter(
+        UserSession.login_time.between(start_date, end_date),
         UserSession.is_active == True,
         UserSession.last_activity >= recent_window
-    ).count()
-
-    # Transactions
-    txn_query = db.session.query(Transaction).filter(Transaction.created_at.between(start_date, end_date))
-    if user_id:
-        txn_query = txn_query.filter(Transaction.user_id == user_id)
-    total_transactions = txn_query.count()
-    completed_txns = txn_query.filter(Transaction.status == 'completed')
-    completed_count = completed_txns.count()
-    total_volume = completed_txns.with_entities(func.sum(Transaction.amount)).scalar() or 0
-
-    txn_volume_by_type = completed_txns.with_entities(
-        Transaction.transaction_type,
-        func.sum(Transaction.amount)
-    ).group_by(Transaction.transaction_type).all()
-
-    txn_daily_volume = completed_txns.with_entities(
-        func.date(Transaction.created_at),
-        func.sum(Transaction.amount)
-    ).group_by(func.date(Transaction.created_at)).order_by(func.date(Transaction.created_at)).all()
-
-    # Contributions
-    contrib_query = db.session.query(Contribution).join(StokvelMember)
-    if group_id:
-        contrib_query = contrib_query.filter(StokvelMember.group_id == group_id)
+    )
     if user_id:
-        contrib_query = contrib_query.filter(StokvelMember.user_id == user_id)
-    contrib_query = contrib_query.filter(Contribution.date.between(start_date, end_date))
-    total_contributions = contrib_query.count()
-    contribution_volume = contrib_query.with_entities(func.sum(Contribution.amount)).scalar() or 0
+        active_query = active_query.filter(UserSession.user_id == user_id)
+    active_sessions = active_query.scalar()
 
-    # Referrals
-    referral_query = db.session.query(Referral).filter(Referral.created_at.between(start_date, end_date))
-    if user_id:
-        referral_query = referral_query.filter((Referral.referrer_id == user_id) | (Referral.referee_id == user_id))
-    total_referrals = referral_query.count()
-    completed_referrals = referral_query.filter(Referral.status == 'completed').count()
+    # Everything else is summed from the daily rollups (whole days, inclusive)
+    by_dimension, by_day = read_analytics_rollups(start_date.date(), end_date.date(), user_id, group_id)
 
-    # Chat
-    message_query = db.session.query(Message).filter(Message.created_at.between(start_date, end_date))
-    if user_id:
-        message_query = message_query.join(Conversation).filter(Conversation.user_id == user_id)
-    total_messages = message_query.count()
-    assistant_messages = message_query.filter(Message.role == 'assistant').count()
-    user_messages = total_messages - assistant_messages
+    def metric_rows(metric):
+        return {dimension: values for (name, dimension), values in by_dimension.items() if name == metric}
+
+    def metric_count(metric, dimension=None):
+        return sum(count for dim, (count, _) in metric_rows(metric).items() if dimension is None or dim == dimension)
+
+    completed_by_type = metric_rows('completed_transactions')
+    referral_statuses = ['referrals', 'referrals_received'] if user_id else ['referrals']
+    total_messages = metric_count('messages')
+    assistant_messages = metric_count('messages', 'assistant')
 
     # Notifications
-    notif_query = db.session.query(Notification).filter(Notification.created_at.between(start_date, end_date))
+    notif_query = db.session.query(func.count(Notification.id)).filter(
+        Notification.created_at.between(start_date, end_date),
+        Notification.is_read == False
+    )
     if user_id:
         notif_query = notif_query.filter(Notification.user_id == user_id)
-    unread_notifications = notif_query.filter(Notification.is_read == False).count()
+    unread_notifications = notif_query.scalar()
 
     # Top stokvel groups (not affected by filters)
-    top_groups = db.session.query(
-        StokvelGroup.name,
-        func.count(StokvelGroup.members)
-    ).group_by(StokvelGroup.id).order_by(func.count(StokvelGroup.members).desc()).limit(5).all()
+    member_count = func.count(StokvelMember.id)
+    top_groups = db.session.query(StokvelGroup.name, member_count) \
+        .outerjoin(StokvelMember, StokvelMember.group_id == StokvelGroup.id) \
+        .group_by(StokvelGroup.id, StokvelGroup.name).order_by(member_count.desc()).limit(5).all()
 
     return jsonify({
         "filters": {
@@ -4157,27 +5377,30 @@ def admin_analytics_overview():
             "recent_last_7_days": recent_users
         },
         "sessions": {
-            "total": total_sessions,
+            "total": metric_count('sessions'),
             "active": active_sessions
         },
         "transactions": {
-            "total": total_transactions,
-            "completed": completed_count,
-            "volume": float(total_volume),
-            "volume_by_type": {t[0]: float(t[1]) for t in txn_volume_by_type},
-            "daily_volume": [{"date": str(t[0]), "amount": float(t[1])} for t in txn_daily_volume]
+            "total": metric_count('transactions'),
+            "completed": metric_count('transactions', 'completed'),
+            "volume": float(sum(total for _, total in completed_by_type.values())),
+            "volume_by_type": {t: float(total) for t, (_, total) in completed_by_type.items()},
+            "daily_volume": [
+                {"date": day, "amount": float(total)}
+                for (metric, day), (_, total) in sorted(by_day.items()) if metric == 'completed_transactions'
+            ]
         },
         "contributions": {
-            "total": total_contributions,
-            "volume": float(contribution_volume)
+            "total": metric_count('contributions'),
+            "volume": float(sum(total for _, total in metric_rows('contributions').values()))
         },
         "referrals": {
-            "total": total_referrals,
-            "completed": completed_referrals
+            "total": sum(metric_count(metric) for metric in referral_statuses),
+            "completed": sum(metric_count(metric, 'completed') for metric in referral_statuses)
         },
         "chat": {
             "total_messages": total_messages,
-            "user": user_messages,
+            "user": total_messages - assistant_messages,
             "assistant": assistant_messages
         },
         "notifications": {
@@ -4203,12 +5426,11 @@ def get_faqs():
             query = query.filter(FAQ.is_published.is_(True))
         elif published.lower() == 'false':
             query = query.filter(FAQ.is_published.is_(False))
+    rank = None
     if search:
-        like = f"%{search}%"
-        query = query.filter(
-            or_(FAQ.question.ilike(like), FAQ.answer.ilike(like))
-        )
-    faqs = query.order_by(FAQ.created_at.desc()).all()
+        query, rank = text_search(query, FAQ, search, 'english', (FAQ.question, FAQ.answer))
+    order = (FAQ.created_at.desc(),) if rank is None else (rank.desc(), FAQ.created_at.desc())
+    faqs = query.order_by(*order).all()
     return jsonify([faq.to_dict() for faq in faqs]), 200
 
 @app.route('/api/admin/faqs', methods=['POST'])
@@ -4277,39 +5499,484 @@ def reject_withdrawal(withdrawal_id):
 
 
 
+# -------------------- REALTIME --------------------
+# Notifications are pushed to the owner's Socket.IO room ("user:<id>") once
+# the transaction that created them commits. Clients authenticate with their
+# access token when connecting and, after a reconnect, fetch anything they
+# missed with GET /api/user/notifications?since_id=<last id seen>.
+#
+# flask_socketio is only imported when the first /socket.io request arrives
+# or a notification has to be fanned out. With several workers, set
+# SOCKETIO_MESSAGE_QUEUE to a redis:// or amqp:// URL, or to "postgres" to
+# relay emits between workers through LISTEN/NOTIFY on the app database.
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+SOCKETIO_CORS_ORIGINS = os.getenv('SOCKETIO_CORS_ORIGINS', 'https://railway-9odz.onrender.com').split(',')
+
+def notification_to_dict(notification):
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'type': notification.type,
+        'data': notification.data,
+        'is_read': bool(notification.is_read),
+        'created_at': notification.created_at.isoformat() if notification.created_at else None
+    }
+
+def postgres_client_manager():
+    """Socket.IO client manager that relays emits between workers with Postgres LISTEN/NOTIFY"""
+    import select as io_select
+    import psycopg2
+    import socketio
+    from sqlalchemy.engine import make_url
+
+    class PostgresNotifyManager(socketio.PubSubManager):
+        name = 'postgres'
+
+        def __init__(self, dsn, channel='socketio'):
+            super().__init__(channel=channel)
+            self.dsn = dsn
+            self._publisher = None
+            self._publish_lock = threading.Lock()
+
+        def _publish(self, data):
+            with self._publish_lock:
+                if self._publisher is None or self._publisher.closed:
+                    self._publisher = psycopg2.connect(self.dsn)
+                    self._publisher.autocommit = True
+                with self._publisher.cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, json.dumps(data)))
+
+        def _listen(self):
+            connection = psycopg2.connect(self.dsn)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            while True:
+                if io_select.select([connection], [], [], 5) != ([], [], []):
+                    connection.poll()
+                    while connection.notifies:
+                        yield connection.notifies.pop(0).payload
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql')
+    return PostgresNotifyManager(url.render_as_string(hide_password=False))
+
+def user_id_from_token(token):
+    """Id of the existing user an access token belongs to, or None"""
+    if not token:
+        return None
+    try:
+        payload = pyjwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
+    except InvalidTokenError:
+        return None
+    facts = get_auth_facts(payload.get('user_id') or payload.get('sub'))
+    return facts['id'] if facts else None
+
+@lazy_singleton
+def get_socketio():
+    from flask_socketio import SocketIO, join_room
+
+    options = {'cors_allowed_origins': SOCKETIO_CORS_ORIGINS}
+    if SOCKETIO_MESSAGE_QUEUE == 'postgres':
+        options['client_manager'] = postgres_client_manager()
+    elif SOCKETIO_MESSAGE_QUEUE:
+        options['message_queue'] = SOCKETIO_MESSAGE_QUEUE
+    socketio = SocketIO(app, **options)
+
+    @socketio.on('connect')
+    def handle_connect(auth=None):
+        user_id = user_id_from_token((auth or {}).get('token') or request.args.get('token'))
+        if user_id is None:
+            return False
+        join_room(f'user:{user_id}')
+
+    return socketio
+
+class RealtimeMiddleware:
+    """Set up Socket.IO on the first /socket.io request, then hand over to it"""
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith('/socket.io') and not get_socketio.is_loaded():
+            get_socketio()
+            # SocketIO has now wrapped app.wsgi_app around this middleware
+            return app.wsgi_app(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = RealtimeMiddleware(app.wsgi_app)
+
+@event.listens_for(db.session, 'after_flush')
+def collect_new_notifications(session, flush_context):
+    pending = [(obj.user_id, notification_to_dict(obj)) for obj in session.new if isinstance(obj, Notification)]
+    if pending:
+        session.info.setdefault('pending_notifications', []).extend(pending)
+
+@event.listens_for(db.session, 'after_rollback')
+def drop_pending_notifications(session):
+    session.info.pop('pending_notifications', None)
+
+@event.listens_for(db.session, 'after_commit')
+def push_committed_notifications(session):
+    pending = session.info.pop('pending_notifications', None)
+    # Without a message queue only sockets connected to this process could receive them
+    if not pending or not (SOCKETIO_MESSAGE_QUEUE or get_socketio.is_loaded()):
+        return
+    try:
+        socketio = get_socketio()
+        for user_id, payload in pending:
+            socketio.emit('notification', payload, to=f'user:{user_id}')
+    except Exception:
+        logger.exception("Failed to push %d notifications", len(pending))
+
+NOTIFICATION_PAGE_LIMIT = 50
+NOTIFICATION_MAX_PAGE_LIMIT = 100
+
+def notification_feed(user_id):
+    """Response for a notification feed request, paged by since_id or cursor.
+
+    ?since_id= returns up to limit notifications created after that id, oldest
+    first, for catching up after a reconnect. ?cursor= ('' for the first page)
+    returns a keyset page, newest first, with the stored unread count. Without
+    either, the newest limit notifications are returned as a plain list.
+    """
+    limit = max(1, min(request.args.get('limit', NOTIFICATION_PAGE_LIMIT, type=int), NOTIFICATION_MAX_PAGE_LIMIT))
+    query = Notification.query.filter_by(user_id=user_id)
+
+    since_id = request.args.get('since_id', type=int)
+    if since_id is not None:
+        notifications = query.filter(Notification.id > since_id).order_by(Notification.id).limit(limit).all()
+        return jsonify([notification_to_dict(n) for n in notifications])
+
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            page = keyset_page(query, Notification, limit, cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        body = keyset_response(page, 'notifications', notification_to_dict, limit)
+        body['unread_count'] = unread_notification_count(user_id)
+        return jsonify(body)
+
+    notifications = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit).all()
+    return jsonify([notification_to_dict(n) for n in notifications])
+
+def unread_notification_count(user_id):
+    return db.session.execute(
+        select(User.unread_notification_count).where(User.id == user_id)
+    ).scalar() or 0
+
+# -------------------- OUTBOX --------------------
+# Request handlers never talk to SendGrid or Twilio. They add an
+# OutboundMessage to the session with enqueue_message() and commit. After the
+# commit a dispatcher thread claims due rows in batches (FOR UPDATE SKIP
+# LOCKED, so several processes can share the table), hands them to a small
+# thread pool that delivers over long-lived provider clients, and records the
+# outcome. Failures are retried with exponential backoff and jitter until
+# OUTBOX_MAX_ATTEMPTS, then left as 'failed'. A row whose worker died while it
+# was 'sending' is claimed again once its lease expires. Web workers start
+# their dispatcher on the first request, so rows left pending or waiting for
+# a retry by a previous process drain without anything new being enqueued.
+#   OUTBOX_PROVIDER        live (SendGrid/Twilio, default) or fake
+#   OUTBOX_WORKERS         delivery threads per process; 0 leaves delivery to `flask run-outbox`
+#   OUTBOX_BATCH_SIZE      rows claimed per round (default 100)
+#   OUTBOX_MAX_ATTEMPTS    attempts before a message is marked failed (default 5)
+OUTBOX_PROVIDER = os.getenv('OUTBOX_PROVIDER', 'live')
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_POLL_INTERVAL = 5
+OUTBOX_LEASE = timedelta(minutes=5)
+OUTBOX_RETRY_BASE = 30  # seconds; doubles with each attempt
+OUTBOX_RETRY_MAX = 3600
+PROVIDER_TIMEOUT = (3.05, 10)  # connect, read
+
+def enqueue_message(channel, recipient, body, subject=None):
+    """Add an outbound email or SMS to the session; it is delivered after the caller commits"""
+    message = OutboundMessage(channel=channel, recipient=recipient, subject=subject, body=body)
+    db.session.add(message)
+    return message
+
+def queue_verification_email(email, code):
+    return enqueue_message('email', email, f"Your verification code is: <strong>{code}</strong>",
+                           subject='Verify your iStokvel account')
+
+def queue_verification_sms(phone, code):
+    return enqueue_message('sms', phone, f"Your iStokvel verification code is: {code}")
+
+def retry_delay(attempts, base=OUTBOX_RETRY_BASE):
+    """Seconds to wait before the next attempt, with jitter so failed batches spread out"""
+    delay = min(base * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+    return delay * random.uniform(0.75, 1.25)
+
+class SendGridProvider:
+    """Email over the SendGrid v3 API on one keep-alive session, up to 1000 recipients per call"""
+    batch_size = 1000
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=OUTBOX_WORKERS or 1))
+
+    def deliver(self, messages):
+        """Send [(id, recipient, subject, body)] and return {id: error or None}"""
+        api_key = os.environ.get('SENDGRID_API_KEY')
+        from_email = app.config.get('SENDGRID_FROM_EMAIL')
+        if not (api_key and from_email):
+            return {m[0]: 'SendGrid is not configured' for m in messages}
+        status, error = self._send(messages, api_key, from_email)
+        if status == 400 and 'personalizations' in error and len(messages) > 1:
+            # One bad address rejects the whole request; find it by sending the rest singly.
+            # Anything else (timeouts, 429, 5xx, auth) may have been accepted or will fail
+            # the same way, so the whole batch goes back to record() for backoff.
+            return {m[0]: self._send([m], api_key, from_email)[1] for m in messages}
+        return {m[0]: error for m in messages}
+
+    def _send(self, messages, api_key, from_email):
+        """POST one batch; returns (status code or None, error or None)"""
+        # Each message is its own personalization; its body is substituted into the shared content
+        payload = {
+            'from': {'email': from_email},
+            'subject': messages[0][2] or '',
+            'personalizations': [
+                {'to': [{'email': recipient}], 'subject': subject or '', 'substitutions': {'-body-': body}}
+                for _, recipient, subject, body in messages
+            ],
+            'content': [{'type': 'text/html', 'value': '-body-'}]
+        }
+        try:
+            response = self.session.post('https://api.sendgrid.com/v3/mail/send', json=payload,
+                                         headers={'Authorization': f'Bearer {api_key}'}, timeout=PROVIDER_TIMEOUT)
+        except requests.RequestException as e:
+            return None, str(e)
+        if 200 <= response.status_code < 300:
+            return response.status_code, None
+        return response.status_code, f"SendGrid returned {response.status_code}: {response.text[:200]}"
+
+class TwilioProvider:
+    """SMS through one Twilio client, whose HTTP session keeps connections open"""
+    batch_size = 1
+
+    @property
+    def client(self):
+        if not hasattr(self, '_client'):
+            from twilio.rest import Client
+            self._client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+        return self._client
+
+    def deliver(self, messages):
+        from_number = os.getenv('TWILIO_PHONE_NUMBER')
+        if not all([os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'), from_number]):
+            return {m[0]: 'Twilio credentials missing' for m in messages}
+        results = {}
+        for message_id, recipient, _, body in messages:
+            try:
+                sent = self.client.messages.create(body=body, from_=from_number, to=recipient)
+                logger.info("Sent SMS %s", sent.sid)
+                results[message_id] = None
+            except Exception as e:
+                results[message_id] = str(e)
+        return results
+
+class FakeProvider:
+    """Records deliveries in memory instead of sending them, for tests and load benchmarks"""
+    def __init__(self, latency=0.0, failure_rate=0.0, batch_size=1000):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.batch_size = batch_size
+        self.sent = []
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def deliver(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        results = {}
+        with self._lock:
+            self.requests += 1
+            for message in messages:
+                if random.random() < self.failure_rate:
+                    results[message[0]] = 'Fake provider failure'
+                else:
+                    self.sent.append(message)
+                    results[message[0]] = None
+        return results
+
+def outbox_providers():
+    if OUTBOX_PROVIDER == 'fake':
+        latency = float(os.getenv('OUTBOX_FAKE_LATENCY', 0))
+        failure_rate = float(os.getenv('OUTBOX_FAKE_FAILURE_RATE', 0))
+        return {'email': FakeProvider(latency, failure_rate), 'sms': FakeProvider(latency, failure_rate, batch_size=1)}
+    return {'email': SendGridProvider(), 'sms': TwilioProvider()}
+
+class OutboxDispatcher:
+    """Claim due outbox rows and deliver them on a thread pool"""
+    def __init__(self, providers, workers=OUTBOX_WORKERS, batch_size=OUTBOX_BATCH_SIZE, retry_base=OUTBOX_RETRY_BASE):
+        from concurrent.futures import ThreadPoolExecutor
+        self.providers = providers
+        self.batch_size = batch_size
+        self.retry_base = retry_base
+        self.pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='outbox')
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name='outbox-dispatcher', daemon=True).start()
+        return self
+
+    def run(self, drain=False):
+        """Deliver until stopped, or until nothing is due when drain is set"""
+        with app.app_context():
+            while not self.stopping.is_set():
+                try:
+                    claimed = self.dispatch_once()
+                except Exception:
+                    logger.exception("Outbox dispatch failed")
+                    db.session.rollback()
+                    claimed = 0
+                if drain and not claimed:
+                    return
+                if drain or claimed == self.batch_size:
+                    continue
+                self.wakeup.wait(OUTBOX_POLL_INTERVAL)
+                self.wakeup.clear()
+
+    def dispatch_once(self):
+        """Claim one batch of due messages, deliver it and record the results; returns the batch size"""
+        now = datetime.utcnow()
+        rows = OutboundMessage.query.filter(
+            OutboundMessage.status.in_(('pending', 'sending')),
+            OutboundMessage.next_attempt_at <= now
+        ).order_by(OutboundMessage.next_attempt_at).limit(self.batch_size).with_for_update(skip_locked=True).all()
+        if not rows:
+            db.session.rollback()
+            return 0
+
+        due = {'email': [], 'sms': []}
+        attempts = {}
+        for row in rows:
+            if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                # Its last worker died mid-send
+                row.status = 'failed'
+                continue
+            row.status = 'sending'
+            row.attempts += 1
+            row.next_attempt_at = now + OUTBOX_LEASE
+            attempts[row.id] = row.attempts
+            due.setdefault(row.channel, []).append((row.id, row.recipient, row.subject, row.body))
+        db.session.commit()
+
+        results = {}
+        futures = []
+        for channel, messages in due.items():
+            provider = self.providers.get(channel)
+            if provider is None:
+                results.update((m[0], f'No provider for {channel}') for m in messages)
+                continue
+            for start in range(0, len(messages), provider.batch_size):
+                futures.append(self.pool.submit(self.deliver, provider, messages[start:start + provider.batch_size]))
+        for future in futures:
+            results.update(future.result())
+        self.record(results, attempts)
+        return len(rows)
+
+    @staticmethod
+    def deliver(provider, messages):
+        try:
+            return provider.deliver(messages)
+        except Exception as e:
+            logger.exception("Outbox provider %s crashed", type(provider).__name__)
+            return {m[0]: str(e) for m in messages}
+
+    def record(self, results, attempts):
+        now = datetime.utcnow()
+        table = OutboundMessage.__table__
+        sent = [message_id for message_id, error in results.items() if error is None]
+        if sent:
+            # Bodies carry one-time codes, so they are not kept once delivered
+            db.session.execute(update(table).where(table.c.id.in_(sent))
+                               .values(status='sent', sent_at=now, last_error=None, body=''))
+        for message_id, error in results.items():
+            if error is None:
+                continue
+            logger.warning("Outbound message %s failed (attempt %s): %s", message_id, attempts[message_id], error)
+            if attempts[message_id] >= OUTBOX_MAX_ATTEMPTS:
+                values = {'status': 'failed', 'last_error': error, 'body': ''}
+            else:
+                values = {'status': 'pending', 'last_error': error,
+                          'next_attempt_at': now + timedelta(seconds=retry_delay(attempts[message_id], self.retry_base))}
+            db.session.execute(update(table).where(table.c.id == message_id).values(**values))
+        db.session.commit()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.pool.shutdown(wait=True)
+
+@lazy_singleton
+def get_outbox_dispatcher():
+    dispatcher = OutboxDispatcher(outbox_providers()).start()
+    atexit.register(dispatcher.stop)
+    return dispatcher
+
+@app.before_request
+def start_outbox_dispatcher():
+    if OUTBOX_WORKERS > 0 and not get_outbox_dispatcher.is_loaded():
+        get_outbox_dispatcher()
+
+@event.listens_for(db.session, 'after_flush')
+def note_new_outbound_messages(session, flush_context):
+    if any(isinstance(obj, OutboundMessage) for obj in session.new):
+        session.info['outbox_pending'] = True
+
+@event.listens_for(db.session, 'after_rollback')
+def drop_outbox_wakeup(session):
+    session.info.pop('outbox_pending', None)
+
+@event.listens_for(db.session, 'after_commit')
+def wake_outbox_dispatcher(session):
+    if session.info.pop('outbox_pending', None) and session.info.get('outbox_autostart', OUTBOX_WORKERS > 0):
+        get_outbox_dispatcher().wakeup.set()
+
 # ----------------------------------------------------------------------------------------------------Notifications
 @app.route('/api/user/notifications', methods=['GET'])
 @jwt_required()
 def get_user_notifications():
     user_id = get_jwt_identity()
-    notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.created_at.desc()).all()
-    
-    return jsonify([{
-        'id': n.id,
-        'title': n.title,
-        'message': n.message,
-        'type': n.type,
-        'data': n.data,
-        'is_read': n.is_read,
-        'created_at': n.created_at.isoformat()
-    } for n in notifications])
+    return notification_feed(user_id)
+
+@app.route('/api/user/notifications/unread-count', methods=['GET'])
+@jwt_required()
+def get_unread_notification_count():
+    return jsonify({'unread_count': unread_notification_count(get_jwt_identity())})
 
 @app.route('/api/user/notifications/<int:notification_id>/read', methods=['POST'])
 @jwt_required()
 def mark_notification_read(notification_id):
     user_id = get_jwt_identity()
-    notification = Notification.query.filter_by(id=notification_id, user_id=user_id).first()
-    
-    if notification:
-        notification.is_read = True
-        db.session.commit()
+    mark_notifications_read(user_id, ids=[notification_id])
+    db.session.commit()
     
     return jsonify({'message': 'Notification marked as read'})
 
 @app.route('/api/user/notifications/mark-as-read', methods=['POST'])
 @token_required
 def mark_notifications_as_read(current_user):
-    return jsonify({'message': 'Not implemented'}), 501
+    """Mark the given notification_ids read, or all of them (up to up_to_id) when none are given"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('notification_ids')
+    up_to_id = data.get('up_to_id')
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+        return jsonify({'error': 'notification_ids must be a list of ids'}), 400
+    if up_to_id is not None and not isinstance(up_to_id, int):
+        return jsonify({'error': 'up_to_id must be an id'}), 400
+
+    updated = mark_notifications_read(current_user.id, ids=ids, up_to_id=up_to_id)
+    db.session.commit()
+    return jsonify({
+        'message': 'Notifications marked as read',
+        'updated': updated,
+        'unread_count': unread_notification_count(current_user.id)
+    })
 
 # Send notification to user
 @app.route('/api/notifications/send', methods=['POST'])
@@ -4400,6 +6067,169 @@ def submit_contact():
 
 
 # ---------------------------------------------------------------------------------------------------Chat routes
+# The assistant never sees a conversation's full history. Each turn sends the
+# system prompt, a stored running summary of older turns, and the latest
+# CHAT_CONTEXT_MESSAGES messages. Once CHAT_SUMMARY_BATCH messages have fallen
+# out of that window they are folded into the summary with one extra LLM call,
+# so prompt size stays flat however long the conversation gets. That call runs
+# on a background thread after the reply, bounded by CHAT_SUMMARY_TIMEOUT.
+#   LLM_BASE_URL            OpenAI-compatible endpoint (default OpenRouter; see `flask fake-llm`)
+#   CHAT_MODEL              model used by /api/message
+#   CHAT_CONTEXT_MESSAGES   recent messages sent verbatim (default 12)
+#   CHAT_SUMMARY_BATCH      messages outside the window before the summary is refreshed (default 8)
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'deepseek/deepseek-chat-v3-0324:free')
+CHAT_CONTEXT_MESSAGES = int(os.getenv('CHAT_CONTEXT_MESSAGES', 12))
+CHAT_SUMMARY_BATCH = int(os.getenv('CHAT_SUMMARY_BATCH', 8))
+CHAT_MAX_TOKENS = 150
+CHAT_SUMMARY_MAX_TOKENS = 200
+CHAT_SUMMARY_TIMEOUT = 30  # seconds
+CHAT_SYSTEM_PROMPT = 'You are a helpful assistant. Answer concisely in 1-3 sentences.'
+CHAT_HEADERS = {
+    "HTTP-Referer": os.getenv('FRONTEND_URL', 'http://localhost:3000'),
+    "X-Title": "Stokvel Assistant",
+}
+
+def recent_chat_messages(conversation_id, limit=CHAT_CONTEXT_MESSAGES):
+    """The latest non-system messages of a conversation, oldest first"""
+    recent = (Message.query
+              .filter(Message.conversation_id == conversation_id, Message.role != 'system')
+              .order_by(Message.created_at.desc())
+              .limit(limit)
+              .all())
+    return recent[::-1]
+
+def chat_context(conversation):
+    """Messages to send to the LLM: system prompt, running summary and the recent window"""
+    system = (Message.query
+              .filter_by(conversation_id=conversation.id, role='system')
+              .order_by(Message.created_at)
+              .first())
+    messages = [{"role": "system", "content": system.content if system else CHAT_SYSTEM_PROMPT}]
+    if conversation.summary:
+        messages.append({"role": "system", "content": f"Summary of the conversation so far: {conversation.summary}"})
+    messages.extend({"role": m.role, "content": m.content} for m in recent_chat_messages(conversation.id))
+    return messages
+
+def refresh_chat_summary(conversation_id):
+    """Fold messages that have left the context window into the conversation's summary.
+
+    Does nothing until CHAT_SUMMARY_BATCH such messages have built up. A
+    failed summary call is logged and retried on a later turn.
+    """
+    conversation = db.session.get(Conversation, conversation_id)
+    window = recent_chat_messages(conversation_id)
+    if len(window) < CHAT_CONTEXT_MESSAGES:
+        return False
+
+    query = Message.query.filter(
+        Message.conversation_id == conversation_id,
+        Message.role != 'system',
+        Message.created_at < window[0].created_at
+    )
+    if conversation.summary_through:
+        query = query.filter(Message.created_at > conversation.summary_through)
+    if query.count() < CHAT_SUMMARY_BATCH:
+        return False
+
+    older = query.order_by(Message.created_at).all()
+    transcript = "\n".join(f"{m.role}: {m.content}" for m in older)
+    if conversation.summary:
+        transcript = f"Summary so far: {conversation.summary}\n\n{transcript}"
+    try:
+        completion = get_llm_client().with_options(timeout=CHAT_SUMMARY_TIMEOUT, max_retries=0).chat.completions.create(
+            extra_headers=CHAT_HEADERS,
+            model=CHAT_MODEL,
+            messages=[
+                {"role": "system", "content": "Summarise this conversation between a stokvel member and an "
+                                              "assistant in at most 5 sentences. Keep names, amounts and decisions."},
+                {"role": "user", "content": transcript},
+            ],
+            max_tokens=CHAT_SUMMARY_MAX_TOKENS
+        )
+    except Exception:
+        logger.exception("Chat summary failed for conversation %s", conversation_id)
+        return False
+
+    conversation.summary = completion.choices[0].message.content
+    conversation.summary_through = older[-1].created_at
+    db.session.commit()
+    return True
+
+_chat_summaries_running = set()
+_chat_summaries_lock = threading.Lock()
+
+@lazy_singleton
+def get_chat_summary_pool():
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-summary')
+    atexit.register(pool.shutdown, wait=False)
+    return pool
+
+def schedule_chat_summary(conversation_id):
+    """Run refresh_chat_summary off the request, at most once at a time per conversation"""
+    with _chat_summaries_lock:
+        if conversation_id in _chat_summaries_running:
+            return
+        _chat_summaries_running.add(conversation_id)
+
+    def run():
+        try:
+            with app.app_context():
+                refresh_chat_summary(conversation_id)
+        except Exception:
+            logger.exception("Chat summary failed for conversation %s", conversation_id)
+        finally:
+            with _chat_summaries_lock:
+                _chat_summaries_running.discard(conversation_id)
+
+    get_chat_summary_pool().submit(run)
+
+def sse_event(data, event=None):
+    """Format one server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def stream_chat_reply(conversation_id, messages):
+    """Yield the assistant's reply as SSE token events, then a done (or error) event.
+
+    The reply is saved when the stream ends. If the client disconnects part
+    way through, whatever was generated so far is saved and the upstream
+    request is closed.
+    """
+    parts = []
+    stream = None
+    assistant_msg = None
+    try:
+        stream = get_llm_client().chat.completions.create(
+            extra_headers=CHAT_HEADERS,
+            model=CHAT_MODEL,
+            messages=messages,
+            max_tokens=CHAT_MAX_TOKENS,
+            stream=True
+        )
+        for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                parts.append(token)
+                yield sse_event({"token": token})
+    except Exception as e:
+        logger.exception("Chat completion failed")
+        yield sse_event({"error": str(e)}, event='error')
+        return
+    finally:
+        if stream is not None:
+            stream.close()
+        if parts:
+            assistant_msg = Message(conversation_id=conversation_id, role='assistant', content=''.join(parts))
+            db.session.add(assistant_msg)
+            db.session.commit()
+
+    schedule_chat_summary(conversation_id)
+    yield sse_event({
+        "conversation_id": conversation_id,
+        "message_id": assistant_msg.id if assistant_msg else None
+    }, event='done')
+
 @app.route('/api/start', methods=['POST'])
 @token_required
 def start_chat(current_user):
@@ -4422,7 +6252,7 @@ def start_chat(current_user):
     system_message = Message(
         conversation_id=conversation.id,
         role='system',
-        content='You are a helpful assistant. Answer concisely in 1-3 sentences.'
+        content=CHAT_SYSTEM_PROMPT
     )
     db.session.add(system_message)
     db.session.commit()
@@ -4432,9 +6262,12 @@ def start_chat(current_user):
 @app.route('/api/message', methods=['POST'])
 @token_required
 def send_message(current_user):
-    data = request.get_json()
+    """Reply to a chat message; streams tokens as server-sent events with ?stream=true"""
+    data = request.get_json() or {}
     conversation_id = data.get('conversation_id')
     user_message = data.get('message')
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
 
     conversation = Conversation.query.filter_by(id=conversation_id, user_id=current_user.id).first()
     if not conversation:
@@ -4449,22 +6282,21 @@ def send_message(current_user):
     db.session.add(user_msg)
     db.session.commit()
 
-    # Fetch all messages for OpenAI context
-    messages = [
-        {"role": m.role, "content": m.content}
-        for m in Message.query.filter_by(conversation_id=conversation_id).order_by(Message.created_at).all()
-    ]
+    messages = chat_context(conversation)
+
+    if request.args.get('stream') == 'true' or request.accept_mimetypes.best == 'text/event-stream':
+        return Response(
+            stream_with_context(stream_chat_reply(conversation_id, messages)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
-    # Call OpenRouter API
     try:
-        completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": os.getenv('FRONTEND_URL', 'http://localhost:3000'),
-                "X-Title": "Stokvel Assistant",
-            },
-            model="deepseek/deepseek-chat-v3-0324:free",
+        completion = get_llm_client().chat.completions.create(
+            extra_headers=CHAT_HEADERS,
+            model=CHAT_MODEL,
             messages=messages,
-            max_tokens=150
+            max_tokens=CHAT_MAX_TOKENS
         )
         ai_response = completion.choices[0].message.content
 
@@ -4476,62 +6308,216 @@ def send_message(current_user):
         )
         db.session.add(assistant_msg)
         db.session.commit()
-
-        return jsonify({
-            "response": ai_response,
-            "conversation_id": conversation_id
-        })
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Chat completion failed")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    about_us_text = """
+    schedule_chat_summary(conversation_id)
+    return jsonify({
+        "response": ai_response,
+        "conversation_id": conversation_id
+    })
+
+# /api/chat is public and mostly sees the same few questions. Questions are
+# normalised (case, punctuation, spacing) and answered, in order, from a
+# published FAQ with the same wording, from an in-process LRU+TTL cache of
+# earlier answers, and only then from OpenRouter. Upstream calls share one
+# pooled session with connect/read timeouts, and a circuit breaker fails fast
+# with a 503 while OpenRouter keeps failing instead of tying up workers.
+# Committed FAQ edits clear the FAQ index and the answer cache in the worker
+# that made them; other workers see them when their index expires, after at
+# most five minutes.
+#   CHAT_ANSWER_CACHE_SIZE    answers kept per process (default 1000)
+#   CHAT_ANSWER_CACHE_TTL     seconds an answer is reused (default 3600)
+#   CHAT_FAQ_FIRST            answer from matching FAQs before the LLM (default true)
+#   CHAT_FAQ_LOOSE_MATCH      also match FAQs that differ only by stopwords (default false)
+#   OPENROUTER_READ_TIMEOUT   seconds to wait for a completion (default 20)
+CHAT_ANSWER_CACHE_SIZE = int(os.getenv('CHAT_ANSWER_CACHE_SIZE', 1000))
+CHAT_ANSWER_CACHE_TTL = int(os.getenv('CHAT_ANSWER_CACHE_TTL', 3600))
+CHAT_FAQ_FIRST = os.getenv('CHAT_FAQ_FIRST', 'true').lower() == 'true'
+CHAT_FAQ_LOOSE_MATCH = os.getenv('CHAT_FAQ_LOOSE_MATCH', 'false').lower() == 'true'
+CHAT_FAQ_STOPWORDS = frozenset(
+    'a an the i we you my our your me us is are am be do does can could would should will '
+    'to of in on for at with and or please'.split()
+)
+OPENROUTER_TIMEOUT = (3.05, float(os.getenv('OPENROUTER_READ_TIMEOUT', 20)))  # connect, read
+OPENROUTER_POOL_SIZE = 20
+ABOUT_US_TEXT = """
     Welcome to our service! We provide a secure and user-friendly digital wallet solution. 
     Feel free to ask me any questions about our platform.
     """
 
-    data = request.get_json()
-    user_message = data.get('message')
-    if not user_message:
-        return jsonify({'error': 'No message provided'}), 400
+answer_cache = TTLCache(CHAT_ANSWER_CACHE_SIZE, CHAT_ANSWER_CACHE_TTL)
+faq_index_cache = TTLCache(1, 300)
 
-    try:
-        api_key = os.getenv('OPENROUTER_API_KEY')
-        if not api_key:
-            return jsonify({'error': 'OpenRouter API key not set'}), 500
+class CircuitOpenError(Exception):
+    pass
 
-        payload = {
+class CircuitBreaker:
+    """Stop calling a failing upstream for reset_timeout seconds after `threshold` failures in a row.
+
+    Once the timeout has passed a single trial call is let through; success
+    closes the circuit and failure opens it again.
+    """
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+openrouter_breaker = CircuitBreaker(
+    threshold=int(os.getenv('OPENROUTER_BREAKER_THRESHOLD', 5)),
+    reset_timeout=int(os.getenv('OPENROUTER_BREAKER_RESET', 30))
+)
+
+@lazy_singleton
+def get_openrouter_session():
+    """Keep-alive session shared by every /api/chat request"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=OPENROUTER_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def normalize_question(text):
+    """Lower-case, strip punctuation and collapse whitespace so equivalent questions share a key"""
+    return ' '.join(re.sub(r"[^\w\s]", ' ', text.lower()).split())
+
+def faq_index():
+    """{normalised question: answer} for published FAQs, rebuilt at most every five minutes"""
+    index = faq_index_cache.get('faqs')
+    if index is None:
+        generation = faq_index_cache.generation
+        rows = db.session.execute(select(FAQ.question, FAQ.answer).where(FAQ.is_published.is_(True))).all()
+        index = {normalize_question(question): answer for question, answer in rows}
+        faq_index_cache.set('faqs', index, generation)
+    return index
+
+@event.listens_for(FAQ, 'after_insert')
+@event.listens_for(FAQ, 'after_update')
+@event.listens_for(FAQ, 'after_delete')
+def note_faq_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['faqs_changed'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_faq_index(session):
+    if session.info.pop('faqs_changed', None):
+        faq_index_cache.clear()
+        answer_cache.clear()
+
+@event.listens_for(db.session, 'after_rollback')
+def keep_faq_index(session):
+    session.info.pop('faqs_changed', None)
+
+def match_faq(question):
+    """Answer of the published FAQ with the same normalised wording, or None.
+
+    With CHAT_FAQ_LOOSE_MATCH an FAQ also matches when the only words the two
+    questions do not share are stopwords; a single differing content word
+    ("deposit" against "withdraw") never matches.
+    """
+    index = faq_index()
+    if question in index or not CHAT_FAQ_LOOSE_MATCH:
+        return index.get(question)
+    words = set(question.split())
+    for faq_question, answer in index.items():
+        differing = words ^ set(faq_question.split())
+        if differing <= CHAT_FAQ_STOPWORDS and words - CHAT_FAQ_STOPWORDS:
+            return answer
+    return None
+
+def openrouter_answer(message, api_key):
+    """Ask OpenRouter for an answer to a visitor's question"""
+    response = get_openrouter_session().post(
+        f"{os.getenv('LLM_BASE_URL', 'https://openrouter.ai/api/v1')}/chat/completions",
+        json={
             "model": "deepseek/deepseek-r1-distill-llama-70b:free",
             "messages": [
-                {"role": "system", "content": about_us_text},
-                {"role": "user", "content": user_message}
+                {"role": "system", "content": ABOUT_US_TEXT},
+                {"role": "user", "content": message}
             ],
             "max_tokens": 150
-        }
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            json=payload,
-            headers=headers
-        )
-        if response.status_code != 200:
-            print("OpenRouter error:", response.text)
-            return jsonify({'error': f'OpenRouter error: {response.text}'}), 500
+        },
+        headers={"Authorization": f"Bearer {api_key}"},
+        timeout=OPENROUTER_TIMEOUT
+    )
+    if response.status_code != 200:
+        logger.error("OpenRouter error: %s", response.text)
+        response.raise_for_status()
+    return response.json()['choices'][0]['message']['content']
 
-        data = response.json()
-        answer = data['choices'][0]['message']['content']
-        return jsonify({'answer': answer})
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    data = request.get_json() or {}
+    user_message = data.get('message')
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+
+    question = normalize_question(user_message)
+    if CHAT_FAQ_FIRST:
+        answer = match_faq(question)
+        if answer:
+            return jsonify({'answer': answer, 'source': 'faq'})
+    answer = answer_cache.get(question)
+    if answer:
+        return jsonify({'answer': answer, 'source': 'cache'})
+
+    api_key = os.getenv('OPENROUTER_API_KEY')
+    if not api_key:
+        return jsonify({'error': 'OpenRouter API key not set'}), 500
+
+    generation = answer_cache.generation
+    try:
+        answer = openrouter_breaker.call(openrouter_answer, user_message, api_key)
+    except CircuitOpenError:
+        return jsonify({'error': 'The assistant is temporarily unavailable. Please try again shortly.'}), 503
+    except requests.Timeout:
+        logger.warning("OpenRouter timed out")
+        return jsonify({'error': 'The assistant took too long to answer. Please try again.'}), 504
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Chat completion failed")
         return jsonify({'error': str(e)}), 500
 
+    answer_cache.set(question, answer, generation)
+    return jsonify({'answer': answer, 'source': 'llm'})
+
 
 # ------------------------------------------------------------------------------------------------------ routes
 @app.route('/api/test-email', methods=['POST'])
@@ -4617,6 +6603,890 @@ def init_db():
     db.create_all()
     click.echo('Initialized the database.')
 
+@app.cli.command('bench-startup')
+@click.option('--top', default=15, help='Number of modules to list')
+@click.option('--runs', default=3, help='Fresh interpreters to average over')
+def bench_startup(top, runs):
+    """Report the import cost of app.py per top-level module"""
+    totals = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import app'],
+            cwd=app.root_path, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            click.echo(click.style(result.stderr.strip().splitlines()[-1], fg='red'))
+            raise SystemExit(1)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            # depth 0 is app itself, depth 1 are the modules it imports directly
+            if depth <= 1:
+                name = name.strip()
+                totals[name] = totals.get(name, 0) + int(cumulative)
+
+    app_ms = totals.pop('app', 0) / runs / 1000
+    click.echo(f"import app: {app_ms:.1f} ms (mean of {runs} runs)")
+    for name, micros in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]:
+        click.echo(f"  {name:<40} {micros / runs / 1000:8.1f} ms")
+
+    eager = sorted({name.split('.')[0] for name in totals} & set(LAZY_MODULES))
+    if eager:
+        click.echo(click.style(f"Lazy modules imported at startup: {', '.join(eager)}", fg='red'))
+        raise SystemExit(1)
+    click.echo(click.style('No lazy modules imported at startup.', fg='green'))
+
+@app.cli.command('bench-transfers')
+@click.option('--accounts', default=20, show_default=True, help='Number of bench wallets.')
+@click.option('--workers', default=8, show_default=True, help='Concurrent worker threads.')
+@click.option('--transfers', default=500, show_default=True, help='Total transfers to attempt.')
+@click.option('--amount', default=10.0, show_default=True, help='Amount per transfer.')
+@click.option('--opening-balance', default=100.0, show_default=True, help='Opening balance per bench wallet.')
+@click.option('--cleanup/--no-cleanup', default=True, show_default=True, help='Delete bench users afterwards.')
+@with_appcontext
+def bench_transfers(accounts, workers, transfers, amount, opening_balance, cleanup):
+    """Run concurrent random transfers between bench wallets and verify ledger invariants"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    run_id = uuid.uuid4().hex[:8]
+    users = []
+    for i in range(accounts):
+        user = User(
+            full_name=f'Bench {run_id} {i}',
+            email=f'bench-{run_id}-{i}@bench.invalid',
+            phone=f'+bench{run_id}{i}',
+            account_number=generate_account_number(),
+            is_verified=True
+        )
+        user.set_password(uuid.uuid4().hex)
+        users.append(user)
+    db.session.add_all(users)
+    db.session.commit()
+    user_ids = [user.id for user in users]
+    for user_id in user_ids:
+        post_ledger([ledger_leg(user_id, opening_balance, 'deposit', opening_balance, 'Bench opening balance')])
+    expected_total = opening_balance * accounts
+
+    def worker(count):
+        counts = {'ok': 0, 'insufficient': 0, 'error': 0}
+        with app.app_context():
+            for _ in range(count):
+                sender_id, recipient_id = random.sample(user_ids, 2)
+                sender, recipient = db.session.get(User, sender_id), db.session.get(User, recipient_id)
+                try:
+                    transfer_funds(sender, recipient, amount)
+                    counts['ok'] += 1
+                except InsufficientFundsError:
+                    counts['insufficient'] += 1
+                except Exception as e:
+                    counts['error'] += 1
+                    logger.warning("Bench transfer failed: %s", str(e).splitlines()[0])
+            db.session.remove()
+        return counts
+
+    shares = [transfers // workers + (1 if i < transfers % workers else 0) for i in range(workers)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - started
+
+    totals = {key: sum(result[key] for result in results) for key in ('ok', 'insufficient', 'error')}
+    click.echo(f"{transfers} transfers over {workers} workers in {elapsed:.2f}s "
+               f"({transfers / elapsed:.1f}/s): {totals['ok']} ok, "
+               f"{totals['insufficient']} insufficient funds, {totals['error']} errors")
+
+    db.session.expire_all()
+    balances = dict(db.session.execute(
+        select(Wallet.user_id, Wallet.balance).where(Wallet.user_id.in_(user_ids))
+    ).all())
+    ledger = dict(db.session.execute(
+        select(Transaction.user_id, func.sum(Transaction.net_amount))
+        .where(Transaction.user_id.in_(user_ids))
+        .group_by(Transaction.user_id)
+    ).all())
+    problems = []
+    if abs(sum(balances.values()) - expected_total) > 0.005:
+        problems.append(f"total balance {sum(balances.values()):.2f} != {expected_total:.2f}")
+    problems += [f"wallet of user {uid} is negative ({balance:.2f})" for uid, balance in balances.items() if balance < 0]
+    problems += [f"wallet of user {uid} is {balance:.2f} but its ledger sums to {ledger.get(uid, 0):.2f}"
+                 for uid, balance in balances.items() if abs(balance - (ledger.get(uid) or 0)) > 0.005]
+
+    if cleanup:
+        Notification.query.filter(Notification.user_id.in_(user_ids)).delete(synchronize_session=False)
+        Transaction.query.filter(Transaction.user_id.in_(user_ids)).delete(synchronize_session=False)
+        DailyTransactionTotal.query.filter(DailyTransactionTotal.user_id.in_(user_ids)).delete(synchronize_session=False)
+        Wallet.query.filter(Wallet.user_id.in_(user_ids)).delete(synchronize_session=False)
+        User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+    if problems:
+        for problem in problems:
+            click.echo(click.style(problem, fg='red'))
+        raise SystemExit(1)
+    click.echo(click.style('Ledger invariants hold.', fg='green'))
+
+@app.cli.command('backfill-daily-totals')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Only rebuild counters from this day (YYYY-MM-DD) onwards. Defaults to all history.')
+@with_appcontext
+def backfill_daily_totals(since):
+    """Rebuild the daily limit counters from existing transactions"""
+    from sqlalchemy import insert
+    day = func.date(func.coalesce(Transaction.completed_at, Transaction.created_at))
+    counted = Transaction.status == 'completed'
+    counted &= ~((Transaction.transaction_type == 'transfer') & (Transaction.amount > 0))
+    if since:
+        counted &= day >= since.date().isoformat()
+
+    rows = select(
+        Transaction.user_id, day, Transaction.transaction_type,
+        func.sum(func.abs(Transaction.amount)), func.count(Transaction.id), func.now()
+    ).where(counted).group_by(Transaction.user_id, day, Transaction.transaction_type)
+
+    try:
+        cleared = DailyTransactionTotal.query
+        if since:
+            cleared = cleared.filter(DailyTransactionTotal.day >= since.date())
+        cleared = cleared.delete(synchronize_session=False)
+        # Insert into the Table, not the mapped class: the ORM-enabled insert
+        # goes through the bulk-insert path, which doesn't promise a rowcount
+        result = db.session.execute(insert(DailyTransactionTotal.__table__).from_select(
+            ['user_id', 'day', 'transaction_type', 'total', 'count', 'updated_at'], rows
+        ))
+        db.session.commit()
+        click.echo(f"Replaced {cleared} counters with {result.rowcount} rebuilt from transactions.")
+    except Exception as e:
+        db.session.rollback()
+        click.echo(click.style(f"Error rebuilding daily totals: {str(e)}", fg='red'))
+        raise SystemExit(1)
+
+@app.cli.command('bench-export')
+@click.option('--rows', default=200000, show_default=True, help='Transactions to seed for the bench user.')
+@click.option('--mode', type=click.Choice(['buffered', 'streaming', 'gzip']), default=None,
+              help='Run a single export mode in this process (used internally).')
+@click.option('--user-id', type=int, default=None, help='User to export for with --mode.')
+@with_appcontext
+def bench_export(rows, mode, user_id):
+    """Compare peak RSS of the buffered and streaming CSV exports"""
+    import resource
+
+    def rss_mb():
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2**20
+
+    if mode:
+        start_date, end_date = datetime(1970, 1, 1), datetime.utcnow()
+        before = rss_mb()
+        started = time.perf_counter()
+        size = 0
+        if mode == 'buffered':
+            # The previous implementation: load everything, then build the CSV in memory
+            import csv
+            from io import StringIO
+            transactions = Transaction.query.filter(
+                Transaction.user_id == user_id,
+                Transaction.created_at >= start_date,
+                Transaction.created_at <= end_date
+            ).order_by(Transaction.created_at.desc()).all()
+            output = StringIO()
+            writer = csv.writer(output)
+            for tx in transactions:
+                writer.writerow([tx.created_at.strftime('%Y-%m-%d %H:%M:%S'), tx.transaction_type,
+                                 f"R{tx.amount:.2f}", f"R{tx.fee:.2f}", f"R{tx.net_amount:.2f}",
+                                 tx.status, tx.reference, tx.description])
+            size = len(output.getvalue().encode('utf-8'))
+        else:
+            chunks = iter_transactions_csv(user_id, start_date, end_date)
+            if mode == 'gzip':
+                chunks = gzip_chunks(chunks)
+            for chunk in chunks:
+                size += len(chunk)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        click.echo(f"{mode:<10} {time.perf_counter() - started:7.2f}s  {size / 2**20:8.1f} MB out  "
+                   f"peak RSS {peak:7.1f} MB (+{peak - before:.1f} MB over baseline)")
+        return
+
+    bench_user = User(full_name='Export Bench', email=f'export-{uuid.uuid4().hex[:8]}@bench.invalid',
+                      phone=f'+bench{uuid.uuid4().hex[:8]}', is_verified=True)
+    bench_user.set_password(uuid.uuid4().hex)
+    db.session.add(bench_user)
+    db.session.commit()
+    now = datetime.utcnow()
+    for offset in range(0, rows, 10000):
+        db.session.execute(Transaction.__table__.insert(), [{
+            'user_id': bench_user.id, 'transaction_type': 'deposit', 'amount': 100.0, 'fee': 0.0,
+            'net_amount': 100.0, 'status': 'completed', 'reference': f'BENCH{bench_user.id}-{i}',
+            'description': 'Export bench deposit', 'created_at': now - timedelta(minutes=i)
+        } for i in range(offset, min(offset + 10000, rows))])
+        db.session.commit()
+    click.echo(f"Seeded {rows} transactions for user {bench_user.id}")
+
+    try:
+        for run_mode in ('buffered', 'streaming', 'gzip'):
+            result = subprocess.run(
+                [sys.executable, '-m', 'flask', 'bench-export', '--mode', run_mode, '--user-id', str(bench_user.id)],
+                cwd=app.root_path, capture_output=True, text=True,
+                env={**os.environ, 'FLASK_APP': os.environ.get('FLASK_APP', 'app.py')}
+            )
+            output = result.stdout.strip() or result.stderr.strip().splitlines()[-1]
+            click.echo(output if result.returncode == 0 else click.style(output, fg='red'))
+    finally:
+        Transaction.query.filter_by(user_id=bench_user.id).delete(synchronize_session=False)
+        User.query.filter_by(id=bench_user.id).delete(synchronize_session=False)
+        db.session.commit()
+
+@app.cli.command('refresh-analytics-rollups')
+@click.option('--days', default=2, show_default=True, help='Rebuild this many trailing days, including today.')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Rebuild from this day (YYYY-MM-DD) instead; use the first day of data for a full rebuild.')
+@with_appcontext
+def refresh_analytics_rollups_command(days, since):
+    """Rebuild the admin analytics daily rollups for recent days"""
+    since = since.date() if since else datetime.utcnow().date() - timedelta(days=days - 1)
+    try:
+        rows = refresh_analytics_rollups(since)
+    except Exception as e:
+        click.echo(click.style(f"Error refreshing analytics rollups: {str(e)}", fg='red'))
+        raise SystemExit(1)
+    click.echo(f"Rebuilt {rows} rollup rows from {since.isoformat()}.")
+
+# Statements /api/dashboard/stats may issue, however many groups and members
+DASHBOARD_MAX_QUERIES = 8
+
+def is_scratch_database():
+    """True for SQLite or a database whose name marks it as a test, dev or bench database"""
+    url = db.engine.url
+    return url.get_backend_name() == 'sqlite' or bool(re.search(r'test|dev|bench', url.database or '', re.I))
+
+@app.cli.command('check-dashboard-queries')
+@click.option('--groups', default=5, show_default=True, help='Groups the seeded user administers.')
+@click.option('--members', default=10, show_default=True, help='Members (each with a contribution) per group.')
+@click.option('--max-queries', default=DASHBOARD_MAX_QUERIES, show_default=True)
+@with_appcontext
+def check_dashboard_queries(groups, members, max_queries):
+    """Fail if /api/dashboard/stats issues more queries than the fixed bound"""
+    # Seeds and then bulk-deletes users, groups and contributions
+    if not is_scratch_database():
+        click.echo(click.style(f"Refusing to seed {db.engine.url.database!r}: point DATABASE_URL at a "
+                               "SQLite, test or dev database.", fg='red'))
+        raise SystemExit(1)
+    run_id = uuid.uuid4().hex[:8]
+    group_codes = [generate_group_code() for _ in range(groups)]
+    users = []
+    for i in range(members):
+        user = User(full_name=f'Dash {run_id} {i}', email=f'dash-{run_id}-{i}@bench.invalid',
+                    phone=f'+dash{run_id}{i}', is_verified=True)
+        user.set_password(uuid.uuid4().hex)
+        users.append(user)
+    db.session.add_all(users)
+    db.session.flush()
+    admin = users[0]
+    db.session.add(Wallet(user_id=admin.id, balance=0.00))
+    for n in range(groups):
+        group = StokvelGroup(name=f'Dash {run_id} {n}', category='savings', tier='bronze',
+                             contribution_amount=100, frequency='monthly', group_code=group_codes[n])
+        db.session.add(group)
+        db.session.flush()
+        for i, user in enumerate(users):
+            member = StokvelMember(user_id=user.id, group_id=group.id, role='admin' if i == 0 else 'member',
+                                   status='active' if i % 3 else 'inactive')
+            db.session.add(member)
+            db.session.flush()
+            db.session.add(Contribution(member_id=member.id, amount=100, status='confirmed'))
+    db.session.commit()
+    user_ids = [user.id for user in users]
+
+    try:
+        token = create_access_token(identity=str(admin.id))
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        client.get('/api/dashboard/stats', headers=headers)  # warm the auth cache
+        with QueryCounter() as counter:
+            response = client.get('/api/dashboard/stats', headers=headers)
+    finally:
+        member_ids = select(StokvelMember.id).where(StokvelMember.user_id.in_(user_ids))
+        Contribution.query.filter(Contribution.member_id.in_(member_ids)).delete(synchronize_session=False)
+        group_ids = [gid for gid, in db.session.execute(
+            select(StokvelMember.group_id).where(StokvelMember.user_id == user_ids[0]))]
+        StokvelMember.query.filter(StokvelMember.user_id.in_(user_ids)).delete(synchronize_session=False)
+        StokvelGroup.query.filter(StokvelGroup.id.in_(group_ids)).delete(synchronize_session=False)
+        Wallet.query.filter(Wallet.user_id.in_(user_ids)).delete(synchronize_session=False)
+        User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+    if response.status_code != 200:
+        click.echo(click.style(f"/api/dashboard/stats returned {response.status_code}: {response.get_data(as_text=True)}", fg='red'))
+        raise SystemExit(1)
+    click.echo(f"/api/dashboard/stats with {groups} groups x {members} members: {counter.count} queries (max {max_queries})")
+    if counter.count > max_queries:
+        for statement in counter.statements:
+            click.echo('  ' + ' '.join(statement.split())[:160])
+        raise SystemExit(1)
+
+@app.cli.command('reconcile-member-counts')
+@click.option('--fix/--check', default=False, show_default=True, help='Correct drifted counts instead of only reporting them.')
+@with_appcontext
+def reconcile_member_counts(fix):
+    """Compare StokvelGroup member counts with stokvel_member rows and optionally fix them"""
+    actual = select(
+        StokvelMember.group_id,
+        func.count(StokvelMember.id).label('members'),
+        func.count(StokvelMember.id).filter(StokvelMember.status == 'active').label('active')
+    ).group_by(StokvelMember.group_id).subquery()
+    members = func.coalesce(actual.c.members, 0)
+    active = func.coalesce(actual.c.active, 0)
+    drifted = db.session.execute(
+        select(StokvelGroup.id, StokvelGroup.name, StokvelGroup.member_count, members,
+               StokvelGroup.active_member_count, active)
+        .outerjoin(actual, actual.c.group_id == StokvelGroup.id)
+        .where(or_(StokvelGroup.member_count != members, StokvelGroup.active_member_count != active))
+    ).all()
+
+    if not drifted:
+        click.echo(click.style('All group member counts are correct.', fg='green'))
+        return
+    for group_id, name, stored, counted, stored_active, counted_active in drifted:
+        click.echo(f"Group {group_id} ({name}): member_count {stored} -> {counted}, "
+                   f"active_member_count {stored_active} -> {counted_active}")
+    if not fix:
+        click.echo(click.style(f"{len(drifted)} groups have drifted counts; rerun with --fix to correct them.", fg='red'))
+        raise SystemExit(1)
+
+    for group_id, _, _, counted, _, counted_active in drifted:
+        db.session.execute(
+            update(StokvelGroup).where(StokvelGroup.id == group_id)
+            .values(member_count=counted, active_member_count=counted_active)
+        )
+    db.session.commit()
+    click.echo(click.style(f"Fixed member counts for {len(drifted)} groups.", fg='green'))
+
+@app.cli.command('reconcile-unread-counts')
+@click.option('--fix/--check', default=False, show_default=True, help='Correct drifted counts instead of only reporting them.')
+@with_appcontext
+def reconcile_unread_counts(fix):
+    """Compare stored unread notification counts with notification rows and optionally fix them"""
+    actual = select(Notification.user_id, func.count(Notification.id).label('unread')) \
+        .where(Notification.is_read.isnot(True)) \
+        .group_by(Notification.user_id).subquery()
+    unread = func.coalesce(actual.c.unread, 0)
+    drifted = db.session.execute(
+        select(User.id, User.email, User.unread_notification_count, unread)
+        .outerjoin(actual, actual.c.user_id == User.id)
+        .where(User.unread_notification_count != unread)
+    ).all()
+
+    if not drifted:
+        click.echo(click.style('All unread notification counts are correct.', fg='green'))
+        return
+    for user_id, email, stored, counted in drifted:
+        click.echo(f"User {user_id} ({email}): unread_notification_count {stored} -> {counted}")
+    if not fix:
+        click.echo(click.style(f"{len(drifted)} users have drifted counts; rerun with --fix to correct them.", fg='red'))
+        raise SystemExit(1)
+
+    users = User.__table__
+    for user_id, _, _, counted in drifted:
+        db.session.execute(
+            update(users).where(users.c.id == user_id)
+            .values(unread_notification_count=counted, updated_at=users.c.updated_at)
+        )
+    db.session.commit()
+    click.echo(click.style(f"Fixed unread counts for {len(drifted)} users.", fg='green'))
+
+def hot_query_catalogue(user_id, group_id):
+    """(name, statement) pairs for the queries issued on the busiest request paths"""
+    since = datetime.utcnow() - timedelta(days=30)
+    return [
+        ('wallet balance', select(Wallet).where(Wallet.user_id == user_id)),
+        ('wallet history (cursor)', select(Transaction).where(Transaction.user_id == user_id)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(10)),
+        ('wallet export', select(Transaction).where(Transaction.user_id == user_id, Transaction.created_at >= since)),
+        ('daily limit counter', select(DailyTransactionTotal).where(
+            DailyTransactionTotal.user_id == user_id, DailyTransactionTotal.day == since.date(),
+            DailyTransactionTotal.transaction_type == 'transfer')),
+        ('recipient by account number', select(User).where(User.account_number == '0000000000')),
+        ('login by email', select(User).where(User.email == 'nobody@example.com')),
+        ('notifications page', select(Notification).where(Notification.user_id == user_id)
+            .order_by(Notification.created_at.desc(), Notification.id.desc()).limit(50)),
+        ('notifications since id', select(Notification).where(Notification.user_id == user_id, Notification.id > 0)
+            .order_by(Notification.id).limit(50)),
+        ('mark notifications read', update(Notification.__table__).where(
+            Notification.__table__.c.user_id == user_id, Notification.__table__.c.is_read.isnot(True))
+            .values(is_read=True)),
+        ('latest OTP', select(OTP).where(OTP.user_id == user_id, OTP.code == '000000', OTP.is_used == False)
+            .order_by(OTP.created_at.desc()).limit(1)),
+        ('active sessions', select(UserSession).where(UserSession.user_id == user_id, UserSession.is_active == True)),
+        ('memberships', select(StokvelMember).where(StokvelMember.user_id == user_id)),
+        ('group members', select(StokvelMember).where(StokvelMember.group_id == group_id, StokvelMember.status == 'active')),
+        ('member contributions', select(func.sum(Contribution.amount)).join(StokvelMember)
+            .where(StokvelMember.user_id == user_id)),
+        ('join requests by user', select(GroupJoinRequest).where(GroupJoinRequest.user_id == user_id)),
+        ('join requests by group', select(GroupJoinRequest).where(GroupJoinRequest.group_id == group_id)),
+        ('group by category and tier', select(StokvelGroup.id).where(
+            StokvelGroup.category == 'savings', StokvelGroup.tier == 'bronze')),
+        ('cards', select(Card).where(Card.user_id == user_id)),
+        ('chat history', select(Message).where(Message.conversation_id == '0')
+            .order_by(Message.created_at)),
+        ('audit log page', select(AdminAuditLog).order_by(AdminAuditLog.created_at.desc(), AdminAuditLog.id.desc()).limit(50)),
+        ('concerns page', select(CustomerConcern).order_by(CustomerConcern.created_at.desc(), CustomerConcern.id.desc()).limit(20)),
+        ('analytics rollups', select(AnalyticsDailyRollup).where(
+            AnalyticsDailyRollup.metric == 'transactions', AnalyticsDailyRollup.day >= since.date())),
+    ]
+
+def explain(statement):
+    """Return (plan lines, sequentially scanned tables) for a statement"""
+    connection = db.session.connection()
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect)
+    if dialect.paramstyle in ('qmark', 'numeric', 'format'):
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    if dialect.name == 'postgresql':
+        plan = [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {compiled}", params)]
+        scanned = re.findall(r'Seq Scan on "?(\w+)"?', '\n'.join(plan))
+    else:
+        plan = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+        scanned = [match.group(1) for line in plan for match in [re.match(r'SCAN (\w+)(?!.*USING)', line)] if match]
+    return plan, sorted(set(scanned))
+
+@app.cli.command('index-audit')
+@click.option('--verbose', is_flag=True, help='Print the full plan for every query.')
+@click.option('--planner-defaults', is_flag=True,
+              help='Keep Postgres seq scans enabled. By default they are discouraged so small tables still show whether an index exists.')
+@with_appcontext
+def index_audit(verbose, planner_defaults):
+    """EXPLAIN the app's hot queries and flag sequential scans"""
+    user_id = db.session.scalar(select(func.max(User.id))) or 1
+    group_id = db.session.scalar(select(func.max(StokvelGroup.id))) or 1
+    if db.engine.dialect.name == 'postgresql' and not planner_defaults:
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+
+    flagged = 0
+    for name, statement in hot_query_catalogue(user_id, group_id):
+        plan, scanned = explain(statement)
+        if scanned:
+            flagged += 1
+            click.echo(click.style(f"SEQ SCAN  {name}: {', '.join(scanned)}", fg='red'))
+        else:
+            click.echo(f"ok        {name}")
+        if verbose or scanned:
+            for line in plan:
+                click.echo(f"            {line}")
+    db.session.rollback()
+
+    if flagged:
+        click.echo(click.style(f"{flagged} hot queries scan a table sequentially.", fg='red'))
+        raise SystemExit(1)
+    click.echo(click.style('All hot queries use an index.', fg='green'))
+
+@app.cli.command('run-outbox')
+@click.option('--drain', is_flag=True, help='Exit once nothing is due instead of waiting for new messages.')
+@with_appcontext
+def run_outbox(drain):
+    """Deliver queued emails and SMS in the foreground (set OUTBOX_WORKERS=0 on the web processes)"""
+    dispatcher = OutboxDispatcher(outbox_providers())
+    try:
+        dispatcher.run(drain=drain)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.stop()
+    counts = dict(db.session.execute(
+        select(OutboundMessage.status, func.count(OutboundMessage.id)).group_by(OutboundMessage.status)
+    ).all())
+    click.echo(', '.join(f"{count} {status}" for status, count in sorted(counts.items())) or 'Outbox is empty.')
+
+@app.cli.command('bench-outbox')
+@click.option('--messages', default=2000, show_default=True, help='Messages to enqueue.')
+@click.option('--sms-share', default=0.3, show_default=True, help='Fraction of messages that are SMS.')
+@click.option('--workers', default=OUTBOX_WORKERS or 2, show_default=True, help='Delivery threads.')
+@click.option('--latency', default=0.05, show_default=True, help='Fake provider latency per request, in seconds.')
+@click.option('--failure-rate', default=0.05, show_default=True, help='Fraction of fake deliveries that fail and are retried.')
+@with_appcontext
+def bench_outbox(messages, sms_share, workers, latency, failure_rate):
+    """Enqueue messages like the auth handlers do, then drain them through a fake provider"""
+    run_id = uuid.uuid4().hex[:8]
+    db.session.info['outbox_autostart'] = False  # leave the rows to the bench dispatcher
+    enqueue_times = []
+    for i in range(messages):
+        started = time.perf_counter()
+        if random.random() < sms_share:
+            queue_verification_sms(f'+27{run_id}{i}', generate_otp())
+        else:
+            queue_verification_email(f'bench-{run_id}-{i}@bench.invalid', generate_otp())
+        db.session.commit()
+        enqueue_times.append(time.perf_counter() - started)
+    enqueue_times.sort()
+    click.echo(f"Enqueued {messages} messages: p50 {enqueue_times[len(enqueue_times) // 2] * 1000:.2f}ms, "
+               f"p99 {enqueue_times[int(len(enqueue_times) * 0.99)] * 1000:.2f}ms per request")
+
+    # SendGrid takes batches; Twilio is one message per request
+    providers = {'email': FakeProvider(latency, failure_rate), 'sms': FakeProvider(latency, failure_rate, batch_size=1)}
+    dispatcher = OutboxDispatcher(providers, workers=workers, retry_base=0)  # retry failures straight away
+    bench_rows = OutboundMessage.query.filter(or_(
+        OutboundMessage.recipient.like(f'bench-{run_id}-%'), OutboundMessage.recipient.like(f'+27{run_id}%')))
+    started = time.perf_counter()
+    try:
+        dispatcher.run(drain=True)
+    finally:
+        dispatcher.stop()
+    elapsed = time.perf_counter() - started
+
+    counts = dict(db.session.execute(
+        select(OutboundMessage.status, func.count(OutboundMessage.id))
+        .where(OutboundMessage.id.in_(bench_rows.with_entities(OutboundMessage.id).scalar_subquery()))
+        .group_by(OutboundMessage.status)
+    ).all())
+    requests_made = sum(provider.requests for provider in providers.values())
+    click.echo(f"Delivered {counts.get('sent', 0)} of {messages} in {elapsed:.2f}s "
+               f"({counts.get('sent', 0) / elapsed:.0f}/s over {requests_made} provider requests); "
+               f"{counts.get('failed', 0)} failed, {counts.get('pending', 0)} still pending")
+    bench_rows.delete(synchronize_session=False)
+    db.session.commit()
+
+@app.cli.command('fake-llm')
+@click.option('--port', default=8090, show_default=True)
+@click.option('--tokens-per-second', default=50.0, show_default=True, help='Pace of the generated reply.')
+@click.option('--first-token-delay', default=0.3, show_default=True, help='Seconds before the first token.')
+def fake_llm(port, tokens_per_second, first_token_delay):
+    """Serve a fake OpenAI-compatible LLM; point LLM_BASE_URL at http://localhost:<port>/v1"""
+    from iStokvel.utils.fake_llm import create_fake_llm
+    create_fake_llm(tokens_per_second, first_token_delay).run(port=port, threaded=True)
+
+@app.cli.command('bench-chat')
+@click.option('--turns', default=40, show_default=True, help='Messages sent in one conversation, per mode.')
+@click.option('--concurrency', default=8, show_default=True, help='Conversations run in parallel for the throughput run.')
+@click.option('--tokens-per-second', default=50.0, show_default=True, help='Fake LLM generation pace.')
+@click.option('--first-token-delay', default=0.3, show_default=True, help='Fake LLM delay before the first token.')
+@with_appcontext
+def bench_chat(turns, concurrency, tokens_per_second, first_token_delay):
+    """Measure /api/message latency and throughput, streamed and not, against a local fake LLM"""
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import make_server
+    from iStokvel.utils.fake_llm import create_fake_llm
+
+    if get_llm_client.is_loaded():
+        click.echo(click.style('The LLM client is already configured; run the bench in a fresh process.', fg='red'))
+        raise SystemExit(1)
+    for noisy in ('werkzeug', 'httpx'):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    fake = create_fake_llm(tokens_per_second, first_token_delay)
+    server = make_server('127.0.0.1', 0, fake, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['LLM_BASE_URL'] = f'http://127.0.0.1:{server.server_port}/v1'
+    os.environ.setdefault('OPENROUTER_API_KEY', 'bench')
+
+    run_id = uuid.uuid4().hex[:8]
+    user = User(full_name='Chat Bench', email=f'chat-bench-{run_id}@bench.invalid', phone=f'+27{run_id}',
+                password='!', is_verified=True)
+    db.session.add(user)
+    db.session.commit()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+    client = app.test_client()
+
+    def start_conversation():
+        return client.post('/api/start', json={'title': 'Bench'}, headers=headers).get_json()['conversation_id']
+
+    def turn(conversation_id, i, stream):
+        """(time to first token, total time) for one message"""
+        started = time.perf_counter()
+        payload = {'conversation_id': conversation_id, 'message': f'Question {i}: how do payouts work?'}
+        if not stream:
+            client.post('/api/message', json=payload, headers=headers)
+            elapsed = time.perf_counter() - started
+            return elapsed, elapsed
+        response = client.post('/api/message?stream=true', json=payload, headers=headers, buffered=False)
+        first_token = None
+        for chunk in response.response:
+            if first_token is None and b'"token"' in chunk:
+                first_token = time.perf_counter() - started
+        response.close()
+        return first_token, time.perf_counter() - started
+
+    def percentile(values, share):
+        values = sorted(values)
+        return values[min(int(len(values) * share), len(values) - 1)] * 1000
+
+    try:
+        for stream in (False, True):
+            conversation_id = start_conversation()
+            timings, prompt_sizes = [], []
+            for i in range(turns):
+                timings.append(turn(conversation_id, i, stream))
+                prompt_sizes.append(fake.config['LAST_PROMPT_CHARS'])
+            first_tokens, totals = zip(*timings)
+            click.echo(f"{'stream' if stream else 'blocking'}: first token p50 {percentile(first_tokens, 0.5):.0f}ms "
+                       f"p95 {percentile(first_tokens, 0.95):.0f}ms; full reply p50 {percentile(totals, 0.5):.0f}ms; "
+                       f"prompt {prompt_sizes[0]} chars on turn 1, {max(prompt_sizes)} max, "
+                       f"{prompt_sizes[-1]} on turn {turns}")
+
+        conversations = [start_conversation() for _ in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda n: turn(conversations[n % concurrency], n, True), range(turns)))
+        elapsed = time.perf_counter() - started
+        click.echo(f"throughput: {turns} streamed replies over {concurrency} conversations in {elapsed:.2f}s "
+                   f"({turns / elapsed:.1f}/s)")
+    finally:
+        server.shutdown()
+        for conversation in Conversation.query.filter_by(user_id=user.id).all():
+            db.session.delete(conversation)
+        db.session.delete(user)
+        db.session.commit()
+
+@app.cli.command('bench-search')
+@click.option('--concerns', default=100_000, show_default=True, help='Customer concerns to seed.')
+@click.option('--runs', default=20, show_default=True, help='Timed searches per term.')
+@with_appcontext
+def bench_search(concerns, runs):
+    """Seed customer concerns and time admin concern searches, full-text against ILIKE"""
+    run_id = uuid.uuid4().hex[:8]
+    subjects = ['Payout delayed', 'Cannot join group', 'Wallet top up failed', 'Wrong contribution amount',
+                'Card declined', 'Account locked', 'Referral points missing', 'Claim still pending']
+    names = ['Thabo Mokoena', 'Naledi Dlamini', 'Sipho Nkosi', 'Lerato Khumalo', 'Ayanda Zulu', 'Kagiso Molefe']
+    started = time.perf_counter()
+    for offset in range(0, concerns, 5000):
+        db.session.execute(CustomerConcern.__table__.insert(), [{
+            'name': f'{random.choice(names)} {i}',
+            'email': f'bench-{run_id}-{i}@bench.invalid',
+            'subject': random.choice(subjects),
+            'message': 'Seeded by flask bench-search',
+            'status': random.choice(('open', 'resolved')),
+            'created_at': datetime.utcnow() - timedelta(minutes=i)
+        } for i in range(offset, min(offset + 5000, concerns))])
+        db.session.commit()
+    click.echo(f"Seeded {concerns} concerns in {time.perf_counter() - started:.1f}s")
+
+    columns = (CustomerConcern.name, CustomerConcern.email, CustomerConcern.subject)
+    modes = {'ilike': lambda term: (select(CustomerConcern.id).where(or_(*(c.ilike(f'%{term}%') for c in columns))), None)}
+    if db.engine.dialect.name == 'postgresql':
+        modes['full-text'] = lambda term: text_search(select(CustomerConcern.id), CustomerConcern, term, 'simple', columns)
+    else:
+        click.echo('Not on Postgres: only the ILIKE fallback is measured.')
+    try:
+        for term in ('payout', 'naledi dlamini', f'{run_id}-4242', 'declined'):
+            for mode, build in modes.items():
+                query, rank = build(term)
+                order = (CustomerConcern.created_at.desc(), CustomerConcern.id.desc())
+                page = query.order_by(*((rank.desc(),) + order if rank is not None else order)).limit(20)
+                count = select(func.count()).select_from(query.subquery())
+                timings = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    matches = db.session.scalar(count)
+                    db.session.execute(page).all()
+                    timings.append(time.perf_counter() - started)
+                timings.sort()
+                _, scanned = explain(page)
+                click.echo(f"{term!r:>24} {mode:>9}: {matches:>6} matches, p50 {timings[len(timings) // 2] * 1000:.1f}ms, "
+                           f"p95 {timings[int(len(timings) * 0.95)] * 1000:.1f}ms"
+                           f"{', sequential scan' if scanned else ''}")
+    finally:
+        CustomerConcern.query.filter(CustomerConcern.email.like(f'bench-{run_id}-%')).delete(synchronize_session=False)
+        db.session.commit()
+
+@app.cli.command('bench-ids')
+@click.option('--ids', default=50_000, show_default=True, help='Identifiers of each kind to generate.')
+@click.option('--workers', default=8, show_default=True, help='Threads generating at the same time.')
+@with_appcontext
+def bench_ids(ids, workers):
+    """Generate identifiers in a burst and check for collisions and database round trips"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def burst(generate):
+        def work(count):
+            generated = []
+            with app.app_context():
+                for _ in range(count):
+                    generated.append(generate())
+                    db.session.commit()  # as a request would; releases the IdBlock row lock
+            return generated
+        share = [ids // workers + (1 if i < ids % workers else 0) for i in range(workers)]
+        with QueryCounter() as queries, ThreadPoolExecutor(max_workers=workers) as pool:
+            started = time.perf_counter()
+            generated = [value for chunk in pool.map(work, share) for value in chunk]
+            elapsed = time.perf_counter() - started
+        return generated, elapsed, queries.count
+
+    def legacy_reference():
+        return f"TXN{datetime.utcnow().strftime('%Y%m%d%H%M%S')}{random.randint(1000, 9999)}"
+
+    failed = False
+    for kind, generate in (('account numbers', generate_account_number), ('group codes', generate_group_code),
+                           ('references', generate_transaction_reference), ('old references', legacy_reference)):
+        generated, elapsed, queries = burst(generate)
+        collisions = len(generated) - len(set(generated))
+        line = (f"{kind:>16}: {len(generated)} in {elapsed:.2f}s ({len(generated) / elapsed:,.0f}/s), "
+                f"{collisions} collisions, {queries} queries")
+        if kind == 'account numbers':
+            invalid = sum(1 for number in generated if len(number) != 10 or not luhn_valid(number))
+            line += f", {invalid} failing the check digit"
+            collisions += invalid
+        if kind == 'old references':
+            click.echo(f"{line} (the previous generator, for comparison)")
+            continue
+        failed = failed or collisions > 0
+        click.echo(click.style(line, fg='red' if collisions else None))
+    db.session.commit()
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('analyze-pending-claims')
+@click.option('--older-than', default=10, show_default=True, help='Only claims that have been analyzing for this many minutes.')
+@with_appcontext
+def analyze_pending_claims(older_than):
+    """Re-run the analysis of claims left in 'analyzing', e.g. by a restart mid-analysis"""
+    cutoff = datetime.utcnow() - timedelta(minutes=older_than)
+    claims = Claim.query.filter(Claim.status == 'analyzing', Claim.created_at <= cutoff).all()
+    if not claims:
+        click.echo('No claims are waiting for analysis.')
+        return
+    for claim in claims:
+        queue_claim_analysis(claim)
+    if get_claim_analysis_runner.is_loaded():
+        # Waits for the workers and for the results to be written back
+        get_claim_analysis_runner().shutdown()
+    db.session.expire_all()
+    left = Claim.query.filter(Claim.id.in_([claim.id for claim in claims]), Claim.status == 'analyzing').count()
+    click.echo(f"Analysed {len(claims) - left} of {len(claims)} claims.")
+
+@app.cli.command('rescore-claims')
+@click.option('--status', 'statuses', multiple=True, default=('pending', 'review'), show_default=True,
+              help='Claim statuses to re-score (repeatable).')
+@click.option('--chunk-size', default=1000, show_default=True, help='Claims scored and committed per batch.')
+@with_appcontext
+def rescore_claims_command(statuses, chunk_size):
+    """Re-score undecided claims with the current fraud model, in chunks"""
+    started = time.perf_counter()
+    last_id, total, promoted = 0, 0, 0
+    while True:
+        claim_ids = db.session.execute(
+            select(Claim.id).where(Claim.status.in_(statuses), Claim.id > last_id)
+            .order_by(Claim.id).limit(chunk_size)
+        ).scalars().all()
+        if not claim_ids:
+            break
+        scored, moved = rescore_claims(claim_ids)
+        db.session.commit()
+        total += scored
+        promoted += moved
+        last_id = claim_ids[-1]
+        click.echo(f"Re-scored {total} claims (up to #{last_id})")
+    elapsed = time.perf_counter() - started
+    click.echo(click.style(f"Re-scored {total} claims in {elapsed:.2f}s; {promoted} moved to review.", fg='green'))
+
+@app.cli.command('bench-fraud-scoring')
+@click.option('--rows', default=20000, show_default=True, help='Synthetic claims to score in batch.')
+@click.option('--per-row-sample', default=500, show_default=True, help='Claims scored one at a time to time the per-row path.')
+@with_appcontext
+def bench_fraud_scoring(rows, per_row_sample):
+    """Compare per-row predict_fraud with predict_fraud_batch on synthetic claims"""
+    import warnings
+    detector = get_fraud_detector()
+    random_state = random.Random(42)
+    claims = pd.DataFrame({
+        'amount': [random_state.uniform(500, 200000) for _ in range(rows)],
+        'past_claims': [random_state.randint(0, 8) for _ in range(rows)]
+    })
+
+    sample = claims.head(per_row_sample)
+    with warnings.catch_warnings():
+        # sklearn warns on every unnamed single-row call
+        warnings.simplefilter('ignore', UserWarning)
+        started = time.perf_counter()
+        per_row = [detector.predict_fraud(amount, past_claims) for amount, past_claims in sample.itertuples(index=False)]
+        per_row_rate = len(sample) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    batched = detector.predict_fraud_batch(claims)
+    batch_rate = rows / (time.perf_counter() - started)
+
+    mismatches = sum(abs(a - b) > 1e-9 for a, b in zip(per_row, batched[:len(sample)]))
+    click.echo(f"Per-row: {per_row_rate:,.0f} claims/s ({len(sample)} claims)")
+    click.echo(f"Batched: {batch_rate:,.0f} claims/s ({rows} claims), {batch_rate / per_row_rate:,.0f}x faster")
+    if mismatches:
+        click.echo(click.style(f"{mismatches} scores differ between the two paths", fg='red'))
+        raise SystemExit(1)
+
+# Bootstrap rows for `train-fraud-model --seed` on a fresh install with no decided claims
+FRAUD_SEED_CLAIMS = [
+    {"amount": 5000, "past_claims": 1, "fraud": 0},
+    {"amount": 100000, "past_claims": 5, "fraud": 1},
+    {"amount": 20000, "past_claims": 0, "fraud": 0},
+    {"amount": 150000, "past_claims": 3, "fraud": 1}
+]
+
+@app.cli.command('train-fraud-model')
+@click.option('--min-rows', default=20, show_default=True, help='Decided claims needed to train.')
+@click.option('--trees', default=100, show_default=True, help='Trees in the random forest.')
+@click.option('--seed', is_flag=True, help='Train on the built-in bootstrap rows instead of claim history.')
+@click.option('--activate/--no-activate', default=True, show_default=True, help='Make the new version the active model.')
+@with_appcontext
+def train_fraud_model(min_rows, trees, seed, activate):
+    """Train the fraud model from approved/rejected claims and store it as a new version"""
+    from sklearn.ensemble import RandomForestClassifier
+    import sklearn
+
+    if seed:
+        data = pd.DataFrame(FRAUD_SEED_CLAIMS)
+    else:
+        decided = select(Claim.id).where(Claim.status.in_(('approved', 'rejected')))
+        data = claim_feature_frame(decided)
+        labels = dict(db.session.execute(
+            select(Claim.id, Claim.status).where(Claim.status.in_(('approved', 'rejected')))
+        ).all())
+        data['fraud'] = [int(labels[claim_id] == 'rejected') for claim_id in data.index]
+        if len(data) < min_rows or data['fraud'].nunique() < 2:
+            click.echo(click.style(
+                f"Only {len(data)} decided claims ({int(data['fraud'].sum())} rejected); need {min_rows} "
+                f"covering both outcomes. Use --seed to bootstrap a fresh install.", fg='red'))
+            raise SystemExit(1)
+
+    model = RandomForestClassifier(n_estimators=trees, random_state=0)
+    model.fit(data[FraudDetector.FEATURES], data['fraud'])
+    registry = get_fraud_model_registry()
+    version = registry.save(model, {
+        'trained_at': datetime.utcnow().isoformat(),
+        'source': 'seed' if seed else 'claims',
+        'rows': len(data),
+        'fraud_rows': int(data['fraud'].sum()),
+        'features': FraudDetector.FEATURES,
+        'trees': trees,
+        'sklearn': sklearn.__version__
+    })
+    click.echo(f"Trained fraud model {version} on {len(data)} claims ({int(data['fraud'].sum())} rejected).")
+    if activate:
+        registry.activate(version)
+        click.echo(click.style(f"Activated {version}; workers pick it up within {FRAUD_MODEL_RELOAD_INTERVAL}s.", fg='green'))
+
+@app.cli.command('fraud-models')
+@click.option('--activate', 'version', default=None, help='Make this version the active model (e.g. to roll back).')
+@with_appcontext
+def fraud_models(version):
+    """List stored fraud model versions, or activate one"""
+    registry = get_fraud_model_registry()
+    if version:
+        try:
+            registry.activate(version)
+        except ValueError as e:
+            click.echo(click.style(str(e), fg='red'))
+            raise SystemExit(1)
+        click.echo(click.style(f"Activated {version}.", fg='green'))
+        return
+    current = registry.current_version()
+    versions = registry.versions()
+    if not versions:
+        click.echo(f"No stored versions in {registry.directory}; using {LEGACY_FRAUD_MODEL}.")
+    for name, metadata in versions:
+        marker = '*' if name == current else ' '
+        click.echo(f"{marker} {name}  {metadata.get('source', '?')}, {metadata.get('rows', '?')} claims, "
+                   f"trained {metadata.get('trained_at', '?')}")
+
 @app.cli.command('create-admin')
 @with_appcontext
 def create_admin():
@@ -4713,25 +7583,53 @@ def reset_users():
         print(f'Error: {str(e)}')
 
 @app.cli.command('generate-account-numbers')
+@click.option('--batch-size', default=5000, show_default=True, type=click.IntRange(1, 30000),
+              help='Users numbered and committed per batch.')
+@click.option('--after-id', default=0, show_default=True, help='Skip users up to this id, e.g. to resume from a reported id.')
 @with_appcontext
-def generate_account_numbers():
-    """Generate account numbers for all users who don't have them"""
-    try:
-        users_without_account = User.query.filter_by(account_number=None).all()
-        
-        if not users_without_account:
-            print("✅ All users already have account numbers!")
-            return
-        
-        for user in users_without_account:
-            user.account_number = generate_account_number()
-            print(f"✅ Generated account number {user.account_number} for user {user.id} ({user.email})")
-        
+def generate_account_numbers(batch_size, after_id):
+    """Generate account numbers for all users who don't have them, in committed batches"""
+    users = User.__table__
+    remaining = db.session.scalar(
+        select(func.count()).select_from(users).where(users.c.account_number.is_(None), users.c.id > after_id))
+    if not remaining:
+        click.echo(click.style('All users already have account numbers.', fg='green'))
+        return
+
+    # Each batch is one UPDATE ... FROM (VALUES ...) and its own transaction,
+    # so locks are short and an interrupted run loses at most one batch.
+    # Users only ever gain a number, so rerunning picks up where it stopped.
+    numbered, last_id = 0, after_id
+    started = time.perf_counter()
+    while True:
+        ids = db.session.scalars(
+            select(users.c.id).where(users.c.account_number.is_(None), users.c.id > last_id)
+            .order_by(users.c.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        rows = [(user_id, generate_account_number()) for user_id in ids]
+        if db.engine.dialect.name == 'postgresql':
+            numbers = values(column('id', db.Integer), column('account_number', db.String), name='numbers').data(rows)
+            numbered += db.session.execute(
+                update(users)
+                .where(users.c.id == numbers.c.id, users.c.account_number.is_(None))
+                .values(account_number=numbers.c.account_number)
+            ).rowcount
+        else:
+            # No VALUES lists with column names here; one executemany instead
+            numbered += db.session.execute(
+                update(users)
+                .where(users.c.id == db.bindparam('user_id'), users.c.account_number.is_(None))
+                .values(account_number=db.bindparam('number')),
+                [{'user_id': user_id, 'number': number} for user_id, number in rows]
+            ).rowcount
         db.session.commit()
-        print(f"✅ Generated account numbers for {len(users_without_account)} users")
-    except Exception as e:
-        print(f"❌ Error generating account numbers: {str(e)}")
-        db.session.rollback()
+        last_id = ids[-1]
+        elapsed = time.perf_counter() - started
+        click.echo(f"{numbered}/{remaining} users numbered ({numbered / elapsed:,.0f}/s), last id {last_id}")
+
+    click.echo(click.style(f"Generated account numbers for {numbered} users.", fg='green'))
 
 @app.cli.command('add-test-card')
 @with_appcontext
@@ -4822,8 +7720,6 @@ def add_test_card_api(current_user):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 #------------------------------------------------------------------------------------------------------ Claims routes
-fraud_detector = FraudDetector()
-
 
 @app.route('/api/claims', methods=['POST'])
 @token_required
@@ -4874,48 +7770,28 @@ def create_claim(current_user):
         if additional_docs:
             claim.additional_documents_path = json.dumps(additional_docs)
         
+        # Fraud analysis runs in the background; admins see the claim as 'analyzing' until it is scored
+        claim.status = 'analyzing'
         db.session.add(claim)
-        db.session.flush()  # Get claim ID before commit
-        
-        # Fraud Detection
-        past_claims = db.session.query(Claim).filter_by(user_id=current_user.id).count()
-        
-        # 1. Rule-based checks
-        fraud_indicators = fraud_detector.rule_based_checks(claim, db)
-        
-        # 2. Document analysis
-        for doc_field in ['id_document_path', 'death_certificate_path']:
-            if doc_path := getattr(claim, doc_field):
-                if issue := fraud_detector.check_document(doc_path):
-                    fraud_indicators.append(f"{doc_field}: {issue}")
-        
-        # 3. ML Prediction
-        fraud_score = fraud_detector.predict_fraud(claim.amount, past_claims)
-        claim.fraud_score = fraud_score
-        claim.fraud_indicators = json.dumps(fraud_indicators)
-        
-        # Set status
-        claim.status = 'review' if fraud_score > 0.7 or fraud_indicators else 'pending'
-        
-        # Notify admin
-        if current_user.role != 'admin':
-            admin = db.session.query(User).filter_by(role='admin').first()
-            if admin:
-                notification = Notification(
-                    user_id=admin.id,
-                    title="New Claim Submitted",
-                    message=f"Claim #{claim.id} from {current_user.full_name} (Score: {fraud_score:.2f})",
-                    type="new_claim",
-                    data=json.dumps({"claim_id": claim.id, "fraud_score": fraud_score})
-                )
-                db.session.add(notification)
-        
         db.session.commit()
+        claim_id = claim.id
+        try:
+            queue_claim_analysis(claim)
+        except Exception:
+            # The claim is saved either way; the stale-claim sweep queues it again
+            db.session.rollback()
+            logger.exception("Could not queue the analysis of claim %s", claim_id)
+            return jsonify({
+                'message': 'Claim submitted',
+                'claim_id': claim_id,
+                'fraud_score': None,
+                'status': 'analyzing'
+            }), 201
         
         return jsonify({
             'message': 'Claim submitted',
             'claim_id': claim.id,
-            'fraud_score': fraud_score,
+            'fraud_score': claim.fraud_score,
             'status': claim.status
         }), 201
         
@@ -5050,7 +7926,7 @@ def upload_beneficiary_document(beneficiary_id):
     os.makedirs(upload_folder, exist_ok=True)
     filename = f"{beneficiary_id}_{doc_type}_{secure_filename(file.filename)}"
     save_path = os.path.join(upload_folder, filename)
-    print("Saving file to:", save_path)
+    logger.debug("Saving beneficiary document to %s", save_path)
     file.save(save_path)
 
     url = f"http://localhost:5001/uploads/beneficiary_docs/{filename}"
@@ -5109,14 +7985,26 @@ def purchase():
     except (TypeError, ValueError):
         return jsonify({"error": "Invalid amount format"}), 400
 
+    # --- Record Transaction ---
+    txn = MarketTransaction(
+        user_id=user_id,
+        item_type=item_type,
+        provider=provider,
+        amount=amount,
+        payment_method=payment_method,
+        status='successful',
+        reference=generate_reference()
+    )
+
     # --- Digital Wallet ---
     if payment_method == "wallet":
-        wallet = Wallet.query.filter_by(user_id=user_id).first()
-        if not wallet:
+        if not Wallet.query.filter_by(user_id=user_id).first():
             return jsonify({"error": "Wallet not found"}), 404
-        if wallet.balance < amount:
+        leg = ledger_leg(int(user_id), -amount, 'purchase', -amount, f"{item_type} purchase from {provider}")
+        try:
+            post_ledger([leg], extra=[txn])
+        except InsufficientFundsError:
             return jsonify({"error": "Insufficient wallet balance"}), 400
-        wallet.balance -= amount
 
     # --- Card Payment ---
     elif payment_method == "card":
@@ -5124,34 +8012,23 @@ def purchase():
         if not card:
             return jsonify({"error": "Card not found"}), 404
         # Simulate card payment
-        print(f"Charging card **** **** **** {card.card_number_last4} for R{amount}")
+        wallet_logger.debug("Charging card ****%s for R%.2f", card.card_number_last4, amount)
+        db.session.add(txn)
+        db.session.commit()
     else:
         return jsonify({"error": "Invalid payment method"}), 400
 
-    # --- Record Transaction ---
-    txn = MarketTransaction(
-        user_id=user_id,
-        item_type=item_type,
-        provider=provider,
-        amount=amount,
-        payment_method=payment_method,
-        status='successful',
-        reference=generate_reference()
-    )
-    db.session.add(txn)
-    db.session.commit()
-
     # --- Send Notification (optional) ---
     send_notification(user_id, f"Your purchase of {item_type} for R{amount} was successful.")
 
     return jsonify({"message": "Purchase successful!", "reference": txn.reference}), 200
 
 def generate_reference():
-    return f"TXN-{uuid.uuid4().hex[:12]}"
+    return generate_transaction_reference()
 
 def send_notification(user_id, message):
     # Replace with actual notification logic (email, SMS, push etc.)
-    print(f"Notification to user {user_id}: {message}")
+    logger.info("Notification to user %s: %s", user_id, message)
     
 #------------------------------------------------------------------------------------------------------ Savings goals routes
 @app.route('/api/user/savings-goal', methods=['GET'])
@@ -5194,7 +8071,7 @@ def handle_error(error):
     if isinstance(error, HTTPException):
         return error
 
-    logger.error(f"Unhandled error: {str(error)}")
+    logger.exception("Unhandled error: %s", error)
     if isinstance(error, SQLAlchemyError):
         db.session.rollback()
         return jsonify({"error": "Database error occurred"}), 500
@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import re
+import struct
+
+logger = logging.getLogger('istokvel.claims')
+
+# Bump when the checks change so results cached under the old rules are ignored
+ANALYSIS_VERSION = 2
+MAX_IMAGE_SIDE = int(os.getenv('DOCUMENT_MAX_IMAGE_SIDE', 1600))
+MAX_IMAGE_PIXELS = 120_000_000
+MAX_PDF_PAGES = int(os.getenv('DOCUMENT_MAX_PDF_PAGES', 5))
+DATE_PATTERN = re.compile(r"\d{2}/\d{2}/\d{4}")
+
+class AnalysisFailure(str):
+    """An issue saying the check could not run, e.g. a missing library or an I/O error.
+
+    It is reported like any other issue but never cached, so the same file
+    is checked again next time.
+    """
+
+def file_digest(file_path):
+    """SHA-256 of the file's contents, read in 1MB chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def image_size(file_path):
+    """(width, height) read from a PNG or JPEG header without decoding, or None"""
+    with open(file_path, 'rb') as f:
+        header = f.read(26)
+        if header.startswith(b'\x89PNG\r\n\x1a\n'):
+            return struct.unpack('>II', header[16:24])
+        if not header.startswith(b'\xff\xd8'):
+            return None
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            length = struct.unpack('>H', f.read(2))[0]
+            # SOF0-SOF15 carry the frame size; C4, C8 and CC are other segments
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>xHH', f.read(5))
+                return width, height
+            f.seek(length - 2, os.SEEK_CUR)
+
+def load_image(file_path):
+    """Decode an image as grayscale no larger than MAX_IMAGE_SIDE on its longest side.
+
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale when that still covers the
+    target size, so a large scan is never held at full resolution. Returns
+    None if the image cannot be read; raises ValueError if it is too large.
+    """
+    import cv2
+
+    size = image_size(file_path)
+    if size and size[0] * size[1] > MAX_IMAGE_PIXELS:
+        raise ValueError(f"{size[0]}x{size[1]} image is too large")
+    flags = cv2.IMREAD_GRAYSCALE
+    if size:
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                                (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+            if max(size) / factor >= MAX_IMAGE_SIDE:
+                flags = reduced
+                break
+    img = cv2.imread(file_path, flags)
+    if img is None:
+        return None
+    longest = max(img.shape[:2])
+    if longest > MAX_IMAGE_SIDE:
+        scale = MAX_IMAGE_SIDE / longest
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+def pdf_lines(file_path, max_pages=MAX_PDF_PAGES):
+    """Yield the text lines of the first max_pages pages, one page at a time"""
+    from PyPDF2 import PdfReader
+    with open(file_path, 'rb') as f:
+        reader = PdfReader(f)
+        for page_number, page in enumerate(reader.pages):
+            if page_number >= max_pages:
+                break
+            yield from (page.extract_text() or '').splitlines()
+
+def has_repeated_date(lines):
+    """True if any line contains the same dd/mm/yyyy date twice"""
+    for line in lines:
+        seen = set()
+        for match in DATE_PATTERN.finditer(line):
+            if match.group() in seen:
+                return True
+            seen.add(match.group())
+    return False
+
+def check_document(file_path):
+    """Detect document tampering"""
+    if not file_path:
+        return None
+
+    if file_path.lower().endswith('.pdf'):
+        try:
+            if has_repeated_date(pdf_lines(file_path)):
+                return "Possible date tampering in document"
+        except Exception as e:
+            logger.warning("Could not analyze PDF %s: %s", file_path, e)
+            return AnalysisFailure("Could not analyze PDF document")
+
+    elif file_path.lower().endswith(('.jpg', '.jpeg', '.png')):
+        try:
+            import cv2
+            img = load_image(file_path)
+            if img is None:
+                return None
+
+            edges = cv2.Canny(img, 100, 200)
+            edge_ratio = cv2.countNonZero(edges) / (img.shape[0] * img.shape[1])
+            if edge_ratio > 0.5:
+                return "Possible image manipulation"
+        except Exception as e:
+            logger.warning("Could not analyze image %s: %s", file_path, e)
+            return AnalysisFailure("Could not analyze image document")
+
+    return None
+
+def analyze_documents(documents):
+    """Run check_document over (field, path) pairs and return [(field, issue or None)].
+
+    This runs in the claim analysis worker processes, so it only reads the
+    files and never touches the database.
+    """
+    return [(field, check_document(path)) for field, path in documents]
@@ -4,6 +4,9 @@ import random
 import string
 from flask import current_app
 import os
+import logging
+
+logger = logging.getLogger('istokvel.email')
 
 def generate_verification_code():
     """Generate a 6-digit verification code"""
@@ -16,7 +19,7 @@ def send_verification_email(to_email, verification_code):
         # Using the actual from_email from app config as before
         from_email_address = current_app.config.get('SENDGRID_FROM_EMAIL')
         if not from_email_address:
-             print("ERROR: SENDGRID_FROM_EMAIL is not configured for sending email.")
+             logger.error("SENDGRID_FROM_EMAIL is not configured for sending email.")
              return False, "Sender email is not configured."
 
         from_email_obj = Email(from_email_address)
@@ -40,28 +43,23 @@ def send_verification_email(to_email, verification_code):
         # Get the API key directly from os.environ as shown in the example
         api_key = os.environ.get('SENDGRID_API_KEY')
         if not api_key:
-            print("ERROR: SENDGRID_API_KEY environment variable is not set.")
+            logger.error("SENDGRID_API_KEY environment variable is not set.")
             return False, "SendGrid API key environment variable is not set."
 
         # Initialize SendGrid client and send email
         sg = SendGridAPIClient(api_key)
         response = sg.send(message)
 
-        # Print response details as shown in the example
-        print(f"SendGrid Response Status Code: {response.status_code}")
-        print(f"SendGrid Response Body: {response.body}")
-        print(f"SendGrid Response Headers: {response.headers}")
+        logger.debug("SendGrid response %s: %s", response.status_code, response.body)
 
         # Check status code for success (2xx range)
         if 200 <= response.status_code < 300:
             return True, "Email sent successfully according to SendGrid response."
         else:
-            print(f"SendGrid returned non-success status code: {response.status_code}")
+            logger.warning("SendGrid returned non-success status code: %s", response.status_code)
             return False, f"SendGrid API returned status code {response.status_code}"
 
     except Exception as e:
         # Catch any exceptions during the process
-        print(f"Error sending email via SendGrid: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error sending email via SendGrid")
         return False, f"Exception during SendGrid email sending: {str(e)}"
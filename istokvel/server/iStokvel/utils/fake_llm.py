@@ -0,0 +1,56 @@
+import json
+import time
+import uuid
+
+from flask import Flask, Response, request
+
+REPLY = ("Stokvel contributions are pooled every month and paid out in turn, so every member "
+         "should keep their contributions up to date and check the group rules before a payout.").split()
+
+def create_fake_llm(tokens_per_second=50.0, first_token_delay=0.3):
+    """OpenAI-compatible /v1/chat/completions app that replies with canned text at a set pace.
+
+    The size of the last prompt received is kept in app.config['LAST_PROMPT_CHARS']
+    so benchmarks can check how much context the caller sent.
+    """
+    fake = Flask('fake_llm')
+    fake.config['LAST_PROMPT_CHARS'] = 0
+
+    @fake.route('/v1/chat/completions', methods=['POST'])
+    def completions():
+        body = request.get_json()
+        prompt_chars = sum(len(message.get('content') or '') for message in body.get('messages', []))
+        fake.config['LAST_PROMPT_CHARS'] = prompt_chars
+        words = REPLY[:body.get('max_tokens') or len(REPLY)]
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        usage = {'prompt_tokens': prompt_chars // 4, 'completion_tokens': len(words),
+                 'total_tokens': prompt_chars // 4 + len(words)}
+
+        if not body.get('stream'):
+            time.sleep(first_token_delay + (len(words) - 1) / tokens_per_second)
+            return {
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model'), 'usage': usage,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': ' '.join(words)}}]
+            }
+
+        def chunk(delta, finish_reason=None):
+            return 'data: ' + json.dumps({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': body.get('model'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }) + '\n\n'
+
+        def generate():
+            time.sleep(first_token_delay)
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(1 / tokens_per_second)
+                yield chunk({'content': word if i == 0 else f' {word}'})
+            yield chunk({}, 'stop')
+            yield 'data: [DONE]\n\n'
+
+        return Response(generate(), mimetype='text/event-stream')
+
+    return fake
@@ -0,0 +1,77 @@
+import hashlib
+import itertools
+import os
+import secrets
+import threading
+import time
+
+BASE36 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+def luhn_check_digit(digits):
+    """Luhn check digit for a string of digits"""
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if i % 2 == 0 else 1)
+        total += value - 9 if value > 9 else value
+    return str((10 - total % 10) % 10)
+
+def luhn_valid(number):
+    """True if the last digit of number is the Luhn check digit of the rest"""
+    return number.isdigit() and len(number) > 1 and luhn_check_digit(number[:-1]) == number[-1]
+
+class FeistelPermutation:
+    """Keyed bijection on range(side * side).
+
+    A balanced Feistel network over (value // side, value % side), so every
+    input maps to a distinct output in the same range without a lookup
+    table or cycle walking. Consecutive inputs come out scattered, which
+    keeps sequence-backed numbers from being guessable.
+    """
+    def __init__(self, side, key, rounds=4):
+        self.side = side
+        self.size = side * side
+        self.keys = [hashlib.blake2b(f'{key}:{i}'.encode(), digest_size=16).digest() for i in range(rounds)]
+
+    def _round(self, value, key):
+        digest = hashlib.blake2b(value.to_bytes(8, 'big'), key=key, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.side
+
+    def __call__(self, value):
+        if not 0 <= value < self.size:
+            raise ValueError(f"{value} is outside the permutation's range")
+        left, right = divmod(value, self.side)
+        for key in self.keys:
+            left, right = right, (left + self._round(right, key)) % self.side
+        return left * self.side + right
+
+def to_base36(value, width):
+    """value in upper-case base 36, zero padded to width"""
+    chars = []
+    for _ in range(width):
+        value, remainder = divmod(value, 36)
+        chars.append(BASE36[remainder])
+    if value:
+        raise ValueError('value does not fit in width')
+    return ''.join(reversed(chars))
+
+class ReferenceGenerator:
+    """Time-ordered references, unique without any coordination.
+
+    A reference is prefix + 13-digit millisecond timestamp + an 8-hex-digit
+    node id picked at random per process + a 6-digit per-process counter.
+    The node id is re-rolled after a fork so worker processes never share
+    one. References from one process sort in creation order.
+    """
+    def __init__(self, prefix='TXN'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def __call__(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._node = secrets.token_hex(4).upper()
+                self._counter = itertools.count()
+            node, sequence = self._node, next(self._counter) % 1_000_000
+        return f"{self.prefix}{time.time_ns() // 1_000_000:013d}{node}{sequence:06d}"
@@ -0,0 +1,47 @@
+"""empty message
+
+Revision ID: a4d8f2c61e95
+Revises: 7c1e5a9d3b48
+Create Date: 2026-10-19 04:02:17.934105
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8f2c61e95'
+down_revision = '7c1e5a9d3b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Generated tsvector columns for admin search; other databases search with ILIKE.
+    # Keep in step with SEARCH_VECTORS in app.py, which creates them for create_all
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("""
+        ALTER TABLE faq ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(answer, '')), 'B')
+        ) STORED
+    """)
+    op.execute("CREATE INDEX ix_faq_search_vector ON faq USING gin (search_vector)")
+    # Split emails on @ and . so their parts can be searched as words
+    op.execute("""
+        ALTER TABLE customer_concern ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(name, '')), 'B') ||
+            setweight(to_tsvector('simple', translate(coalesce(email, ''), '@.', '  ')), 'B')
+        ) STORED
+    """)
+    op.execute("CREATE INDEX ix_customer_concern_search_vector ON customer_concern USING gin (search_vector)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_customer_concern_search_vector', table_name='customer_concern')
+    op.execute("ALTER TABLE customer_concern DROP COLUMN search_vector")
+    op.drop_index('ix_faq_search_vector', table_name='faq')
+    op.execute("ALTER TABLE faq DROP COLUMN search_vector")
@@ -0,0 +1,49 @@
+"""empty message
+
+Revision ID: c6f2b8d4a913
+Revises: 9a5c7d3e1f48
+Create Date: 2026-10-18 21:41:19.057734
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f2b8d4a913'
+down_revision = '9a5c7d3e1f48'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) matched to the filters and orderings of the hot queries
+INDEXES = [
+    ('ix_wallet_user_id', 'wallet', ['user_id']),
+    ('ix_notification_user_created_at', 'notification', ['user_id', 'created_at']),
+    ('ix_notification_user_is_read', 'notification', ['user_id', 'is_read']),
+    ('ix_otp_user_created_at', 'otp', ['user_id', 'created_at']),
+    ('ix_user_session_user_login_time', 'user_session', ['user_id', 'login_time']),
+    ('ix_conversations_user_id', 'conversations', ['user_id']),
+    ('ix_messages_conversation_created_at', 'messages', ['conversation_id', 'created_at']),
+    ('ix_card_user_id', 'card', ['user_id']),
+    ('ix_beneficiary_user_id', 'beneficiary', ['user_id']),
+    ('ix_stokvel_member_user_group', 'stokvel_member', ['user_id', 'group_id']),
+    ('ix_stokvel_member_group_status', 'stokvel_member', ['group_id', 'status']),
+    ('ix_contribution_member_date', 'contribution', ['member_id', 'date']),
+    ('ix_group_join_request_user_status', 'group_join_request', ['user_id', 'status']),
+    ('ix_group_join_request_group_status', 'group_join_request', ['group_id', 'status']),
+    ('ix_stokvel_group_category_tier', 'stokvel_group', ['category', 'tier']),
+    ('ix_referral_referee_id', 'referral', ['referee_id']),
+]
+
+
+def upgrade():
+    # Build the indexes without blocking writes on Postgres
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)